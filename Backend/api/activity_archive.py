@@ -0,0 +1,212 @@
+"""
+Cold storage for CaseActivityLog.
+
+Rows older than the hot window are moved into month segment files under
+ACTIVITY_LOG_ARCHIVE_DIR (`YYYY-MM/<run>.seg`). Every (case, month) group is
+written as its own gzip member holding NDJSON, and CaseActivityArchiveIndex
+records the member's byte offset and length. A reader can then seek straight
+to one case's rows without inflating the rest of the segment.
+
+`archive_old_activity` moves whole months past the hot window;
+`archive_rows` moves any bounded set of rows, which is how the
+case_activity_log retention policy archives.
+
+Each group is written and fsync'd first. Its index row is then inserted and
+the hot rows deleted in one transaction. A crash in between only leaves
+unreferenced bytes in a segment, and re-running the archiver picks up
+whatever is still in the hot table.
+"""
+import gzip
+import json
+import os
+from datetime import date, datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import CaseActivityArchiveIndex, CaseActivityLog
+from .serializers import CaseActivityLogSerializer
+from .utils import get_system_setting
+
+DEFAULT_HOT_MONTHS = 6
+DELETE_BATCH_SIZE = 1000
+
+
+def archive_root():
+    return Path(getattr(settings, 'ACTIVITY_LOG_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive' / 'case_activity_log'))
+
+
+def hot_months():
+    value = get_system_setting('archive.case_activity_log.months', DEFAULT_HOT_MONTHS)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        # Admin-entered settings are STRING-typed; fall back rather than archive on a typo.
+        return DEFAULT_HOT_MONTHS
+
+
+def _shift_month(month, delta):
+    index = month.year * 12 + month.month - 1 + delta
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_cutoff(months=None):
+    """First day of the oldest month that stays in the hot table."""
+    months = hot_months() if months is None else months
+    today = timezone.localdate()
+    return _shift_month(date(today.year, today.month, 1), -months)
+
+
+def _serialize(row):
+    return {
+        'log_id': row.log_id,
+        'action_type': row.action_type,
+        'previous_value': row.previous_value,
+        'new_value': row.new_value,
+        'timestamp': row.timestamp,
+        'case': str(row.case_id),
+        'actor_user': str(row.actor_user_id),
+    }
+
+
+def _write_member(handle, rows):
+    """Append one gzip member with the given rows and return (offset, length)."""
+    payload = ''.join(json.dumps(_serialize(row), cls=DjangoJSONEncoder) + '\n' for row in rows)
+    data = gzip.compress(payload.encode('utf-8'))
+    offset = handle.tell()
+    handle.write(data)
+    handle.flush()
+    os.fsync(handle.fileno())
+    return offset, len(data)
+
+
+def _commit_group(segment_path, handle, month, rows):
+    offset, length = _write_member(handle, rows)
+    log_ids = [row.log_id for row in rows]
+    with transaction.atomic():
+        CaseActivityArchiveIndex.objects.create(
+            case_id=rows[0].case_id,
+            month=month,
+            segment_path=segment_path,
+            byte_offset=offset,
+            byte_length=length,
+            row_count=len(rows),
+            min_log_id=log_ids[0],
+            max_log_id=log_ids[-1],
+        )
+        for start in range(0, len(log_ids), DELETE_BATCH_SIZE):
+            CaseActivityLog.objects.filter(log_id__in=log_ids[start:start + DELETE_BATCH_SIZE]).delete()
+
+
+def _archive_sorted(month, rows, log=None):
+    """Write rows of one month, ordered by (case, log_id), to a new segment. Returns rows archived."""
+    segment_path = f"{month:%Y-%m}/{timezone.now():%Y%m%d%H%M%S}.seg"
+    target = archive_root() / segment_path
+    archived = 0
+    group = []
+    handle = None
+    try:
+        for row in rows:
+            if group and row.case_id != group[0].case_id:
+                _commit_group(segment_path, handle, month, group)
+                archived += len(group)
+                group = []
+            if handle is None:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                handle = target.open('ab')
+            group.append(row)
+        if group:
+            _commit_group(segment_path, handle, month, group)
+            archived += len(group)
+    finally:
+        if handle is not None:
+            handle.close()
+
+    if log and archived:
+        log(f'{month:%Y-%m}: archived {archived} rows to {segment_path}')
+    return archived
+
+
+def archive_month(month, log=None):
+    """Move every row of one calendar month out of the hot table. Returns rows archived."""
+    next_month = _shift_month(month, 1)
+    start = timezone.make_aware(datetime(month.year, month.month, 1))
+    end = timezone.make_aware(datetime(next_month.year, next_month.month, 1))
+    rows = (
+        CaseActivityLog.objects
+        .filter(timestamp__gte=start, timestamp__lt=end)
+        .order_by('case_id', 'log_id')
+        .iterator(chunk_size=2000)
+    )
+    return _archive_sorted(month, rows, log=log)
+
+
+def archive_rows(queryset, log=None):
+    """
+    Move an arbitrary (bounded) set of rows, e.g. one retention batch, into the
+    month segments, so activity_history keeps finding them. Returns rows archived.
+    """
+    months = {}
+    for row in queryset.order_by('case_id', 'log_id'):
+        timestamp = timezone.localtime(row.timestamp)
+        months.setdefault(date(timestamp.year, timestamp.month, 1), []).append(row)
+    return sum(_archive_sorted(month, rows, log=log) for month, rows in sorted(months.items()))
+
+
+def archive_old_activity(months=None, log=None):
+    """Archive every full month older than the hot window. Returns total rows archived."""
+    cutoff = archive_cutoff(months)
+    cutoff_at = timezone.make_aware(datetime(cutoff.year, cutoff.month, 1))
+    oldest = CaseActivityLog.objects.filter(timestamp__lt=cutoff_at).aggregate(oldest=Min('timestamp'))['oldest']
+    if oldest is None:
+        return 0
+
+    oldest = timezone.localtime(oldest)
+    month = date(oldest.year, oldest.month, 1)
+    total = 0
+    while month < cutoff:
+        total += archive_month(month, log=log)
+        month = _shift_month(month, 1)
+    return total
+
+
+def read_archived(entry):
+    """Decode the rows stored for one index entry, newest first."""
+    with (archive_root() / entry.segment_path).open('rb') as handle:
+        handle.seek(entry.byte_offset)
+        data = handle.read(entry.byte_length)
+    rows = [json.loads(line) for line in gzip.decompress(data).decode('utf-8').splitlines() if line]
+    for row in rows:
+        row['archived'] = True
+    rows.reverse()
+    return rows
+
+
+def activity_history(case, before=None, limit=50):
+    """
+    Page through a case's activity newest-first, continuing into the archive
+    once the hot table runs out. `before` is an exclusive log_id bound.
+    """
+    hot = CaseActivityLog.objects.filter(case=case).order_by('-log_id')
+    if before is not None:
+        hot = hot.filter(log_id__lt=before)
+    results = list(CaseActivityLogSerializer(hot[:limit], many=True).data)
+    if len(results) >= limit:
+        return results
+
+    bound = results[-1]['log_id'] if results else before
+    entries = CaseActivityArchiveIndex.objects.filter(case=case).order_by('-max_log_id')
+    if bound is not None:
+        entries = entries.filter(min_log_id__lt=bound)
+    for entry in entries.iterator():
+        for row in read_archived(entry):
+            if bound is not None and row['log_id'] >= bound:
+                continue
+            results.append(row)
+            if len(results) >= limit:
+                return results
+    return results
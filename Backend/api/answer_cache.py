@@ -0,0 +1,249 @@
+"""
+Answer cache for general legal questions asked of the assistant.
+
+Many citizens ask the same few questions (divorce procedure, bail, land
+mutation). The gateway (api/assistant.py) consults this cache before calling
+the LLM, but only for the opening question of a conversation from a user
+with no indexed evidence in scope. Those answers depend on nothing but the
+question, the system prompt and the language, so one user's answer can be
+served to another.
+
+- Entries are AIAnswerCacheEntry rows. The key is the SHA-256 of the
+  normalized question (Unicode NFKC, case-folded, punctuation dropped,
+  whitespace collapsed), the prompt template version and the language.
+  An exact hit is a single unique-index lookup.
+- Near duplicates come from a second VectorIndex under
+  ANSWER_CACHE_INDEX_DIR that holds one row per entry, with the entry id as
+  the row id. The nearest AI_ANSWER_CACHE_CANDIDATES rows at or above
+  AI_ANSWER_CACHE_SIMILARITY are checked against the database for the same
+  version and language. The threshold only means something for a given
+  embedder: the default feature-hashing embedder matches rephrasings that
+  share nearly all their words, while a real embedding model can use a lower
+  value.
+- Entries expire AI_ANSWER_CACHE_TTL seconds after they were written. Past
+  AI_ANSWER_CACHE_MAX_ENTRIES the least recently hit tenth is dropped, the
+  way Django's own caches cull. Saving or deleting a prompt template drops
+  the entries of versions that are no longer active, and of the saved
+  version itself, since its text may have changed (see api/signals.py).
+- Hits and misses are counted in the Django cache. `cache_stats` reports
+  the hit rate next to the most-served questions.
+"""
+import hashlib
+import re
+import unicodedata
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AIAnswerCacheEntry
+from .embedding_queue import get_embedding_service
+from .vector_index import VectorIndex
+
+EXACT = 'exact'
+SEMANTIC = 'semantic'
+MISS = 'miss'
+OUTCOMES = (EXACT, SEMANTIC, MISS)
+CULL_FRACTION = 10
+
+_WORD_RE = re.compile(r'\w+')
+_BENGALI_RE = re.compile(r'[ঀ-৿]')
+_LATIN_RE = re.compile(r'[A-Za-z]')
+
+_index = None
+
+
+def enabled():
+    return getattr(settings, 'AI_ANSWER_CACHE_ENABLED', True)
+
+
+def _ttl():
+    return getattr(settings, 'AI_ANSWER_CACHE_TTL', 7 * 24 * 3600)
+
+
+def _max_entries():
+    return getattr(settings, 'AI_ANSWER_CACHE_MAX_ENTRIES', 5000)
+
+
+def _similarity():
+    return getattr(settings, 'AI_ANSWER_CACHE_SIMILARITY', 0.9)
+
+
+def _candidates():
+    return getattr(settings, 'AI_ANSWER_CACHE_CANDIDATES', 5)
+
+
+def get_answer_index():
+    global _index
+    if _index is None:
+        default = Path(getattr(settings, 'VECTOR_INDEX_DIR', Path(settings.BASE_DIR) / 'vector_index')) / 'answer_cache'
+        _index = VectorIndex(getattr(settings, 'ANSWER_CACHE_INDEX_DIR', default))
+    return _index
+
+
+def normalize_question(text):
+    return ' '.join(_WORD_RE.findall(unicodedata.normalize('NFKC', text).casefold()))
+
+
+def detect_language(text):
+    """'bn' when the question is mostly Bengali script, else 'en' (Banglish counts as 'en')."""
+    return 'bn' if len(_BENGALI_RE.findall(text)) > len(_LATIN_RE.findall(text)) else 'en'
+
+
+def cache_key(question, template_version, language):
+    return hashlib.sha256(f'{template_version}:{language}:{question}'.encode('utf-8')).hexdigest()
+
+
+def _cutoff():
+    return timezone.now() - timedelta(seconds=_ttl())
+
+
+def _live(queryset):
+    return queryset.filter(created_at__gte=_cutoff())
+
+
+def _count(outcome):
+    key = f'answer_cache:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def _touch(entry):
+    AIAnswerCacheEntry.objects.filter(pk=entry.pk).update(hit_count=F('hit_count') + 1, last_hit_at=timezone.now())
+
+
+def _embed(question):
+    """The question's vector, or None when the answer index was built by another embedder."""
+    embedder = get_embedding_service()
+    index = get_answer_index()
+    if index.exists() and index.meta['embedder'] != embedder.name:
+        return None
+    return embedder.embed([question])[0]
+
+
+def lookup(text, template_version):
+    """
+    A cached (entry, outcome) for the question, or (None, MISS). Exact
+    matches win; otherwise the closest near-duplicate above the threshold.
+    """
+    question = normalize_question(text)
+    language = detect_language(text)
+    entries = _live(AIAnswerCacheEntry.objects.filter(template_version=template_version, language=language))
+
+    entry = entries.filter(cache_key=cache_key(question, template_version, language)).first()
+    if entry is not None:
+        _touch(entry)
+        _count(EXACT)
+        return entry, EXACT
+
+    vector = _embed(question)
+    if vector is not None:
+        threshold = _similarity()
+        matches = [
+            (entry_id, score) for entry_id, score in get_answer_index().search(vector, k=_candidates())
+            if score >= threshold
+        ]
+        found = entries.in_bulk([entry_id for entry_id, _ in matches])
+        for entry_id, _ in matches:
+            if entry_id in found:
+                _touch(found[entry_id])
+                _count(SEMANTIC)
+                return found[entry_id], SEMANTIC
+
+    _count(MISS)
+    return None, MISS
+
+
+def store(text, template_version, answer, model_version, prompt_tokens, completion_tokens):
+    """Remember a complete answer; culls the least recently used entries when full."""
+    question = normalize_question(text)
+    language = detect_language(text)
+    key = cache_key(question, template_version, language)
+    entry, created = AIAnswerCacheEntry.objects.update_or_create(
+        cache_key=key,
+        defaults={
+            'question': question, 'language': language, 'template_version': template_version,
+            'answer': answer, 'model_version': model_version,
+            'prompt_tokens': prompt_tokens or 0, 'completion_tokens': completion_tokens or 0,
+            'created_at': timezone.now(),
+        },
+    )
+    if created:
+        embedder = get_embedding_service()
+        index = get_answer_index()
+        if not index.exists() or index.meta['embedder'] != embedder.name:
+            # The cache is disposable: start over rather than mix two embedders' vectors.
+            index.reset(embedder.dim, embedder.name)
+        index.append(np.array([entry.pk], dtype=np.int64), embedder.embed([question]))
+        if AIAnswerCacheEntry.objects.count() > _max_entries():
+            cull()
+    return entry
+
+
+def cull():
+    """Drop expired entries, then the least recently hit tenth if still over capacity."""
+    removed, _ = AIAnswerCacheEntry.objects.filter(created_at__lt=_cutoff()).delete()
+    excess = AIAnswerCacheEntry.objects.count() - _max_entries()
+    if excess > 0:
+        victims = AIAnswerCacheEntry.objects.order_by('last_hit_at').values_list('pk', flat=True)[
+            :max(excess, _max_entries() // CULL_FRACTION)
+        ]
+        removed += AIAnswerCacheEntry.objects.filter(pk__in=list(victims)).delete()[0]
+    compact_index()
+    return removed
+
+
+def compact_index(force=False):
+    """Rewrite the answer index without the rows of removed entries once enough are dead."""
+    index = get_answer_index()
+    if not index.exists() or not len(index):
+        return 0
+    live = np.fromiter(AIAnswerCacheEntry.objects.values_list('pk', flat=True).iterator(), dtype=np.int64)
+    dead = len(index) - len(live)
+    if force or dead > len(index) * getattr(settings, 'VECTOR_INDEX_COMPACT_RATIO', 0.2):
+        return index.compact(live_ids=live)[1]
+    return 0
+
+
+def invalidate_versions(active_versions, changed_version=None):
+    """Drop entries built from inactive template versions, and from `changed_version` (edited)."""
+    stale = AIAnswerCacheEntry.objects.exclude(template_version__in=active_versions)
+    if changed_version is not None:
+        stale = stale | AIAnswerCacheEntry.objects.filter(template_version=changed_version)
+    removed, _ = stale.delete()
+    if removed:
+        compact_index()
+    return removed
+
+
+def clear():
+    AIAnswerCacheEntry.objects.all().delete()
+    index = get_answer_index()
+    if index.exists():
+        index.reset(index.meta['dim'], index.meta['embedder'])
+    cache.delete_many([f'answer_cache:{outcome}' for outcome in OUTCOMES])
+
+
+def cache_stats(top=10):
+    counts = cache.get_many([f'answer_cache:{outcome}' for outcome in OUTCOMES])
+    hits = {outcome: counts.get(f'answer_cache:{outcome}', 0) for outcome in OUTCOMES}
+    lookups = sum(hits.values())
+    return {
+        'lookups': lookups,
+        'exact_hits': hits[EXACT],
+        'semantic_hits': hits[SEMANTIC],
+        'misses': hits[MISS],
+        'hit_rate': round((hits[EXACT] + hits[SEMANTIC]) / lookups, 4) if lookups else None,
+        'entries': AIAnswerCacheEntry.objects.count(),
+        'top_questions': list(
+            AIAnswerCacheEntry.objects.filter(hit_count__gt=0).order_by('-hit_count')
+            .values('question', 'language', 'template_version', 'hit_count', 'completion_tokens')[:top]
+        ),
+    }
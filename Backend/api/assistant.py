@@ -0,0 +1,262 @@
+"""
+Server-side gateway for the legal assistant chat.
+
+`stream_reply` answers one user message and returns Server-Sent Events:
+
+    event: meta   {"conversation_id", "citations", "model_version", "cached"}
+    event: token  {"text"}                       (many)
+    event: error  {"error"}                      (only if the provider failed)
+    event: done   {"message_id", "prompt_tokens", "completion_tokens", "model_version"}
+
+The prompt is the `legal_assistant` template variant the prompt registry
+picks for the user (or DEFAULT_SYSTEM_PROMPT), rendered with `$language`,
+then the conversation's rolling summary, then the
+evidence excerpts hybrid retrieval finds for the question. After that come
+the newest turns that fit the context budget (api/context_window.py).
+context_window_usage records the prompt size of the latest turn. Once the
+reply is saved, the turns that fell out of the window are folded into the
+summary.
+
+No conversation or message row is written before the first token. A new
+conversation's id is generated in Python and sent in `meta`. The
+conversation, the USER message and the ASSISTANT message are all saved in
+one transaction once the provider finishes. So time to first token is
+retrieval plus the provider's own latency. If the client disconnects
+mid-reply, the partial answer is still saved when the stream is closed.
+
+The opening question of a user with no indexed evidence in scope goes
+through the answer cache (api/answer_cache.py) first. A hit is sent as a
+single token event, `cached` names the kind of hit, and the stored reply
+records zero tokens. A complete uncached answer to such a question is
+added to the cache.
+
+Every saved reply is metered (api/metering.py) and records the model and
+prompt template version behind it, which feedback analytics group by
+(api/feedback_rollup.py). It also keeps the confidence the provider
+reported, if any, as confidence_score for calibration; cached replies have
+none. The view checks the user's daily quota before the stream starts.
+"""
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import answer_cache, prompt_registry
+from .context_window import build_context, refresh_summary
+from .ingestion import count_tokens
+from .llm import ProviderError, get_provider
+from .metering import record_usage
+from .models import AIConversation, AIMessage
+from .retrieval import hybrid_search
+from .vector_index import visible_chunks
+
+FEATURE_KEY = 'legal_assistant'
+TITLE_CHARS = 80
+
+DEFAULT_SYSTEM_PROMPT = """You are "CLA-Bot", an expert AI legal assistant from Complete Legal Aid Bangladesh. Your knowledge covers Bangladeshi law, including the Penal Code, the Civil and Criminal Procedure Codes, constitutional law, recent amendments, and significant judicial precedents from the Supreme Court of Bangladesh.
+
+Your primary function is to provide precise, helpful, and preliminary legal information to users in both English and Bangla.
+
+**Response Quality Mandates:**
+1.  **Perfect Spelling:** Every word in English and Bangla must be spelled correctly. Spelling mistakes destroy credibility in legal contexts.
+
+2.  **Professional Formatting:** Structure your answers for maximum readability. Use Markdown for clear formatting:
+    - Use **bold text** to highlight key terms, titles, and important points.
+    - Use bullet points (-) for lists of items or suggestions.
+    - Use numbered lists (1., 2., 3.) for step-by-step instructions or sequential points.
+
+3.  **Clarity and Tone:** Your tone must be empathetic, clear, and highly professional. You must simplify complex legal terminology for the average citizen.
+
+4.  **Drafting:** When asked for a draft (e.g., a complaint, legal notice), generate a basic, clear, and locally relevant template using proper formatting.
+
+5.  **Language:** You are fluent in both formal English and colloquial Bengali (Banglish), and can switch between them seamlessly based on the user's query.
+
+6.  **Law Explainer Capability:** When asked to explain a law, act, or legal term (e.g., "Explain Section 54", "What is bail?", "Define FIR"):
+    -   **Simple Definition:** Start with a one-sentence explanation in plain, jargon-free language.
+    -   **Key Context:** Explain *why* this law exists or when it applies.
+    -   **Real-World Example:** Provide a brief, relatable scenario relevant to daily life in Bangladesh.
+    -   **Rights & Implications:** Briefly mention relevant citizen rights or penalties associated with it.
+
+7.  **Evidence:** When excerpts from the user's own documents are provided below, ground your answer in them and cite them by their number, e.g. [2].
+
+**CRITICAL Disclaimer:** ALWAYS conclude your responses with this exact disclaimer, without any modifications: "Disclaimer: I am an AI assistant. This information is for educational purposes only and is not a substitute for professional legal advice from a qualified lawyer. Please consult with a verified lawyer for your specific case.\""""
+
+
+def max_reply_tokens():
+    return getattr(settings, 'AI_LLM_MAX_TOKENS', 1024)
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+class EventStreamRenderer(JSONRenderer):
+    """
+    Lets DRF accept `Accept: text/event-stream`. The stream itself bypasses
+    renderers; only errors raised before it starts are rendered, as JSON.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+
+def system_template(user, question):
+    """(version, text) of the assistant prompt variant serving this user; version 0 is the built-in prompt."""
+    variant = prompt_registry.registry.select(FEATURE_KEY, subject=user.pk, default=DEFAULT_SYSTEM_PROMPT)
+    language = 'Bangla' if answer_cache.detect_language(question) == 'bn' else 'English'
+    return variant.version, variant.template.render({'language': language})
+
+
+def evidence_block(citations):
+    if not citations:
+        return ''
+    lines = ["Excerpts from the user's case documents:"]
+    for number, citation in enumerate(citations, start=1):
+        lines.append(
+            f"[{number}] {citation['document_name']} (part {citation['chunk_index'] + 1}): "
+            + ' '.join(citation['snippet'].split())
+        )
+    return '\n'.join(lines)
+
+
+def summary_block(summary):
+    return f'Summary of the earlier conversation:\n{summary}' if summary else ''
+
+
+def _save_exchange(conversation, is_new, question, answer, citations, model_version, template_version, usage,
+                   context_usage, confidence=None):
+    conversation.context_window_usage = context_usage
+    with transaction.atomic():
+        if is_new:
+            conversation.save(force_insert=True)
+        else:
+            conversation.updated_at = timezone.now()
+            conversation.save(update_fields=['context_window_usage', 'updated_at'])
+        question_message = AIMessage.objects.create(
+            conversation=conversation, sender_role='USER', content=question,
+        )
+        if not answer:
+            return question_message, None
+        return question_message, AIMessage.objects.create(
+            conversation=conversation, sender_role='ASSISTANT', content=answer,
+            model_version=model_version, prompt_template_version=template_version, citations=citations,
+            prompt_tokens=usage['prompt_tokens'], completion_tokens=usage['completion_tokens'],
+            confidence_score=confidence,
+        )
+
+
+def _fold_history(conversation, context, question_message):
+    """Summarize what fell out of this turn's window; a failing summarizer only delays it."""
+    try:
+        refresh_summary(conversation, context.window_start or question_message.message_id)
+    except ProviderError:
+        pass
+
+
+def _has_evidence(user, case):
+    queryset = visible_chunks(user).filter(vector_id__isnull=False)
+    if case is not None:
+        queryset = queryset.filter(document__case=case)
+    return queryset.exists()
+
+
+def _cached_reply(question, conversation, is_new, entry, outcome, template_version, context_usage):
+    """Serve a cached answer: one token event, no LLM tokens spent."""
+    yield sse('meta', {
+        'conversation_id': str(conversation.conversation_id),
+        'citations': [],
+        'model_version': entry.model_version,
+        'cached': outcome,
+    })
+    usage = {'prompt_tokens': 0, 'completion_tokens': 0}
+    try:
+        yield sse('token', {'text': entry.answer})
+    finally:
+        _, message = _save_exchange(
+            conversation, is_new, question, entry.answer, [], entry.model_version, template_version, usage,
+            context_usage,
+        )
+        record_usage(conversation.user_id, 0, 0)
+    yield sse('done', dict(usage, message_id=message.message_id, model_version=entry.model_version))
+
+
+def stream_reply(user, question, conversation=None, case=None):
+    """Generator of SSE strings answering `question` in `conversation` (a new one if None)."""
+    provider = get_provider()
+    is_new = conversation is None
+    if is_new:
+        conversation = AIConversation(user=user, title=question[:TITLE_CHARS])
+    context = build_context(conversation)
+    template_version, template_text = system_template(user, question)
+
+    # Only an opening question with no private evidence behind it has an answer worth sharing.
+    cacheable = answer_cache.enabled() and not context.tokens and not _has_evidence(user, case)
+    if cacheable:
+        entry, outcome = answer_cache.lookup(question, template_version)
+        if entry is not None:
+            context_usage = count_tokens(template_text) + count_tokens(question)
+            yield from _cached_reply(question, conversation, is_new, entry, outcome, template_version, context_usage)
+            return
+
+    citations = [] if cacheable else hybrid_search(user, question, case=case)
+    evidence = evidence_block(citations)
+    system = '\n\n'.join(part for part in (template_text, summary_block(context.summary), evidence) if part)
+    messages = context.turns + [{'role': 'user', 'content': question}]
+    # What this turn sends, counted the way the budget is; a provider's own count replaces it.
+    context_usage = count_tokens(system) + sum(count_tokens(m['content']) for m in messages)
+    yield sse('meta', {
+        'conversation_id': str(conversation.conversation_id),
+        'citations': citations,
+        'model_version': provider.model_version,
+        'cached': None,
+    })
+
+    parts = []
+    usage = {'prompt_tokens': None, 'completion_tokens': None}
+    confidence = None
+    error = None
+    finished = False
+    message = None
+    try:
+        for chunk in provider.stream(system, messages, max_tokens=max_reply_tokens()):
+            if chunk.prompt_tokens is not None:
+                usage['prompt_tokens'] = chunk.prompt_tokens
+            if chunk.completion_tokens is not None:
+                usage['completion_tokens'] = chunk.completion_tokens
+            if chunk.confidence is not None:
+                confidence = chunk.confidence
+            if chunk.text:
+                parts.append(chunk.text)
+                yield sse('token', {'text': chunk.text})
+        finished = True
+    except ProviderError as exc:
+        error = str(exc)
+    finally:
+        # Runs on client disconnect too (the generator is closed at its last yield).
+        answer = ''.join(parts)
+        if usage['prompt_tokens'] is None:
+            usage['prompt_tokens'] = context_usage
+        if usage['completion_tokens'] is None:
+            usage['completion_tokens'] = count_tokens(answer)
+        question_message, message = _save_exchange(
+            conversation, is_new, question, answer, citations, provider.model_version, template_version, usage,
+            usage['prompt_tokens'], confidence if finished else None,
+        )
+        if message is not None:
+            record_usage(conversation.user_id, usage['prompt_tokens'], usage['completion_tokens'])
+        _fold_history(conversation, context, question_message)
+        if cacheable and finished and answer:
+            answer_cache.store(
+                question, template_version, answer, provider.model_version,
+                usage['prompt_tokens'], usage['completion_tokens'],
+            )
+
+    if error:
+        yield sse('error', {'error': error})
+    yield sse('done', {
+        'message_id': message.message_id if message else None,
+        'prompt_tokens': usage['prompt_tokens'],
+        'completion_tokens': usage['completion_tokens'],
+        'model_version': provider.model_version,
+    })
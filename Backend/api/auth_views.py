@@ -7,6 +7,7 @@ from django.contrib.auth import authenticate
 from django.utils import timezone
 
 from .models import User, CitizenProfile, LawyerProfile, AdminProfile, LegalSpecialization, LawyerSpecializationMap
+from .derivatives import enqueue_derivatives
 from .serializers import UserSerializer
 from .utils import save_uploaded_file
 
@@ -117,6 +118,9 @@ def register(request):
                     print(f"Warning: Invalid specialization slug '{spec_slug}' - skipping")
                 except Exception as e:
                     print(f"Error linking specialization '{spec_slug}': {str(e)}")
+
+        # Thumbnails are rendered by the process_media_derivatives worker
+        enqueue_derivatives('PROFILE_PHOTO', profile_photo_path)
         
         # Generate tokens
         refresh = RefreshToken.for_user(user)
@@ -250,6 +254,9 @@ def update_profile(request):
         if 'preferred_language' in data:
             user.language_preference = data['preferred_language']
 
+        if data.get('notification_mode') in dict(User.NOTIFICATION_MODE_CHOICES):
+            user.notification_mode = data['notification_mode']
+
         if profile and hasattr(profile, 'admin_level') and 'admin_level' in data:
             profile.admin_level = data['admin_level']
         if profile and hasattr(profile, 'department') and 'department' in data:
@@ -259,6 +266,7 @@ def update_profile(request):
         
         if avatar_file and profile and hasattr(profile, 'profile_photo_url'):
             profile.profile_photo_url = save_uploaded_file(avatar_file, f'profiles/{user.role.lower()}')
+            profile.photo_derivatives = {}
         if verification_doc_file and profile and hasattr(profile, 'verification_document_url'):
             profile.verification_document_url = save_uploaded_file(verification_doc_file, f'documents/{user.role.lower()}')
         if identity_doc_file and profile and hasattr(profile, 'identity_document_url'):
@@ -316,6 +324,10 @@ def update_profile(request):
             pass
         
         user.save()
+
+        if avatar_file and profile and hasattr(profile, 'profile_photo_url'):
+            # Queued after the profile saves above so they cannot overwrite the worker's result
+            enqueue_derivatives('PROFILE_PHOTO', profile.profile_photo_url)
         
         # Return updated user data
         user_data = UserSerializer(user, context={'request': request}).data
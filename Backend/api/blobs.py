@@ -0,0 +1,112 @@
+"""
+Content-addressed storage for evidence files.
+
+Uploads are hashed with SHA-256 in a single streaming pass before anything is
+written to media storage. If a StoredBlob with that digest already exists,
+its reference count is bumped and the upload is never written. Otherwise the
+bytes are saved as `<subdir>/blobs/ab/cd/<sha256><ext>` (see storage). With
+encryption enabled they are first streamed through the chunked AES-GCM writer
+(see evidence_crypto) into a staging file. Either way, files already on local
+disk are renamed into place rather than copied.
+Documents point at the shared blob, and the file is unlinked only when the
+last reference is released.
+"""
+import hashlib
+from pathlib import Path, PurePosixPath
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .derivatives import derivative_names
+from .evidence_crypto import encrypt_to_path, encryption_enabled
+from .models import StoredBlob
+from .storage import StagedFile, delete_file, save_file, shard_name, staging_path
+
+
+def hash_upload(file_obj):
+    """Return the hex SHA-256 of an uploaded file, reading it chunk by chunk."""
+    digest = hashlib.sha256()
+    for chunk in file_obj.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_blob(file_obj, name, encrypt):
+    """Save the upload as name; returns (stored name, key id), the key id being '' when stored in the clear."""
+    if not encrypt:
+        return save_file(name, file_obj), ''
+
+    staged = staging_path()
+    try:
+        key_id = encrypt_to_path(file_obj.chunks(), staged)
+        content = StagedFile(staged, name=PurePosixPath(name).name)
+        try:
+            stored_name = save_file(name, content)
+        finally:
+            content.close()
+    finally:
+        if staged.exists():
+            staged.unlink()
+    return stored_name, key_id
+
+
+def store_blob(file_obj, subdir='evidence', sha256=None, encrypt=None):
+    """
+    Store an upload content-addressed and take a reference on it.
+    Returns the StoredBlob; `sha256` may be passed when the caller already hashed the bytes.
+    `encrypt` defaults to EVIDENCE_ENCRYPTION_ENABLED.
+    """
+    if not file_obj:
+        raise ValueError('File object is required')
+
+    sha256 = sha256 or hash_upload(file_obj)
+    normalized_subdir = subdir.strip('/').replace('..', '') or 'uploads'
+
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is not None:
+            StoredBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+            blob.refresh_from_db()
+            return blob
+
+    name = shard_name(f'{normalized_subdir}/blobs', f'{sha256}{Path(file_obj.name).suffix.lower()}', sha256)
+    encrypt = encryption_enabled() if encrypt is None else encrypt
+    stored_name, key_id = _write_blob(file_obj, name, encrypt)
+
+    try:
+        with transaction.atomic():
+            return StoredBlob.objects.create(
+                sha256=sha256,
+                storage_path=stored_name,
+                size_bytes=file_obj.size,
+                encryption_key_id=key_id,
+                ref_count=1,
+            )
+    except IntegrityError:
+        # A concurrent upload of the same bytes registered the blob first.
+        if stored_name != name:
+            delete_file(stored_name)
+        StoredBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+        return StoredBlob.objects.get(sha256=sha256)
+
+
+def release_blob(sha256):
+    """Drop one reference; the row and file go away with the last one."""
+    if not sha256:
+        return
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            StoredBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') - 1)
+            return
+        storage_path = blob.storage_path
+        blob.delete()
+        transaction.on_commit(lambda: _delete_with_derivatives(storage_path))
+
+
+def _delete_with_derivatives(storage_path):
+    delete_file(storage_path)
+    for name in derivative_names(storage_path):
+        delete_file(name)
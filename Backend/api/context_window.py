@@ -0,0 +1,177 @@
+"""
+Conversation context for the legal assistant.
+
+Resending a whole conversation on every turn makes each turn cost more than
+the one before. Instead, `build_context` gives the gateway two things:
+
+- the rolling summary: one SYSTEM AIMessage per conversation
+  (AIConversation.summary_message) covering every message up to
+  AIConversation.summarized_through;
+- the newest USER/ASSISTANT messages after that point that fit in
+  AI_CONTEXT_TOKENS together with the summary.
+
+Messages are read newest first in pages of PAGE_SIZE, by keyset on the
+(conversation, message_id) index, and reading stops at the first message
+that does not fit. A turn therefore reads rows in proportion to the budget,
+however long the conversation is.
+
+After each reply, `refresh_summary` folds the messages that have fallen out
+of the window into the summary and advances summarized_through. Each refresh
+only reads the few messages that dropped out since the last turn, plus the
+summary itself, never the whole history. The summary is capped at
+AI_SUMMARY_TOKENS.
+
+Summarizers are pluggable (AI_SUMMARIZER names a class). The default
+ExtractiveSummarizer keeps the opening sentence of each message and needs no
+model. LLMSummarizer asks the configured provider to rewrite the summary.
+"""
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .ingestion import count_tokens
+from .llm import get_provider
+from .models import AIMessage
+
+PAGE_SIZE = 16
+SUMMARY_BATCH = 50
+SENTENCE_CHARS = 240
+TURN_ROLES = ('USER', 'ASSISTANT')
+ROLE_LABELS = {'USER': 'User', 'ASSISTANT': 'Assistant'}
+
+_SENTENCE_RE = re.compile(r'^(.+?[.!?।])(?:\s|$)', re.DOTALL)
+
+# summary: rolling summary text ('' if none); turns: [{"role", "content"}] oldest first;
+# tokens: tokens of summary plus turns; window_start: message_id of the oldest turn (None if no turns)
+Context = namedtuple('Context', ['summary', 'turns', 'tokens', 'window_start'])
+
+
+def context_tokens():
+    return getattr(settings, 'AI_CONTEXT_TOKENS', 3000)
+
+
+def summary_tokens():
+    return getattr(settings, 'AI_SUMMARY_TOKENS', 400)
+
+
+def first_sentence(text):
+    text = ' '.join(text.split())
+    match = _SENTENCE_RE.match(text[:SENTENCE_CHARS])
+    if match:
+        return match.group(1)
+    return text[:SENTENCE_CHARS] + ('…' if len(text) > SENTENCE_CHARS else '')
+
+
+class ExtractiveSummarizer:
+    """One line per message (its opening sentence); the oldest lines go first when over the cap."""
+
+    def summarize(self, summary, messages, max_tokens):
+        lines = summary.splitlines() if summary else []
+        lines += [f'{ROLE_LABELS[role]}: {first_sentence(content)}' for role, content in messages]
+        sizes = [count_tokens(line) + 1 for line in lines]
+        total = sum(sizes)
+        start = 0
+        while start < len(lines) - 1 and total > max_tokens:
+            total -= sizes[start]
+            start += 1
+        return '\n'.join(lines[start:])
+
+
+class LLMSummarizer:
+    """Asks the configured provider to fold the new messages into the running summary."""
+    instruction = (
+        'You maintain a running summary of a conversation between a citizen and a legal assistant. '
+        'Rewrite the summary so it also covers the new messages. Keep facts, names, dates, '
+        'sections of law and open questions; drop pleasantries. Answer with the summary only, '
+        'in at most {max_tokens} tokens.'
+    )
+
+    def summarize(self, summary, messages, max_tokens):
+        transcript = '\n'.join(f'{ROLE_LABELS[role]}: {content}' for role, content in messages)
+        prompt = f'Current summary:\n{summary or "(empty)"}\n\nNew messages:\n{transcript}'
+        chunks = get_provider().stream(
+            self.instruction.format(max_tokens=max_tokens),
+            [{'role': 'user', 'content': prompt}],
+            max_tokens=max_tokens,
+        )
+        return ''.join(chunk.text for chunk in chunks).strip()
+
+
+_summarizer = None
+
+
+def get_summarizer():
+    global _summarizer
+    if _summarizer is None:
+        _summarizer = import_string(getattr(settings, 'AI_SUMMARIZER', 'api.context_window.ExtractiveSummarizer'))()
+    return _summarizer
+
+
+def build_context(conversation, budget=None):
+    """The summary and the newest turns that fit in `budget` tokens (default AI_CONTEXT_TOKENS)."""
+    if conversation is None or conversation._state.adding:
+        return Context('', [], 0, None)
+    summary = ''
+    if conversation.summary_message_id:
+        summary = AIMessage.objects.filter(pk=conversation.summary_message_id).values_list('content', flat=True).first() or ''
+    summary_size = count_tokens(summary)
+    budget = (budget or context_tokens()) - summary_size
+
+    messages = AIMessage.objects.filter(
+        conversation=conversation, sender_role__in=TURN_ROLES,
+        message_id__gt=conversation.summarized_through or 0,
+    ).order_by('-message_id')
+    turns = []
+    used = 0
+    window_start = None
+    before = None
+    while True:
+        page = messages.filter(message_id__lt=before) if before else messages
+        rows = list(page.values_list('message_id', 'sender_role', 'content')[:PAGE_SIZE])
+        for message_id, role, content in rows:
+            tokens = count_tokens(content)
+            if used + tokens > budget:
+                rows = []
+                break
+            turns.append({'role': role.lower(), 'content': content})
+            used += tokens
+            window_start = message_id
+        if len(rows) < PAGE_SIZE:
+            break
+        before = rows[-1][0]
+    turns.reverse()
+    return Context(summary, turns, summary_size + used, window_start)
+
+
+def refresh_summary(conversation, before_id):
+    """
+    Fold the messages between the summary and `before_id` (the oldest message
+    still in the window) into the rolling summary. Returns how many were folded.
+    """
+    dropped = list(
+        AIMessage.objects.filter(
+            conversation=conversation, sender_role__in=TURN_ROLES,
+            message_id__gt=conversation.summarized_through or 0, message_id__lt=before_id,
+        ).order_by('message_id').values_list('message_id', 'sender_role', 'content')[:SUMMARY_BATCH]
+    )
+    if not dropped:
+        return 0
+    current = conversation.summary_message
+    text = get_summarizer().summarize(
+        current.content if current else '',
+        [(role, content) for _, role, content in dropped],
+        summary_tokens(),
+    )
+    with transaction.atomic():
+        if current is None:
+            current = AIMessage.objects.create(conversation=conversation, sender_role='SYSTEM', content=text)
+        else:
+            current.content = text
+            current.save(update_fields=['content'])
+        conversation.summary_message = current
+        conversation.summarized_through = dropped[-1][0]
+        conversation.save(update_fields=['summary_message', 'summarized_through'])
+    return len(dropped)
@@ -0,0 +1,278 @@
+"""
+Downscaled derivatives of profile photos and evidence.
+
+Uploads only enqueue a MediaDerivativeJob. The `process_media_derivatives`
+worker renders the variants and stores them next to the original as
+`<stem>.<size>.<ext>`. It then records their names on the owning rows
+(`photo_derivatives` on profiles, `derivatives` on evidence), so serializers
+pick sizes without touching storage.
+
+- Profile photos get 256px and 768px renditions in JPEG and WebP. List
+  payloads use the 256px thumbnail instead of the multi-megabyte original.
+- Evidence images and PDFs get a 768px first-page preview. PDFs are rendered
+  with pypdfium2 when it is installed. Previews of encrypted evidence are
+  encrypted too, and they are only served through the authenticated download
+  endpoint (`?variant=preview`).
+- Deduplicated evidence shares its blob's storage_path, so previews are
+  keyed on the blob: a document whose blob already has derivatives reuses
+  them, and one whose blob has a job pending waits for that job, which
+  records its output on every document pointing at the blob.
+
+A regenerated variant is written to a staging file and renamed over the old
+one, so readers never see it missing.
+
+JPEG sources are decoded with Pillow's draft mode, which lets libjpeg scale
+down while decoding. Each smaller size is derived from the previous one
+rather than from the full-resolution image.
+"""
+import io
+import os
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .evidence_crypto import encrypt_to_path, is_encrypted, open_blob
+from .models import CitizenProfile, EvidenceDocument, LawyerProfile, MediaDerivativeJob
+from .storage import StagedFile, get_storage, local_path, save_file, staging_path
+
+MAX_ATTEMPTS = 3
+
+# variant -> (longest edge in px, Pillow format)
+PHOTO_VARIANTS = {
+    'medium': (768, 'JPEG'),
+    'medium_webp': (768, 'WEBP'),
+    'thumbnail': (256, 'JPEG'),
+    'thumbnail_webp': (256, 'WEBP'),
+}
+PREVIEW_VARIANTS = {
+    'preview': (768, 'JPEG'),
+    'preview_webp': (768, 'WEBP'),
+}
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp'}
+FORMAT_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+FORMAT_OPTIONS = {
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+    'WEBP': {'quality': 80, 'method': 4},
+}
+
+
+def variants_for(source):
+    return PHOTO_VARIANTS if source == 'PROFILE_PHOTO' else PREVIEW_VARIANTS
+
+
+def derivative_name(source_path, variant, image_format):
+    """`<dir>/<stem>.<size><ext>`, e.g. photo.thumbnail.jpg and photo.thumbnail.webp."""
+    path = PurePosixPath(source_path)
+    size = variant.removesuffix('_webp')
+    return str(path.with_name(f'{path.stem}.{size}{FORMAT_EXTENSIONS[image_format]}'))
+
+
+def derivative_names(source_path):
+    """Every name a derivative of source_path could have, for cleanup."""
+    specs = {**PHOTO_VARIANTS, **PREVIEW_VARIANTS}
+    return [derivative_name(source_path, variant, image_format) for variant, (_, image_format) in specs.items()]
+
+
+def derivative_mime_type(name):
+    suffix = PurePosixPath(name).suffix.lower()
+    for image_format, extension in FORMAT_EXTENSIONS.items():
+        if suffix == extension:
+            return FORMAT_MIME_TYPES[image_format]
+    return 'application/octet-stream'
+
+
+def is_previewable(mime_type):
+    return bool(mime_type) and (mime_type.startswith('image/') or mime_type == 'application/pdf')
+
+
+def enqueue_derivatives(source, source_path):
+    """Queue derivative generation for a stored file; no-op without a path."""
+    if not source_path:
+        return None
+    return MediaDerivativeJob.objects.create(source=source, source_path=source_path)
+
+
+def enqueue_evidence_preview(document):
+    """Queue a preview for document unless its blob already has one, or has one pending."""
+    if not is_previewable(document.mime_type) or not document.storage_path:
+        return None
+    existing = (
+        EvidenceDocument.objects.filter(storage_path=document.storage_path).exclude(pk=document.pk)
+        .exclude(derivatives={}).values_list('derivatives', flat=True).first()
+    )
+    if existing:
+        EvidenceDocument.objects.filter(pk=document.pk).update(derivatives=existing)
+        document.derivatives = existing
+        return None
+    pending = MediaDerivativeJob.objects.filter(
+        source='EVIDENCE', source_path=document.storage_path, status='PENDING',
+    ).first()
+    return pending or enqueue_derivatives('EVIDENCE', document.storage_path)
+
+
+def _render_pdf_first_page(handle, max_edge):
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise RuntimeError('PDF previews need pypdfium2 (pip install pypdfium2)')
+    document = pdfium.PdfDocument(handle)
+    try:
+        page = document[0]
+        width, height = page.get_size()
+        bitmap = page.render(scale=max_edge / max(width, height, 1))
+        return bitmap.to_pil()
+    finally:
+        document.close()
+
+
+def _open_image(handle, max_edge):
+    if handle.read(5) == b'%PDF-':
+        handle.seek(0)
+        return _render_pdf_first_page(handle, max_edge)
+    handle.seek(0)
+    image = Image.open(handle)
+    # Let the JPEG decoder scale down by a power of two before we resize.
+    image.draft('RGB', (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    image.load()
+    return image
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **FORMAT_OPTIONS[image_format])
+    return buffer.getvalue()
+
+
+def render_variants(image, variants):
+    """Yield (variant, image_format, bytes), largest first, each size scaled from the one before."""
+    current = image
+    for variant, (max_edge, image_format) in sorted(variants.items(), key=lambda item: -item[1][0]):
+        if max(current.size) > max_edge:
+            current = current.copy()
+            current.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        yield variant, image_format, _encode(current, image_format)
+
+
+def _store(name, data, encrypt):
+    """
+    Write one variant over any previous version of it and return the stored name.
+    On local disk the bytes are staged and renamed into place. Other backends
+    get a plain save: object stores replace a key in one request, and a backend
+    that will not overwrite returns a fresh name for _record to point the rows at.
+    """
+    staged = staging_path()
+    try:
+        if encrypt:
+            encrypt_to_path([data], staged)
+        else:
+            staged.write_bytes(data)
+        storage = get_storage()
+        target = local_path(name, storage)
+        if target is not None:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            mode = getattr(storage, 'file_permissions_mode', None)
+            if mode is not None:
+                os.chmod(staged, mode)
+            os.replace(staged, target)
+            return name
+        content = StagedFile(staged, name=PurePosixPath(name).name)
+        try:
+            return save_file(name, content, storage)
+        finally:
+            content.close()
+    finally:
+        if staged.exists():
+            staged.unlink()
+
+
+def _record(source, source_path, outputs):
+    if source == 'PROFILE_PHOTO':
+        # Only rows still pointing at this photo; a newer upload has its own job.
+        CitizenProfile.objects.filter(profile_photo_url=source_path).update(photo_derivatives=outputs)
+        LawyerProfile.objects.filter(profile_photo_url=source_path).update(photo_derivatives=outputs)
+    else:
+        EvidenceDocument.objects.filter(storage_path=source_path).update(derivatives=outputs)
+
+
+def generate_derivatives(source, source_path):
+    """Render and store every variant for one file. Returns {variant: stored name}."""
+    storage = get_storage()
+    variants = variants_for(source)
+    largest = max(max_edge for max_edge, _ in variants.values())
+    raw = storage.open(source_path, 'rb')
+    encrypt = source == 'EVIDENCE' and is_encrypted(raw)
+    with open_blob(raw) as handle:
+        image = _open_image(handle, largest)
+
+    outputs = {}
+    for variant, image_format, data in render_variants(image, variants):
+        outputs[variant] = _store(derivative_name(source_path, variant, image_format), data, encrypt)
+    _record(source, source_path, outputs)
+    return outputs
+
+
+def claim_next_job():
+    """Lock and mark the oldest pending job so parallel workers never share one."""
+    with transaction.atomic():
+        job = (
+            MediaDerivativeJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='PENDING')
+            .order_by('job_id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'PROCESSING'
+        job.attempts += 1
+        job.save(update_fields=['status', 'attempts'])
+        return job
+
+
+def process_job(job):
+    """Run one claimed job; failures are retried up to MAX_ATTEMPTS. Returns the outputs or None."""
+    try:
+        outputs = generate_derivatives(job.source, job.source_path)
+    except Exception as exc:
+        job.status = 'FAILED' if job.attempts >= MAX_ATTEMPTS else 'PENDING'
+        job.error_message = str(exc)
+        job.save(update_fields=['status', 'error_message'])
+        return None
+    job.status = 'COMPLETED'
+    job.error_message = None
+    job.completed_at = timezone.now()
+    job.save(update_fields=['status', 'error_message', 'completed_at'])
+    return outputs
+
+
+def enqueue_backfill():
+    """Queue jobs for existing photos and evidence that have no derivatives yet. Returns jobs created."""
+    jobs = []
+    for model in (CitizenProfile, LawyerProfile):
+        paths = (
+            model.objects.filter(photo_derivatives={}).exclude(profile_photo_url__isnull=True)
+            .exclude(profile_photo_url='').values_list('profile_photo_url', flat=True).distinct()
+        )
+        jobs.extend(MediaDerivativeJob(source='PROFILE_PHOTO', source_path=path) for path in paths)
+    documents = (
+        EvidenceDocument.objects.filter(derivatives={}, deleted_at__isnull=True)
+        .values_list('storage_path', 'mime_type').distinct()
+    )
+    jobs.extend(
+        MediaDerivativeJob(source='EVIDENCE', source_path=path)
+        for path, mime_type in documents if is_previewable(mime_type)
+    )
+    MediaDerivativeJob.objects.bulk_create(jobs, batch_size=1000)
+    return len(jobs)
@@ -0,0 +1,153 @@
+"""
+HTTP delivery of files in media storage: conditional requests, byte ranges and proxy offload.
+
+`serve_stored_file` answers `If-None-Match` with 304, honours a single
+`Range` (guarded by `If-Range`) with 206, and streams everything else.
+Plaintext files on local disk can be handed to the front proxy when EVIDENCE_SENDFILE_MODE
+is set: 'x-accel-redirect' for nginx (internal location at
+EVIDENCE_SENDFILE_PREFIX), 'x-sendfile' for Apache/lighttpd. The proxy then
+does the byte pushing and range handling itself. Encrypted files, which is
+all evidence stored with EVIDENCE_ENCRYPTION_ENABLED on, can never be
+offloaded: they always stream through EncryptedFile, which decrypts only the
+chunks a range touches. Offload therefore applies to previews, thumbnails and
+evidence stored in plaintext.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .evidence_crypto import is_encrypted, open_blob
+from .storage import get_storage, local_path
+
+STREAM_BLOCK_SIZE = 64 * 1024
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [value.strip() for value in header.split(',')]
+    return etag in candidates or f'W/{etag}' in candidates
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single satisfiable byte range, None when the
+    header should be ignored, or False when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None  # multi-range or malformed: serve the whole file
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _iter_range(handle, start, length):
+    try:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = handle.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        handle.close()
+
+
+def _common_headers(response, etag, content_type, filename, as_attachment):
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private, no-transform'
+    if content_type:
+        response['Content-Type'] = content_type
+    if filename:
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
+
+
+def _sendfile_response(file_path, name):
+    mode = (getattr(settings, 'EVIDENCE_SENDFILE_MODE', '') or '').lower()
+    if mode == 'x-accel-redirect':
+        response = HttpResponse()
+        prefix = getattr(settings, 'EVIDENCE_SENDFILE_PREFIX', '/protected-media/').rstrip('/')
+        response['X-Accel-Redirect'] = quote(f"{prefix}/{name.lstrip('/')}")
+        return response
+    if mode == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = str(file_path)
+        return response
+    return None
+
+
+def serve_stored_file(request, name, *, content_type=None, filename=None, content_hash=None,
+                      as_attachment=False):
+    """Build the response for one file in media storage, honouring conditional and range headers."""
+    storage = get_storage()
+    if content_hash:
+        etag = f'"{content_hash}"'
+    else:
+        modified = storage.get_modified_time(name)
+        etag = f'"{storage.size(name):x}-{int(modified.timestamp()):x}"'
+
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    raw = storage.open(name, 'rb')
+    file_path = local_path(name, storage)
+    if file_path is not None and not is_encrypted(raw):
+        offloaded = _sendfile_response(file_path, name)
+        if offloaded is not None:
+            # The proxy handles Range and sends the bytes; no body passes through Python.
+            raw.close()
+            return _common_headers(offloaded, etag, content_type, filename, as_attachment)
+
+    handle = open_blob(raw)
+    handle.seek(0, os.SEEK_END)
+    size = handle.tell()
+    handle.seek(0)
+
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if byte_range is not None and if_range and if_range.strip() != etag:
+        byte_range = None  # representation changed: send it whole
+
+    if byte_range is False:
+        handle.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(handle, content_type=content_type)
+        return _common_headers(response, etag, content_type, filename, as_attachment)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(_iter_range(handle, start, length), status=206)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(length)
+    return _common_headers(response, etag, content_type, filename, as_attachment)
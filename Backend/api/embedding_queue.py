@@ -0,0 +1,178 @@
+"""
+In-process micro-batching in front of the embedder.
+
+Embedders are much faster per text on a batch than on single texts. Query
+embedding (retrieval, the answer cache) and chunk indexing therefore go
+through one EmbeddingService per process instead of calling the embedder
+directly.
+
+- `submit(texts)` queues a request and returns a concurrent.futures.Future
+  of its (len(texts), dim) float32 matrix. `embed` waits for it, and
+  `aembed` awaits it from a coroutine.
+- One worker thread drains the queue. A batch closes when it holds
+  AI_EMBED_BATCH_SIZE texts, or AI_EMBED_BATCH_WAIT_MS after its first
+  request arrived. A request bigger than the batch size runs as a batch of
+  its own, never split. The batch is embedded in one call and each future
+  gets its own rows. If the call fails, every future in the batch gets the
+  exception.
+- The worker starts on first use, and again in a forked child (the
+  ingest_documents worker pool), whose copy of the thread is gone.
+
+`stats()` reports histograms of batch sizes (texts per embedder call) and
+request latency (queueing plus embedding, in milliseconds) since the process
+started.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import Future
+
+import numpy as np
+from django.conf import settings
+
+from .vector_index import get_embedder
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+class Histogram:
+    """Counts per upper bound (the last bucket is open-ended), plus count, sum and max."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        labels = [f'<={bound}' for bound in self.bounds] + [f'>{self.bounds[-1]}']
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'max': round(self.max, 3),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class _Request:
+    __slots__ = ('texts', 'future', 'queued_at')
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+
+class EmbeddingService:
+    def __init__(self, embedder, batch_size=None, wait_ms=None):
+        self.embedder = embedder
+        self.name = embedder.name
+        self.dim = embedder.dim
+        self.batch_size = batch_size or getattr(settings, 'AI_EMBED_BATCH_SIZE', 64)
+        self.wait = (getattr(settings, 'AI_EMBED_BATCH_WAIT_MS', 2) if wait_ms is None else wait_ms) / 1000.0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._stats_lock = threading.Lock()
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.latencies = Histogram(LATENCY_BUCKETS_MS)
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                threading.Thread(target=self._run, args=(self._queue,), name='embedding-batcher', daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, texts):
+        """Queue texts for embedding; the future resolves to their float32 matrix."""
+        request = _Request(list(texts))
+        if not request.texts:
+            request.future.set_result(np.zeros((0, self.dim), dtype=np.float32))
+            return request.future
+        self._ensure_worker()
+        self._queue.put(request)
+        return request.future
+
+    def embed(self, texts):
+        return self.submit(texts).result()
+
+    async def aembed(self, texts):
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def _collect(self, pending, first):
+        """A batch starting with `first`; returns it and the request that would have overflowed it."""
+        batch = [first]
+        size = len(first.texts)
+        deadline = first.queued_at + self.wait
+        while size < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = pending.get(timeout=timeout) if timeout > 0 else pending.get_nowait()
+            except queue.Empty:
+                break
+            if size + len(request.texts) > self.batch_size:
+                return batch, request
+            batch.append(request)
+            size += len(request.texts)
+        return batch, None
+
+    def _run(self, pending):
+        carried = None
+        while True:
+            # A request that did not fit the last batch opens the next one.
+            batch, carried = self._collect(pending, carried or pending.get())
+            self._embed_batch(batch)
+
+    def _embed_batch(self, batch):
+        texts = [text for request in batch for text in request.texts]
+        try:
+            vectors = self.embedder.embed(texts)
+        except Exception as exc:
+            for request in batch:
+                request.future.set_exception(exc)
+            return
+        done = time.monotonic()
+        offset = 0
+        for request in batch:
+            request.future.set_result(vectors[offset:offset + len(request.texts)])
+            offset += len(request.texts)
+        with self._stats_lock:
+            self.batch_sizes.add(len(texts))
+            for request in batch:
+                self.latencies.add((done - request.queued_at) * 1000.0)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'embedder': self.name,
+                'batch_size_limit': self.batch_size,
+                'batch_wait_ms': self.wait * 1000.0,
+                'batch_sizes': self.batch_sizes.snapshot(),
+                'latency_ms': self.latencies.snapshot(),
+            }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService(get_embedder())
+        return _service
@@ -0,0 +1,297 @@
+"""
+Chunked AES-GCM encryption for evidence blobs at rest.
+
+File layout::
+
+    MAGIC (8) | chunk_size u32 | nonce_prefix (8) | key_id_len u16 | key_id | chunk_0 | chunk_1 | ...
+
+Each chunk is `chunk_size` plaintext bytes (the last may be shorter),
+encrypted separately with AES-256-GCM. That adds a 16-byte tag, so chunk i
+starts at a fixed offset and a range read only decrypts the chunks it
+touches. The nonce is the file's random prefix plus the chunk index. The
+associated data binds the header, the chunk index and a last-chunk flag, so
+chunks cannot be swapped between files, reordered or silently truncated.
+
+Keys live in a local JSON keyring (EVIDENCE_KEYRING_PATH). It maps key ids to
+base64 AES-256 keys and names the active one. It is created with a fresh key
+on first use and can be rotated without re-encrypting old files, because
+every file records its key id.
+"""
+import base64
+import io
+import json
+import os
+import secrets
+import struct
+import uuid
+from pathlib import Path
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from django.conf import settings
+
+MAGIC = b'CLAENC01'
+TAG_SIZE = 16
+DEFAULT_CHUNK_SIZE = 64 * 1024
+_FIXED_HEADER = struct.Struct('>8sI8sH')
+
+
+class KeyringError(Exception):
+    pass
+
+
+class Keyring:
+    """Local key store: {"active": "<key id>", "keys": {"<key id>": "<base64 key>"}}."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._data = None
+        self._mtime = None
+
+    def _load(self):
+        if not self.path.exists():
+            self._create()
+        mtime = self.path.stat().st_mtime
+        if self._data is None or mtime != self._mtime:
+            self._data = json.loads(self.path.read_text())
+            self._mtime = mtime
+
+    def _create(self):
+        """Write a keyring with one fresh key, unless another process got there first."""
+        key_id = f'k1-{secrets.token_hex(4)}'
+        data = {
+            'active': key_id,
+            'keys': {key_id: base64.b64encode(AESGCM.generate_key(bit_length=256)).decode('ascii')},
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            return
+        with os.fdopen(fd, 'w') as handle:
+            json.dump(data, handle, indent=2)
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'.{self.path.name}.{uuid.uuid4().hex}')
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as handle:
+            json.dump(self._data, handle, indent=2)
+        os.replace(tmp_path, self.path)
+        self._mtime = self.path.stat().st_mtime
+
+    def rotate(self):
+        """Generate a new key and make it the active one. Returns its id."""
+        self._load()
+        key_id = f"k{len(self._data['keys']) + 1}-{secrets.token_hex(4)}"
+        self._data['keys'][key_id] = base64.b64encode(AESGCM.generate_key(bit_length=256)).decode('ascii')
+        self._data['active'] = key_id
+        self._save()
+        return key_id
+
+    def active(self):
+        self._load()
+        key_id = self._data['active']
+        return key_id, self.get(key_id)
+
+    def get(self, key_id):
+        self._load()
+        try:
+            return base64.b64decode(self._data['keys'][key_id])
+        except KeyError:
+            raise KeyringError(f'Unknown encryption key id: {key_id}')
+
+
+_keyrings = {}
+
+
+def get_keyring():
+    path = str(getattr(settings, 'EVIDENCE_KEYRING_PATH', Path(settings.BASE_DIR) / 'keyring.json'))
+    if path not in _keyrings:
+        _keyrings[path] = Keyring(path)
+    return _keyrings[path]
+
+
+def encryption_enabled():
+    return getattr(settings, 'EVIDENCE_ENCRYPTION_ENABLED', True)
+
+
+def _chunk_aad(header, index, last):
+    return header + struct.pack('>IB', index, 1 if last else 0)
+
+
+def _nonce(prefix, index):
+    return prefix + struct.pack('>I', index)
+
+
+def _rechunk(chunks, size):
+    """Re-split an iterable of byte strings into blocks of exactly `size` (last may be short)."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def encrypt_to_path(chunks, destination, key_id=None, chunk_size=None):
+    """
+    Encrypt an iterable of plaintext byte strings into destination.
+    Written to a temp file and renamed, so readers never see a partial file.
+    Returns the key id used.
+    """
+    keyring = get_keyring()
+    if key_id is None:
+        key_id, key = keyring.active()
+    else:
+        key = keyring.get(key_id)
+    chunk_size = chunk_size or getattr(settings, 'EVIDENCE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    aesgcm = AESGCM(key)
+    prefix = secrets.token_bytes(8)
+    encoded_key_id = key_id.encode('utf-8')
+    header = _FIXED_HEADER.pack(MAGIC, chunk_size, prefix, len(encoded_key_id)) + encoded_key_id
+
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_name(f'.{uuid.uuid4().hex}.part')
+    try:
+        with tmp_path.open('wb') as handle:
+            handle.write(header)
+            blocks = _rechunk(chunks, chunk_size)
+            current = next(blocks, b'')
+            index = 0
+            while True:
+                following = next(blocks, None)
+                last = following is None
+                handle.write(aesgcm.encrypt(_nonce(prefix, index), current, _chunk_aad(header, index, last)))
+                if last:
+                    break
+                current = following
+                index += 1
+        os.replace(tmp_path, destination)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return key_id
+
+
+def _open_source(source):
+    """Accept a filesystem path or an already open, seekable binary file (e.g. from a Storage backend)."""
+    if hasattr(source, 'read'):
+        return source
+    return open(source, 'rb')
+
+
+def _has_magic(handle):
+    handle.seek(0)
+    found = handle.read(len(MAGIC)) == MAGIC
+    handle.seek(0)
+    return found
+
+
+def is_encrypted(source):
+    try:
+        handle = _open_source(source)
+    except FileNotFoundError:
+        return False
+    if handle is source:
+        return _has_magic(handle)
+    with handle:
+        return _has_magic(handle)
+
+
+class EncryptedFile(io.RawIOBase):
+    """Seekable read-only view of an encrypted blob that decrypts chunks on demand."""
+
+    def __init__(self, source):
+        super().__init__()
+        self._handle = _open_source(source)
+        name = getattr(self._handle, 'name', source)
+        self._handle.seek(0)
+        fixed = self._handle.read(_FIXED_HEADER.size)
+        magic, self.chunk_size, self._prefix, key_id_len = _FIXED_HEADER.unpack(fixed)
+        if magic != MAGIC:
+            self._handle.close()
+            raise ValueError(f'{name} is not an encrypted evidence file')
+        self.key_id = self._handle.read(key_id_len).decode('utf-8')
+        self._header = fixed + self.key_id.encode('utf-8')
+        self._aesgcm = AESGCM(get_keyring().get(self.key_id))
+
+        self._handle.seek(0, io.SEEK_END)
+        stored = self._handle.tell() - len(self._header)
+        stride = self.chunk_size + TAG_SIZE
+        full, remainder = divmod(stored, stride)
+        if (not full and not remainder) or (remainder and remainder < TAG_SIZE) or (full and remainder == TAG_SIZE):
+            self._handle.close()
+            raise ValueError(f'{name} is truncated')
+        self.chunk_count = full + (1 if remainder else 0)
+        self.size = full * self.chunk_size + (remainder - TAG_SIZE if remainder else 0)
+        self._position = 0
+        self._cached_index = None
+        self._cached_plain = b''
+
+    def _chunk(self, index):
+        if index != self._cached_index:
+            stride = self.chunk_size + TAG_SIZE
+            self._handle.seek(len(self._header) + index * stride)
+            sealed = self._handle.read(stride)
+            last = index == self.chunk_count - 1
+            self._cached_plain = self._aesgcm.decrypt(
+                _nonce(self._prefix, index), sealed, _chunk_aad(self._header, index, last)
+            )
+            self._cached_index = index
+        return self._cached_plain
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f'Invalid whence: {whence}')
+        if position < 0:
+            raise ValueError('Negative seek position')
+        self._position = position
+        return position
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        written = 0
+        while written < len(view) and self._position < self.size:
+            index, offset = divmod(self._position, self.chunk_size)
+            plain = self._chunk(index)
+            count = min(len(plain) - offset, len(view) - written)
+            view[written:written + count] = plain[offset:offset + count]
+            written += count
+            self._position += count
+        return written
+
+    def read_range(self, start, end):
+        """Plaintext bytes [start, end), decrypting only the chunks that overlap."""
+        self.seek(start)
+        return self.read(max(end - start, 0))
+
+    def close(self):
+        if not self.closed:
+            self._handle.close()
+        super().close()
+
+
+def open_blob(source):
+    """Open a stored file (path or binary file object) for reading, decrypting transparently when it is encrypted."""
+    handle = _open_source(source)
+    if _has_magic(handle):
+        return io.BufferedReader(EncryptedFile(handle), buffer_size=getattr(settings, 'EVIDENCE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+    return handle
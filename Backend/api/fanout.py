@@ -0,0 +1,166 @@
+"""
+Batched notification fan-out.
+
+A broadcast is stored as one NotificationOutbox row and expanded into
+Notification rows later by a worker (`manage.py process_notification_outbox`).
+Recipients are walked in user_id order with keyset pagination and each chunk is
+written with a few bulk statements (notify_many), coalescible types included.
+The outbox cursor moves in the same transaction, so an interrupted run
+resumes where it stopped without duplicating rows.
+
+A claimed entry holds a lease: claimed_at is set when a worker claims it and
+renewed after every chunk. `requeue_stale_outbox` only hands back PROCESSING
+entries whose lease is older than NOTIFICATION_OUTBOX_LEASE seconds, so an
+entry a live worker is still fanning out is never picked up twice.
+A broadcast that raised is marked FAILED with its cursor kept, and
+`retry_failed_outbox` puts it back in the queue to continue from there.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Case, NotificationOutbox, User
+from .notifications import notify_many
+from .unread import NOTIFICATIONS, invalidate_unread_counts
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def outbox_lease():
+    return getattr(settings, 'NOTIFICATION_OUTBOX_LEASE', 600)
+
+
+def enqueue_notification(audience, title, body, type='SYSTEM', audience_value=None,
+                         recipient_ids=None, metadata=None, created_by=None):
+    """Record a broadcast in the outbox. This is a single INSERT; delivery happens in the worker."""
+    return NotificationOutbox.objects.create(
+        audience=audience,
+        audience_value=audience_value,
+        recipient_ids=[str(user_id) for user_id in recipient_ids] if recipient_ids else None,
+        type=type,
+        title=title,
+        body=body,
+        metadata_json=metadata,
+        created_by=created_by,
+    )
+
+
+def notify_case_parties(case, title, body, type='CASE_UPDATE', metadata=None, created_by=None):
+    """Queue a notification for the citizen and the assigned lawyer of a case."""
+    metadata = dict(metadata or {})
+    metadata.setdefault('case_id', str(case.case_id))
+    return enqueue_notification(
+        'CASE', title, body, type=type, audience_value=str(case.case_id),
+        metadata=metadata, created_by=created_by,
+    )
+
+
+def recipient_queryset(outbox):
+    """Users targeted by an outbox entry."""
+    users = User.objects.all()
+    if outbox.audience == 'USERS':
+        return users.filter(user_id__in=outbox.recipient_ids or [])
+    if outbox.audience == 'ROLE':
+        return users.filter(role=outbox.audience_value, is_active=True)
+    if outbox.audience == 'CASE':
+        case = Case.objects.filter(case_id=outbox.audience_value).select_related('assigned_lawyer').first()
+        if case is None:
+            return users.none()
+        condition = Q(user_id=case.citizen_id)
+        if case.assigned_lawyer:
+            condition |= Q(user_id=case.assigned_lawyer.user_id)
+        return users.filter(condition)
+    return users.filter(is_active=True)
+
+
+def process_outbox(outbox, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Expand one outbox entry into Notification rows, chunk by chunk.
+    Returns run metrics: recipients written, elapsed seconds and rows per second.
+    """
+    if outbox.started_at is None:
+        outbox.started_at = timezone.now()
+    outbox.status = 'PROCESSING'
+    outbox.claimed_at = timezone.now()
+    outbox.save(update_fields=['status', 'started_at', 'claimed_at'])
+
+    recipients = recipient_queryset(outbox).order_by('user_id').values_list('user_id', 'notification_mode')
+    written = 0
+    started = time.monotonic()
+
+    try:
+        while True:
+            page = recipients
+            if outbox.cursor:
+                page = page.filter(user_id__gt=outbox.cursor)
+            rows = list(page[:chunk_size])
+            if not rows:
+                break
+            user_ids = [user_id for user_id, _ in rows]
+
+            with transaction.atomic():
+                notify_many(rows, outbox.type, outbox.title, outbox.body, metadata=outbox.metadata_json)
+                outbox.cursor = str(user_ids[-1])
+                outbox.recipients_processed += len(user_ids)
+                outbox.claimed_at = timezone.now()
+                outbox.save(update_fields=['cursor', 'recipients_processed', 'claimed_at'])
+
+            # bulk_create skips post_save, so let the badges rebuild from the DB.
+            invalidate_unread_counts(user_ids, NOTIFICATIONS)
+            written += len(user_ids)
+    except Exception as exc:
+        outbox.status = 'FAILED'
+        outbox.error_message = str(exc)
+        outbox.save(update_fields=['status', 'error_message'])
+        logger.exception('Notification fan-out %s failed', outbox.outbox_id)
+        raise
+
+    outbox.status = 'COMPLETED'
+    outbox.completed_at = timezone.now()
+    outbox.save(update_fields=['status', 'completed_at'])
+
+    elapsed = time.monotonic() - started
+    return {
+        'outbox_id': outbox.outbox_id,
+        'recipients': written,
+        'seconds': elapsed,
+        'rows_per_second': written / elapsed if elapsed > 0 else float(written),
+    }
+
+
+def claim_next_outbox():
+    """Lock and mark the oldest pending entry so parallel workers never share one."""
+    with transaction.atomic():
+        outbox = (
+            NotificationOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='PENDING')
+            .order_by('outbox_id')
+            .first()
+        )
+        if outbox is None:
+            return None
+        outbox.status = 'PROCESSING'
+        outbox.claimed_at = timezone.now()
+        outbox.save(update_fields=['status', 'claimed_at'])
+        return outbox
+
+
+def requeue_stale_outbox(lease=None):
+    """Return PROCESSING entries whose worker stopped renewing its lease to PENDING. Returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=outbox_lease() if lease is None else lease)
+    return NotificationOutbox.objects.filter(status='PROCESSING').filter(
+        Q(claimed_at__lt=cutoff) | Q(claimed_at__isnull=True)
+    ).update(status='PENDING')
+
+
+def retry_failed_outbox():
+    """Return FAILED entries to PENDING; they resume from their saved cursor. Returns how many."""
+    return NotificationOutbox.objects.filter(status='FAILED').update(status='PENDING', error_message=None)
@@ -0,0 +1,279 @@
+"""
+Incremental analytics over AIFeedback.
+
+Feedback is grouped by the day it was given, the AIMessage.model_version and
+the AIMessage.prompt_template_version of the rated reply. Each group is one
+AIFeedbackRollup row with running totals:
+
+- feedback_count and thumbs_up give the thumbs-up rate. unsafe_count and
+  inaccurate_count give the UNSAFE and INACCURATE rates.
+- Replies that carry a confidence_score (taken as a probability in [0, 1])
+  are also counted in `calibration` by confidence decile, as
+  [count, thumbs up, sum of confidence]. brier_sum adds up
+  (confidence - thumbs_up)^2, with a thumbs up counting as 1.
+
+`run_rollup` only reads feedback after the watermark, the (created_at,
+feedback_id) of the last row it rolled up, which is kept in the SystemSetting
+`ai_feedback.rollup.watermark`. Rows are read in keyset order on the
+(created_at, feedback_id) index, in batches of AI_FEEDBACK_ROLLUP_BATCH. A
+batch's totals and the advanced watermark are committed in one transaction
+that holds a lock on the watermark row, so concurrent runs take turns and
+no feedback is counted twice. Feedback newer than AI_FEEDBACK_ROLLUP_LAG
+seconds is left for the next run; a transaction that commits late with an
+earlier created_at would otherwise land behind the watermark.
+
+Each group key is unique in the table. Replies saved before template
+versions were recorded have no template version: their rows store
+AIFeedbackRollup.UNKNOWN_TEMPLATE_VERSION, because MySQL would let a NULL
+member duplicate the key, and the report shows them under `null`. Feedback edited or deleted after it
+was rolled up keeps its original totals until `reset_rollup` clears
+everything for a full recount.
+
+`rollup_report` adds the rows up per model and template version for the
+admin endpoint and derives the rates, the mean confidence, the Brier score
+and the expected calibration error (the count-weighted gap between mean
+confidence and thumbs-up rate across deciles).
+"""
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AIFeedback, AIFeedbackRollup, SystemSetting
+from .utils import get_system_setting, set_system_setting
+
+WATERMARK_KEY = 'ai_feedback.rollup.watermark'
+CALIBRATION_BINS = 10
+
+
+def batch_size():
+    return getattr(settings, 'AI_FEEDBACK_ROLLUP_BATCH', 2000)
+
+
+def rollup_lag():
+    return getattr(settings, 'AI_FEEDBACK_ROLLUP_LAG', 60)
+
+
+def _calibration_bin(confidence):
+    return min(int(confidence * CALIBRATION_BINS), CALIBRATION_BINS - 1)
+
+
+class _Totals:
+    __slots__ = ('feedback_count', 'thumbs_up', 'unsafe_count', 'inaccurate_count', 'scored_count',
+                 'brier_sum', 'calibration')
+
+    def __init__(self):
+        self.feedback_count = 0
+        self.thumbs_up = 0
+        self.unsafe_count = 0
+        self.inaccurate_count = 0
+        self.scored_count = 0
+        self.brier_sum = 0.0
+        self.calibration = {}
+
+    def add(self, rating, category, confidence):
+        up = 1 if rating == 'THUMBS_UP' else 0
+        self.feedback_count += 1
+        self.thumbs_up += up
+        self.unsafe_count += category == 'UNSAFE'
+        self.inaccurate_count += category == 'INACCURATE'
+        if confidence is None:
+            return
+        confidence = min(max(confidence, 0.0), 1.0)
+        self.scored_count += 1
+        self.brier_sum += (confidence - up) ** 2
+        self.merge_bin(str(_calibration_bin(confidence)), (1, up, confidence))
+
+    def merge_bin(self, key, values):
+        current = self.calibration.get(key, [0, 0, 0.0])
+        self.calibration[key] = [current[0] + values[0], current[1] + values[1], current[2] + values[2]]
+
+    def merge(self, other):
+        self.feedback_count += other.feedback_count
+        self.thumbs_up += other.thumbs_up
+        self.unsafe_count += other.unsafe_count
+        self.inaccurate_count += other.inaccurate_count
+        self.scored_count += other.scored_count
+        self.brier_sum += other.brier_sum
+        for key, values in other.calibration.items():
+            self.merge_bin(key, values)
+
+    def apply_to(self, row):
+        row.feedback_count += self.feedback_count
+        row.thumbs_up += self.thumbs_up
+        row.unsafe_count += self.unsafe_count
+        row.inaccurate_count += self.inaccurate_count
+        row.scored_count += self.scored_count
+        row.brier_sum += self.brier_sum
+        for key, values in row.calibration.items():
+            self.merge_bin(key, values)
+        row.calibration = self.calibration
+
+    @classmethod
+    def from_row(cls, row):
+        totals = cls()
+        for field in cls.__slots__:
+            setattr(totals, field, getattr(row, field))
+        totals.calibration = dict(row.calibration)
+        return totals
+
+
+def _lock_watermark():
+    """The watermark ({"created_at", "feedback_id"} or None), locked until the transaction ends."""
+    SystemSetting.objects.get_or_create(
+        setting_key=WATERMARK_KEY,
+        defaults={'setting_value': 'null', 'data_type': 'JSON',
+                  'description': 'Last AIFeedback row rolled up into AIFeedbackRollup'},
+    )
+    value = SystemSetting.objects.select_for_update().get(setting_key=WATERMARK_KEY).setting_value
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _pending(watermark, horizon):
+    queryset = AIFeedback.objects.filter(created_at__lt=horizon)
+    if watermark:
+        created_at = datetime.fromisoformat(watermark['created_at'])
+        queryset = queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, feedback_id__gt=watermark['feedback_id'])
+        )
+    return queryset.order_by('created_at', 'feedback_id')
+
+
+def _store_group(key, totals):
+    day, model_version, template_version = key
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                row = AIFeedbackRollup.objects.select_for_update().filter(
+                    day=day, model_version=model_version, template_version=template_version,
+                ).first() or AIFeedbackRollup(
+                    day=day, model_version=model_version, template_version=template_version, calibration={},
+                )
+                totals.apply_to(row)
+                row.save()
+                return
+        except IntegrityError:
+            # A run outside the watermark lock inserted this group first; the retry adds to its row.
+            if attempt:
+                raise
+
+
+def _store(groups):
+    for key, totals in groups.items():
+        _store_group(key, totals)
+
+
+def run_rollup(size=None, lag=None):
+    """Roll up feedback given since the watermark. Returns how many feedback rows were processed."""
+    size = size or batch_size()
+    horizon = timezone.now() - timedelta(seconds=rollup_lag() if lag is None else lag)
+    processed = 0
+    while True:
+        with transaction.atomic():
+            watermark = _lock_watermark()
+            rows = list(
+                _pending(watermark, horizon).values_list(
+                    'created_at', 'feedback_id', 'user_rating', 'category',
+                    'message__model_version', 'message__prompt_template_version', 'message__confidence_score',
+                )[:size]
+            )
+            if not rows:
+                break
+            groups = defaultdict(_Totals)
+            for created_at, _, rating, category, model_version, template_version, confidence in rows:
+                if template_version is None:
+                    template_version = AIFeedbackRollup.UNKNOWN_TEMPLATE_VERSION
+                groups[(created_at.date(), model_version or '', template_version)].add(rating, category, confidence)
+            _store(groups)
+            created_at, feedback_id = rows[-1][:2]
+            set_system_setting(
+                WATERMARK_KEY, {'created_at': created_at.isoformat(), 'feedback_id': str(feedback_id)}, 'JSON',
+            )
+        processed += len(rows)
+        if len(rows) < size:
+            break
+    return processed
+
+
+def reset_rollup():
+    """Drop every rollup row and the watermark, so the next run recounts all feedback."""
+    with transaction.atomic():
+        _lock_watermark()
+        AIFeedbackRollup.objects.all().delete()
+        set_system_setting(WATERMARK_KEY, None, 'JSON')
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def _summarize(model_version, template_version, totals, first_day, last_day):
+    bins = []
+    gap = 0.0
+    confidence_total = 0.0
+    for index in range(CALIBRATION_BINS):
+        count, up, confidence_sum = totals.calibration.get(str(index), (0, 0, 0.0))
+        if not count:
+            continue
+        mean_confidence = confidence_sum / count
+        confidence_total += confidence_sum
+        gap += count * abs(mean_confidence - up / count)
+        bins.append({
+            'range': [index / CALIBRATION_BINS, (index + 1) / CALIBRATION_BINS],
+            'count': count,
+            'mean_confidence': round(mean_confidence, 4),
+            'thumbs_up_rate': _rate(up, count),
+        })
+    scored = totals.scored_count
+    return {
+        'model_version': model_version or None,
+        'template_version': None if template_version == AIFeedbackRollup.UNKNOWN_TEMPLATE_VERSION else template_version,
+        'first_day': first_day.isoformat(),
+        'last_day': last_day.isoformat(),
+        'feedback_count': totals.feedback_count,
+        'thumbs_up_rate': _rate(totals.thumbs_up, totals.feedback_count),
+        'unsafe_rate': _rate(totals.unsafe_count, totals.feedback_count),
+        'inaccurate_rate': _rate(totals.inaccurate_count, totals.feedback_count),
+        'scored_count': scored,
+        'mean_confidence': round(confidence_total / scored, 4) if scored else None,
+        'brier_score': round(totals.brier_sum / scored, 4) if scored else None,
+        'expected_calibration_error': round(gap / scored, 4) if scored else None,
+        'calibration': bins,
+    }
+
+
+def rollup_report(since=None, until=None, model_version=None, template_version=None):
+    """Rates and calibration per (model, template version) over the rolled-up days in [since, until]."""
+    rows = AIFeedbackRollup.objects.all()
+    if since:
+        rows = rows.filter(day__gte=since)
+    if until:
+        rows = rows.filter(day__lte=until)
+    if model_version is not None:
+        rows = rows.filter(model_version=model_version)
+    if template_version is not None:
+        rows = rows.filter(template_version=template_version)
+
+    groups = {}
+    for row in rows.order_by('day'):
+        key = (row.model_version, row.template_version)
+        if key not in groups:
+            groups[key] = [_Totals(), row.day, row.day]
+        groups[key][0].merge(_Totals.from_row(row))
+        groups[key][2] = row.day
+    versions = [
+        _summarize(model, template, totals, first_day, last_day)
+        for (model, template), (totals, first_day, last_day) in groups.items()
+    ]
+    versions.sort(key=lambda v: (v['model_version'] or '', v['template_version'] is None, v['template_version'] or 0))
+    return {
+        'watermark': get_system_setting(WATERMARK_KEY),
+        'versions': versions,
+    }
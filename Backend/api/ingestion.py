@@ -0,0 +1,320 @@
+"""
+Text extraction and chunking of evidence for the AI assistant.
+
+Uploads only enqueue a DocumentIngestionJob. The `ingest_documents` worker
+(optionally a pool of processes) claims jobs and turns each document into
+AIDocumentChunk rows:
+
+- Text is extracted by streaming readers: PDFs one page at a time through
+  pypdfium2, DOCX by `iterparse` over word/document.xml straight out of the
+  zip, plain text in fixed-size blocks. Encrypted blobs are decrypted on the
+  fly by open_blob. Only the current page or paragraph is ever held in memory.
+- The splitter counts tokens with a word-piece approximation and emits
+  chunks of AI_CHUNK_TOKENS tokens that overlap by AI_CHUNK_OVERLAP tokens.
+  It prefers to cut after a sentence in the last quarter of the window.
+- Chunks are written with bulk_create in batches of AI_CHUNK_BATCH_SIZE.
+  Old chunks are replaced inside the same transaction.
+
+Chunks carry the document's content hash. Re-ingesting a document whose
+chunks already match its hash does nothing. A document whose bytes were
+already ingested under another document (blobs are deduplicated by hash)
+gets those chunks copied instead of being parsed again.
+"""
+import hashlib
+import io
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .evidence_crypto import open_blob
+from .models import AIDocumentChunk, DocumentIngestionJob, EvidenceDocument
+from .storage import get_storage
+
+MAX_ATTEMPTS = 3
+TEXT_BLOCK_SIZE = 64 * 1024
+
+PDF_MIME_TYPE = 'application/pdf'
+DOCX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+TEXT_MIME_TYPES = ('text/plain', 'text/markdown', 'text/csv')
+
+_WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+# One piece per token, with the whitespace in front of it so pieces join back into the text.
+# Long words are split every 12 characters, roughly like a subword tokenizer would.
+_PIECE_RE = re.compile(r'\s*(?:\w{1,12}|[^\w\s])')
+_SENTENCE_END = ('.', '!', '?', ';')
+
+
+def chunk_tokens():
+    return getattr(settings, 'AI_CHUNK_TOKENS', 400)
+
+
+def chunk_overlap():
+    return getattr(settings, 'AI_CHUNK_OVERLAP', 50)
+
+
+def batch_size():
+    return getattr(settings, 'AI_CHUNK_BATCH_SIZE', 500)
+
+
+def document_kind(document):
+    name = (document.file_name or '').lower()
+    mime_type = document.mime_type or ''
+    if mime_type == PDF_MIME_TYPE or name.endswith('.pdf'):
+        return 'pdf'
+    if mime_type == DOCX_MIME_TYPE or name.endswith('.docx'):
+        return 'docx'
+    if mime_type in TEXT_MIME_TYPES or name.endswith(('.txt', '.md', '.csv')):
+        return 'text'
+    return None
+
+
+def is_ingestible(document):
+    return document_kind(document) is not None
+
+
+def enqueue_ingestion(document):
+    """Queue chunking for a document; no-op for types we cannot extract text from."""
+    if not is_ingestible(document):
+        return None
+    return DocumentIngestionJob.objects.create(document=document)
+
+
+def iter_pdf_text(handle):
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise RuntimeError('PDF ingestion needs pypdfium2 (pip install pypdfium2)')
+    pdf = pdfium.PdfDocument(handle)
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            try:
+                yield textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+    finally:
+        pdf.close()
+
+
+def iter_docx_text(handle):
+    with zipfile.ZipFile(handle) as archive, archive.open('word/document.xml') as xml:
+        body = None
+        parts = []
+        for event, element in iterparse(xml, events=('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if tag == f'{_WORD_NS}body':
+                    body = element
+                continue
+            if tag == f'{_WORD_NS}t':
+                parts.append(element.text or '')
+            elif tag == f'{_WORD_NS}tab':
+                parts.append('\t')
+            elif tag in (f'{_WORD_NS}br', f'{_WORD_NS}cr'):
+                parts.append('\n')
+            elif tag == f'{_WORD_NS}p':
+                if parts:
+                    yield ''.join(parts)
+                parts = []
+                # Drop everything parsed so far so the tree never grows past one paragraph.
+                if body is not None:
+                    body.clear()
+
+
+def iter_plain_text(handle):
+    reader = io.TextIOWrapper(handle, encoding='utf-8', errors='replace', newline=None)
+    carry = ''
+    while True:
+        block = reader.read(TEXT_BLOCK_SIZE)
+        if not block:
+            break
+        block = carry + block
+        # Hold back a trailing partial word so it is not split across blocks.
+        cut = max(block.rfind(' '), block.rfind('\n'))
+        if cut <= 0:
+            carry = block
+            continue
+        carry = block[cut:]
+        yield block[:cut]
+    if carry:
+        yield carry
+
+
+EXTRACTORS = {'pdf': iter_pdf_text, 'docx': iter_docx_text, 'text': iter_plain_text}
+
+
+def count_tokens(text):
+    return len(_PIECE_RE.findall(text))
+
+
+def split_text(segments, size=None, overlap=None):
+    """
+    Yield (text, token_count) chunks of about `size` tokens from an iterable of
+    text segments (pages, paragraphs, blocks), overlapping by `overlap` tokens.
+    """
+    size = size or chunk_tokens()
+    overlap = min(chunk_overlap() if overlap is None else overlap, size // 2)
+    window = []
+    carried = 0
+    started = False
+
+    for segment in segments:
+        pieces = _PIECE_RE.findall(segment)
+        if not pieces:
+            continue
+        if started and not pieces[0][:1].isspace():
+            # Page and paragraph boundaries become line breaks.
+            pieces[0] = '\n' + pieces[0]
+        started = True
+        for piece in pieces:
+            window.append(piece)
+            if len(window) < size:
+                continue
+            cut = size
+            for index in range(size - 1, size * 3 // 4, -1):
+                if window[index].endswith(_SENTENCE_END):
+                    cut = index + 1
+                    break
+            text = ''.join(window[:cut]).strip()
+            if text:
+                yield text, cut
+            start = max(cut - overlap, 1)
+            # Start the overlap on a word, not on the punctuation that ended the last chunk.
+            while start < cut and not window[start].lstrip()[:1].isalnum():
+                start += 1
+            window = window[start:]
+            carried = len(window)
+    # The tail is only worth a chunk if it holds more than the overlap already emitted.
+    text = ''.join(window).strip()
+    if text and len(window) > carried:
+        yield text, len(window)
+
+
+def _content_hash(document, storage):
+    if document.encryption_hash:
+        return document.encryption_hash
+    digest = hashlib.sha256()
+    with open_blob(storage.open(document.storage_path, 'rb')) as handle:
+        for block in iter(lambda: handle.read(TEXT_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_batches(document, content_hash, chunks):
+    written = 0
+    batch = []
+    for index, (text, tokens) in enumerate(chunks):
+        batch.append(AIDocumentChunk(
+            document=document, chunk_index=index, content_text=text,
+            content_hash=content_hash, token_count=tokens,
+        ))
+        if len(batch) >= batch_size():
+            AIDocumentChunk.objects.bulk_create(batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        AIDocumentChunk.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def _copy_chunks(document, content_hash, source_document_id):
+    existing = (
+        AIDocumentChunk.objects.filter(document_id=source_document_id, content_hash=content_hash)
+        .order_by('chunk_index').values_list('content_text', 'token_count')
+    )
+    return _write_batches(document, content_hash, existing.iterator(chunk_size=batch_size()))
+
+
+def ingest_document(document):
+    """Extract, split and store chunks for one document. Returns the number of chunks it has."""
+    kind = document_kind(document)
+    if kind is None:
+        raise ValueError(f'Cannot extract text from {document.mime_type or document.file_name}')
+    storage = get_storage()
+    content_hash = _content_hash(document, storage)
+
+    current = AIDocumentChunk.objects.filter(document=document)
+    if current.exists() and not current.exclude(content_hash=content_hash).exists():
+        return current.count()
+
+    donor = (
+        AIDocumentChunk.objects.filter(content_hash=content_hash).exclude(document=document)
+        .values_list('document_id', flat=True).first()
+    )
+    with transaction.atomic():
+        current.delete()
+        if donor is not None:
+            return _copy_chunks(document, content_hash, donor)
+        with open_blob(storage.open(document.storage_path, 'rb')) as handle:
+            return _write_batches(document, content_hash, split_text(EXTRACTORS[kind](handle)))
+
+
+def claim_next_job():
+    """Lock and mark the oldest pending job so parallel workers never share one."""
+    with transaction.atomic():
+        job = (
+            DocumentIngestionJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='PENDING')
+            .order_by('job_id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'PROCESSING'
+        job.attempts += 1
+        job.save(update_fields=['status', 'attempts'])
+        return job
+
+
+def process_job(job):
+    """Run one claimed job; failures are retried up to MAX_ATTEMPTS. Returns the chunk count or None."""
+    try:
+        document = EvidenceDocument.objects.get(pk=job.document_id, deleted_at__isnull=True)
+        chunk_count = ingest_document(document)
+    except Exception as exc:
+        job.status = 'FAILED' if job.attempts >= MAX_ATTEMPTS else 'PENDING'
+        job.error_message = str(exc)
+        job.save(update_fields=['status', 'error_message'])
+        return None
+    job.status = 'COMPLETED'
+    job.chunk_count = chunk_count
+    job.error_message = None
+    job.completed_at = timezone.now()
+    job.save(update_fields=['status', 'chunk_count', 'error_message', 'completed_at'])
+    return chunk_count
+
+
+def drain_queue():
+    """Process jobs until the queue is empty. Returns (completed, failed) counts."""
+    completed = failed = 0
+    while True:
+        job = claim_next_job()
+        if job is None:
+            return completed, failed
+        if process_job(job) is None:
+            failed += 1
+        else:
+            completed += 1
+
+
+def enqueue_backfill():
+    """Queue jobs for live ingestible documents that have no chunks yet. Returns jobs created."""
+    documents = (
+        EvidenceDocument.objects.filter(deleted_at__isnull=True, aidocumentchunk__isnull=True)
+        .exclude(documentingestionjob__status__in=('PENDING', 'PROCESSING'))
+        .distinct()
+    )
+    jobs = [
+        DocumentIngestionJob(document=document)
+        for document in documents.iterator() if is_ingestible(document)
+    ]
+    DocumentIngestionJob.objects.bulk_create(jobs, batch_size=1000)
+    return len(jobs)
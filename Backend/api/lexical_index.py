@@ -0,0 +1,328 @@
+"""
+BM25 inverted index over AIDocumentChunk.content_text.
+
+The index is a list of immutable segments under LEXICAL_INDEX_DIR, named in
+`segments.json`, which writers replace atomically. Each segment stores, as
+flat arrays read through numpy memory maps:
+
+- `ids.bin` (int64, ascending) and `lengths.bin` (int32): the chunk id and
+  analyzed length of each row.
+- `terms.bin` (uint64, sorted) and `offsets.bin` (int64): the 64-bit hash of
+  every term and where its postings start. Hashes keep the vocabulary out of
+  Python dicts, and a lookup is one searchsorted.
+- `rows.bin` (int32) and `tfs.bin` (uint16): the postings themselves.
+
+Scoring a query costs one searchsorted per term per segment plus a bincount
+over the matching postings, so it scales with the postings of the query
+terms, not with the corpus. Document frequencies and the average length are
+summed over all segments, so scores do not depend on how rows are split.
+
+New chunks are added as a small segment per indexing batch. Once there are
+more than LEXICAL_MAX_SEGMENTS, the small ones are merged by rebuilding them
+from the database, which also drops deleted chunks. A segment is built by
+spilling (term, row, tf) triples into hash-range partitions on disk and then
+sorting one partition at a time, so a full rebuild of a million chunks never
+holds all postings in memory.
+"""
+import json
+import math
+import re
+import shutil
+import zlib
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .models import AIDocumentChunk
+from .vector_index import publish_json, write_lock
+
+K1 = 1.2
+B = 0.75
+SPILL_PARTITIONS = 16
+SPILL_BUFFER = 1_000_000
+# Latin word characters plus the Bengali block, so matras do not split Bangla words.
+_WORD_RE = re.compile(r'[\w\u0980-\u09FF]+')
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have he her his in is it its of on or she that the their '
+    'there they this to was were will with'.split()
+)
+_POSTING_DTYPE = np.dtype([('term', '<u8'), ('row', '<i4'), ('tf', '<u2')])
+_SEGMENT_FILES = {
+    'ids': np.int64, 'lengths': np.int32, 'terms': np.uint64,
+    'offsets': np.int64, 'rows': np.int32, 'tfs': np.uint16,
+}
+
+
+def analyze(text):
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+def term_hash(term):
+    data = term.encode('utf-8')
+    return (zlib.crc32(data) << 32) | zlib.adler32(data)
+
+
+class Segment:
+    def __init__(self, path):
+        self.path = Path(path)
+        info = json.loads((self.path / 'segment.json').read_text())
+        self.name = self.path.name
+        self.count = info['count']
+        self.total_length = info['total_length']
+        for name, dtype in _SEGMENT_FILES.items():
+            file_path = self.path / f'{name}.bin'
+            array = np.memmap(file_path, dtype=dtype, mode='r') if file_path.stat().st_size else np.empty(0, dtype)
+            setattr(self, name, array)
+        self._norm = (None, None)
+
+    def length_norm(self, average_length):
+        """Per-row BM25 length normalization, cached until the corpus average changes."""
+        cached_average, norm = self._norm
+        if cached_average != average_length:
+            norm = (K1 * (1 - B + B * np.asarray(self.lengths, dtype=np.float32) / average_length)).astype(np.float32)
+            self._norm = (average_length, norm)
+        return norm
+
+    def postings(self, hashed):
+        """(rows, tfs) for a term hash, or None when the term is not in this segment."""
+        position = int(np.searchsorted(self.terms, np.uint64(hashed)))
+        if position < len(self.terms) and int(self.terms[position]) == hashed:
+            start, stop = int(self.offsets[position]), int(self.offsets[position + 1])
+            return self.rows[start:stop], self.tfs[start:stop]
+        return None
+
+    def rows_for(self, chunk_ids):
+        """Rows holding any of the (sorted, unique) chunk ids."""
+        positions = np.searchsorted(self.ids, chunk_ids)
+        valid = positions < len(self.ids)
+        positions = positions[valid]
+        return positions[self.ids[positions] == chunk_ids[valid]]
+
+
+def _spill(buffer, spills):
+    if not buffer:
+        return
+    records = np.array(buffer, dtype=_POSTING_DTYPE)
+    partition = (records['term'] >> np.uint64(64 - 4)).astype(np.int64)
+    for index in np.unique(partition):
+        spills[index].write(records[partition == index].tobytes())
+
+
+def build_segment(path, rows):
+    """Write a segment for (chunk_id, text) pairs given in ascending chunk_id order."""
+    path = Path(path)
+    spill_dir = path / 'spill'
+    spill_dir.mkdir(parents=True)
+    ids, lengths, buffer = [], [], []
+    spills = [open(spill_dir / f'{index}.bin', 'wb') for index in range(SPILL_PARTITIONS)]
+    try:
+        for row, (chunk_id, text) in enumerate(rows):
+            terms = analyze(text)
+            ids.append(chunk_id)
+            lengths.append(len(terms))
+            buffer.extend((term_hash(term), row, min(tf, 65535)) for term, tf in Counter(terms).items())
+            if len(buffer) >= SPILL_BUFFER:
+                _spill(buffer, spills)
+                buffer = []
+        _spill(buffer, spills)
+    finally:
+        for spill in spills:
+            spill.close()
+
+    np.asarray(ids, dtype=np.int64).tofile(path / 'ids.bin')
+    np.asarray(lengths, dtype=np.int32).tofile(path / 'lengths.bin')
+    base = 0
+    with open(path / 'terms.bin', 'wb') as terms_out, open(path / 'offsets.bin', 'wb') as offsets_out, \
+            open(path / 'rows.bin', 'wb') as rows_out, open(path / 'tfs.bin', 'wb') as tfs_out:
+        # Partitions are hash ranges in ascending order, so sorting each one sorts the whole file.
+        for index in range(SPILL_PARTITIONS):
+            postings = np.fromfile(spill_dir / f'{index}.bin', dtype=_POSTING_DTYPE)
+            if not len(postings):
+                continue
+            postings = postings[np.lexsort((postings['row'], postings['term']))]
+            terms, starts = np.unique(postings['term'], return_index=True)
+            terms_out.write(terms.tobytes())
+            offsets_out.write((starts.astype(np.int64) + base).tobytes())
+            rows_out.write(postings['row'].tobytes())
+            tfs_out.write(postings['tf'].tobytes())
+            base += len(postings)
+        offsets_out.write(np.asarray([base], dtype=np.int64).tobytes())
+    shutil.rmtree(spill_dir)
+    (path / 'segment.json').write_text(json.dumps({'count': len(ids), 'total_length': int(sum(lengths))}))
+    return len(ids)
+
+
+def _indexed_rows(chunk_ids, batch=2000):
+    """(chunk_id, text) for the chunks among chunk_ids that still exist and are indexed, in id order."""
+    chunk_ids = np.unique(np.asarray(chunk_ids, dtype=np.int64))
+    for start in range(0, len(chunk_ids), batch):
+        yield from (
+            AIDocumentChunk.objects
+            .filter(chunk_id__in=chunk_ids[start:start + batch].tolist(), vector_id__isnull=False)
+            .order_by('chunk_id').values_list('chunk_id', 'content_text')
+        )
+
+
+class LexicalIndex:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._stamp = None
+        self._segments = []
+
+    def _manifest(self):
+        manifest_path = self.path / 'segments.json'
+        if not manifest_path.exists():
+            return {'next': 1, 'segments': []}
+        return json.loads(manifest_path.read_text())
+
+    def segments(self):
+        """Open segments, reloaded whenever a writer publishes a new manifest."""
+        try:
+            stat = (self.path / 'segments.json').stat()
+        except FileNotFoundError:
+            return []
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp != self._stamp:
+            opened = {segment.name: segment for segment in self._segments}
+            self._segments = [
+                opened.get(name) or Segment(self.path / name) for name in self._manifest()['segments']
+            ]
+            self._stamp = stamp
+        return self._segments
+
+    def __len__(self):
+        return sum(segment.count for segment in self.segments())
+
+    def _publish(self, manifest, obsolete=()):
+        publish_json(self.path / 'segments.json', manifest)
+        for name in obsolete:
+            # Readers that still map these files keep their inodes until they reload.
+            shutil.rmtree(self.path / name, ignore_errors=True)
+
+    def _build(self, manifest, rows):
+        name = f"seg-{manifest['next']}"
+        manifest['next'] += 1
+        target = self.path / name
+        shutil.rmtree(target, ignore_errors=True)
+        count = build_segment(target, rows)
+        return name if count else None
+
+    def add(self, rows):
+        """Add (chunk_id, text) pairs, ascending by chunk_id, as a new segment."""
+        with write_lock(self.path):
+            manifest = self._manifest()
+            name = self._build(manifest, rows)
+            if name:
+                manifest['segments'].append(name)
+                self._publish(manifest)
+
+    def reset(self):
+        with write_lock(self.path):
+            manifest = self._manifest()
+            obsolete = manifest['segments']
+            manifest['segments'] = []
+            self._publish(manifest, obsolete)
+
+    def merge(self, force=False):
+        """
+        Rebuild small segments (all of them with force) into one from the
+        database, dropping chunks that are gone. Returns the number merged.
+        """
+        with write_lock(self.path):
+            manifest = self._manifest()
+            segments = [Segment(self.path / name) for name in manifest['segments']]
+            if not force:
+                if len(segments) <= getattr(settings, 'LEXICAL_MAX_SEGMENTS', 8):
+                    return 0
+                total = sum(segment.count for segment in segments)
+                small = [segment for segment in segments if segment.count < total / 10]
+                segments = small if len(small) >= 2 else segments
+            if not segments:
+                return 0
+            chunk_ids = np.concatenate([np.asarray(segment.ids) for segment in segments])
+            name = self._build(manifest, _indexed_rows(chunk_ids))
+            merged = {segment.name for segment in segments}
+            manifest['segments'] = [existing for existing in manifest['segments'] if existing not in merged]
+            if name:
+                manifest['segments'].append(name)
+            self._publish(manifest, merged)
+            return len(merged)
+
+    def search(self, query, k=50, allowed_ids=None):
+        """Top-k (chunk_id, BM25 score), best first, optionally limited to allowed_ids."""
+        segments = self.segments()
+        hashes = [term_hash(term) for term in set(analyze(query))]
+        if not segments or not hashes:
+            return []
+        total_rows = sum(segment.count for segment in segments)
+        average_length = max(sum(segment.total_length for segment in segments) / total_rows, 1.0)
+        postings = [[segment.postings(hashed) for hashed in hashes] for segment in segments]
+        document_frequency = [
+            sum(len(per_segment[term][0]) for per_segment in postings if per_segment[term] is not None)
+            for term in range(len(hashes))
+        ]
+        idf = [math.log(1 + (total_rows - df + 0.5) / (df + 0.5)) for df in document_frequency]
+        allowed = None if allowed_ids is None else np.unique(np.asarray(allowed_ids, dtype=np.int64))
+
+        best = {}
+        for segment, per_segment in zip(segments, postings):
+            if all(found is None for found in per_segment):
+                continue
+            norm = segment.length_norm(average_length)
+            visible = segment.rows_for(allowed) if allowed is not None else None
+            if visible is not None and len(visible) * 8 < segment.count:
+                # Few visible rows: look each one up in the (row-sorted) postings instead of
+                # touching every posting of a common term.
+                candidates, scores = visible, np.zeros(len(visible), dtype=np.float32)
+                for term, found in enumerate(per_segment):
+                    if found is None:
+                        continue
+                    term_rows, tfs = found
+                    positions = np.searchsorted(term_rows, visible)
+                    hit = positions < len(term_rows)
+                    hit[hit] = term_rows[positions[hit]] == visible[hit]
+                    term_tfs = np.asarray(tfs[positions[hit]], dtype=np.float32)
+                    scores[hit] += (idf[term] * (K1 + 1)) * term_tfs / (term_tfs + norm[visible[hit]])
+                order = scores > 0
+                candidates, scores = candidates[order], scores[order]
+                if len(candidates) > k:
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    candidates, scores = candidates[top], scores[top]
+                for row, score in zip(candidates, scores):
+                    chunk_id = int(segment.ids[row])
+                    best[chunk_id] = max(best.get(chunk_id, 0.0), float(score))
+                continue
+
+            scores = np.zeros(segment.count, dtype=np.float32)
+            for term, found in enumerate(per_segment):
+                if found is None:
+                    continue
+                term_rows, tfs = found
+                tfs = np.asarray(tfs, dtype=np.float32)
+                # Rows are unique within a term's postings, so fancy-index += is safe.
+                scores[term_rows] += (idf[term] * (K1 + 1)) * tfs / (tfs + norm[term_rows])
+            if visible is not None:
+                candidates = visible
+            elif segment.count > k:
+                candidates = np.argpartition(-scores, k - 1)[:k]
+            else:
+                candidates = np.arange(segment.count)
+            candidates = candidates[scores[candidates] > 0]
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            for row in candidates:
+                chunk_id = int(segment.ids[row])
+                best[chunk_id] = max(best.get(chunk_id, 0.0), float(scores[row]))
+        return sorted(best.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+_index = None
+
+
+def get_lexical_index():
+    global _index
+    if _index is None:
+        _index = LexicalIndex(getattr(settings, 'LEXICAL_INDEX_DIR', Path(settings.BASE_DIR) / 'lexical_index'))
+    return _index
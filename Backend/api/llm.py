@@ -0,0 +1,164 @@
+"""
+Language model providers for the legal assistant.
+
+A provider turns a system prompt and a list of chat turns into a stream of
+LLMChunk. Most chunks carry a text delta. The provider may also report token
+usage, usually on the last chunk; the gateway (api/assistant.py) counts
+tokens itself when it does not. Providers hold no request state, so one
+instance is shared across requests.
+
+A provider that can judge its own reply reports a confidence in [0, 1] on a
+chunk as well. The gateway saves it as AIMessage.confidence_score, which
+feedback calibration is measured against.
+
+AI_LLM_PROVIDER names the provider class by dotted path:
+
+- StubProvider answers deterministically from the prompt with no network
+  access. It is the default, for development and tests. Its confidence is
+  higher when it has evidence excerpts to restate.
+- GeminiProvider calls Google Gemini through the google-genai SDK. It needs
+  GEMINI_API_KEY, and AI_LLM_MODEL picks the model. Its confidence is the
+  geometric mean token probability, exp(avg_logprobs), when the model
+  returns log probabilities.
+"""
+import math
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .ingestion import count_tokens
+
+# One streamed piece of a reply. Usage and confidence stay None until the provider knows them.
+LLMChunk = namedtuple(
+    'LLMChunk', ['text', 'prompt_tokens', 'completion_tokens', 'confidence'], defaults=(None, None, None),
+)
+
+STUB_CONFIDENCE = (0.4, 0.8)  # (no excerpts, excerpts)
+
+
+class ProviderError(Exception):
+    """The provider could not produce a reply (unreachable, misconfigured, refused)."""
+
+
+class LLMProvider:
+    """Interface: `stream` yields LLMChunk objects for a reply to `messages`."""
+    name = ''
+
+    @property
+    def model_version(self):
+        """Stored on AIMessage.model_version for every reply this provider writes."""
+        return self.name
+
+    def stream(self, system, messages, max_tokens=None):
+        """
+        Yield LLMChunk for a reply. `messages` is a list of
+        {"role": "user" | "assistant", "content": str}, oldest first.
+        """
+        raise NotImplementedError
+
+
+class StubProvider(LLMProvider):
+    """
+    Offline provider: restates the last question and lists the excerpts
+    handed to it in the system prompt, one word per chunk. The same prompt
+    always yields the same reply and token counts.
+    """
+    name = 'stub'
+
+    def __init__(self, delay=None):
+        # Seconds between chunks, to exercise streaming clients against a slow model.
+        self.delay = getattr(settings, 'AI_LLM_STUB_DELAY', 0.0) if delay is None else delay
+
+    def reply_text(self, system, messages):
+        question = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+        sources = [line for line in system.splitlines() if line.startswith('[')]
+        lines = [f'You asked: {question.strip()}']
+        if sources:
+            lines.append('Relevant excerpts from your documents:')
+            lines.extend(f'- {source}' for source in sources)
+        else:
+            lines.append('I found no excerpts in your documents for this question.')
+        lines.append('(This reply comes from the offline stub provider.)')
+        return '\n'.join(lines)
+
+    def stream(self, system, messages, max_tokens=None):
+        pieces = self.reply_text(system, messages).split(' ')
+        if max_tokens:
+            pieces = pieces[:max_tokens]
+        text = ''
+        for index, piece in enumerate(pieces):
+            if self.delay:
+                time.sleep(self.delay)
+            delta = piece if index == 0 else ' ' + piece
+            text += delta
+            yield LLMChunk(delta)
+        prompt = system + ''.join(m['content'] for m in messages)
+        has_sources = any(line.startswith('[') for line in system.splitlines())
+        yield LLMChunk('', count_tokens(prompt), count_tokens(text), STUB_CONFIDENCE[has_sources])
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through the google-genai SDK, streamed."""
+    name = 'gemini'
+
+    def __init__(self, model=None, api_key=None):
+        self.model = model or getattr(settings, 'AI_LLM_MODEL', 'gemini-2.5-flash')
+        self.api_key = api_key or getattr(settings, 'GEMINI_API_KEY', '')
+        self._client = None
+
+    @property
+    def model_version(self):
+        return self.model
+
+    def client(self):
+        if self._client is None:
+            try:
+                from google import genai
+            except ImportError:
+                raise ProviderError('The Gemini provider needs google-genai (pip install google-genai)')
+            if not self.api_key:
+                raise ProviderError('GEMINI_API_KEY is not set')
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    def stream(self, system, messages, max_tokens=None):
+        client = self.client()
+        contents = [
+            {'role': 'model' if m['role'] == 'assistant' else 'user', 'parts': [{'text': m['content']}]}
+            for m in messages
+        ]
+        config = {'system_instruction': system}
+        if max_tokens:
+            config['max_output_tokens'] = max_tokens
+        try:
+            usage = None
+            avg_logprobs = None
+            for chunk in client.models.generate_content_stream(model=self.model, contents=contents, config=config):
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                for candidate in getattr(chunk, 'candidates', None) or []:
+                    if getattr(candidate, 'avg_logprobs', None) is not None:
+                        avg_logprobs = candidate.avg_logprobs
+                if chunk.text:
+                    yield LLMChunk(chunk.text)
+        except ProviderError:
+            raise
+        except Exception as exc:
+            raise ProviderError(str(exc)) from exc
+        confidence = min(math.exp(avg_logprobs), 1.0) if avg_logprobs is not None else None
+        if usage is not None or confidence is not None:
+            yield LLMChunk(
+                '', getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None),
+                confidence,
+            )
+
+
+_provider = None
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        _provider = import_string(getattr(settings, 'AI_LLM_PROVIDER', 'api.llm.StubProvider'))()
+    return _provider
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.activity_archive import archive_cutoff, archive_old_activity
+
+
+class Command(BaseCommand):
+    help = 'Move CaseActivityLog rows older than the hot window into compressed month segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=None,
+                            help='Months kept in the hot table (default: SystemSetting '
+                                 'archive.case_activity_log.months, or 6)')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['months'])
+        self.stdout.write(self.style.NOTICE(f'Archiving activity recorded before {cutoff:%Y-%m-%d}...'))
+        total = archive_old_activity(options['months'], log=lambda message: self.stdout.write(message))
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} activity log rows'))
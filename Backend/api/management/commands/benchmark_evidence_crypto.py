@@ -0,0 +1,88 @@
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.evidence_crypto import EncryptedFile, encrypt_to_path
+
+
+class Command(BaseCommand):
+    help = 'Compare plaintext disk I/O with chunked AES-GCM encrypt/decrypt throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=64, help='Size of the test file')
+        parser.add_argument('--range-reads', type=int, default=200, help='Random 256 KiB range reads to time')
+        parser.add_argument('--dir', default=None, help='Scratch directory (defaults to MEDIA_ROOT, same disk as evidence)')
+
+    def handle(self, *args, **options):
+        size = options['size_mb'] * 1024 * 1024
+        block = 1024 * 1024
+        payload = os.urandom(block)
+        scratch_root = Path(options['dir'] or settings.MEDIA_ROOT)
+        scratch_root.mkdir(parents=True, exist_ok=True)
+
+        def blocks():
+            for _ in range(size // block):
+                yield payload
+
+        with tempfile.TemporaryDirectory(dir=scratch_root) as scratch:
+            plain_path = Path(scratch) / 'plain.bin'
+            sealed_path = Path(scratch) / 'sealed.bin'
+
+            started = time.perf_counter()
+            with plain_path.open('wb') as handle:
+                for chunk in blocks():
+                    handle.write(chunk)
+                handle.flush()
+                os.fsync(handle.fileno())
+            plain_write = time.perf_counter() - started
+
+            started = time.perf_counter()
+            encrypt_to_path(blocks(), sealed_path)
+            with sealed_path.open('rb') as handle:
+                os.fsync(handle.fileno())
+            sealed_write = time.perf_counter() - started
+
+            started = time.perf_counter()
+            with plain_path.open('rb') as handle:
+                while handle.read(block):
+                    pass
+            plain_read = time.perf_counter() - started
+
+            started = time.perf_counter()
+            with EncryptedFile(sealed_path) as handle:
+                while handle.read(block):
+                    pass
+            sealed_read = time.perf_counter() - started
+
+            span = 256 * 1024
+            offsets = [random.randrange(0, size - span) for _ in range(options['range_reads'])]
+            started = time.perf_counter()
+            with plain_path.open('rb') as handle:
+                for offset in offsets:
+                    handle.seek(offset)
+                    handle.read(span)
+            plain_ranges = time.perf_counter() - started
+
+            started = time.perf_counter()
+            with EncryptedFile(sealed_path) as handle:
+                for offset in offsets:
+                    handle.read_range(offset, offset + span)
+            sealed_ranges = time.perf_counter() - started
+
+        megabytes = size / (1024 * 1024)
+        range_megabytes = len(offsets) * span / (1024 * 1024)
+        rows = [
+            ('sequential write', megabytes, plain_write, sealed_write),
+            ('sequential read', megabytes, plain_read, sealed_read),
+            ('random range read', range_megabytes, plain_ranges, sealed_ranges),
+        ]
+        self.stdout.write(f"{'operation':<20}{'plain MB/s':>12}{'encrypted MB/s':>16}{'slowdown':>10}")
+        for name, amount, plain, sealed in rows:
+            self.stdout.write(
+                f'{name:<20}{amount / plain:>12.0f}{amount / sealed:>16.0f}{sealed / plain:>9.1f}x'
+            )
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.media_gc import collect, expire_quarantine, grace_hours
+from api.storage import local_path
+
+
+class Command(BaseCommand):
+    help = 'Quarantine media files that no database row references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partitions', type=int, default=1,
+                            help='Split the mark set into N hash partitions to bound memory (one pass each)')
+        parser.add_argument('--grace-hours', type=float, default=None,
+                            help='Leave files younger than this alone (default: SystemSetting '
+                                 'media_gc.grace_hours, or 24)')
+        parser.add_argument('--expire-days', type=int, default=None,
+                            help='Also delete quarantine runs older than this many days')
+        parser.add_argument('--dry-run', action='store_true', help='List orphans without moving anything')
+
+    def handle(self, *args, **options):
+        root = local_path('')
+        if root is None:
+            raise CommandError('Media GC walks the local media tree; the storage backend has none')
+        if options['partitions'] < 1:
+            raise CommandError('--partitions must be at least 1')
+
+        hours = grace_hours() if options['grace_hours'] is None else options['grace_hours']
+        self.stdout.write(self.style.NOTICE(
+            f'Sweeping {root} in {options["partitions"]} partition(s), grace period {hours:g}h...'
+        ))
+        totals = collect(
+            root,
+            partitions=options['partitions'],
+            grace_seconds=hours * 3600,
+            dry_run=options['dry_run'],
+            log=lambda message: self.stdout.write(message),
+        )
+        verb = 'Would quarantine' if options['dry_run'] else 'Quarantined'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {totals['orphaned']} of {totals['scanned']} files ({totals['bytes'] / 1048576:.1f} MB); "
+            f"{totals['recent']} unreferenced files are inside the grace period"
+        ))
+
+        if options['expire_days'] is not None:
+            removed = expire_quarantine(root, options['expire_days'], dry_run=options['dry_run'])
+            verb = 'Would delete' if options['dry_run'] else 'Deleted'
+            self.stdout.write(self.style.SUCCESS(f'{verb} {len(removed)} expired quarantine run(s)'))
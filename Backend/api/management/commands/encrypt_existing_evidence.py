@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.evidence_crypto import EncryptedFile, encrypt_to_path, is_encrypted
+from api.models import EvidenceDocument, StoredBlob
+from api.storage import local_path
+
+
+def _read_chunks(path, size=1024 * 1024):
+    with open(path, 'rb') as handle:
+        while True:
+            chunk = handle.read(size)
+            if not chunk:
+                break
+            yield chunk
+
+
+class Command(BaseCommand):
+    help = 'Encrypt evidence blobs that were stored before encryption at rest was enabled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='List blobs without encrypting them')
+
+    def handle(self, *args, **options):
+        encrypted = 0
+        for blob in StoredBlob.objects.filter(encryption_key_id='').iterator():
+            path = local_path(blob.storage_path)
+            if path is None:
+                raise CommandError('In-place encryption needs a storage backend on local disk')
+            if not path.is_file():
+                self.stderr.write(self.style.WARNING(f'Missing file for blob {blob.sha256}: {blob.storage_path}'))
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'Would encrypt {blob.storage_path}')
+                continue
+
+            if is_encrypted(path):
+                # Encrypted by an earlier run that stopped before updating the row.
+                with EncryptedFile(path) as handle:
+                    key_id = handle.key_id
+            else:
+                key_id = encrypt_to_path(_read_chunks(path), path)
+
+            StoredBlob.objects.filter(sha256=blob.sha256).update(encryption_key_id=key_id)
+            EvidenceDocument.objects.filter(encryption_hash=blob.sha256).update(encryption_key_id=key_id)
+            encrypted += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Encrypted {encrypted} evidence blobs'))
@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.lexical_index import get_lexical_index
+from api.models import AIDocumentChunk
+from api.vector_index import get_embedder, get_index, index_pending_chunks
+
+
+class Command(BaseCommand):
+    help = 'Add new AI document chunks to the vector and BM25 indexes and compact them when needed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=256, help='Chunks embedded per append')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Start a fresh index and re-embed every chunk (e.g. after changing AI_EMBEDDER)')
+        parser.add_argument('--compact', action='store_true',
+                            help='Compact the vector index and merge every BM25 segment even if below thresholds')
+        parser.add_argument('--clusters', type=int, default=None,
+                            help='Re-cluster into N IVF lists while compacting (0 switches IVF off)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep indexing new chunks instead of exiting')
+        parser.add_argument('--interval', type=float, default=10.0,
+                            help='Seconds to sleep between passes in --loop mode')
+
+    def handle(self, *args, **options):
+        index = get_index()
+        if options['rebuild']:
+            embedder = get_embedder()
+            index.reset(embedder.dim, embedder.name)
+            get_lexical_index().reset()
+            cleared = AIDocumentChunk.objects.exclude(vector_id__isnull=True).update(vector_id=None)
+            self.stdout.write(self.style.NOTICE(f'Reset the index; {cleared} chunk(s) will be re-embedded'))
+
+        compact = options['compact'] or options['clusters'] is not None
+        while True:
+            started = time.monotonic()
+            try:
+                indexed = index_pending_chunks(batch_size=options['batch_size'])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            if indexed:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Indexed {indexed} chunk(s) in {time.monotonic() - started:.2f}s ({len(index)} rows)'
+                ))
+            self._maybe_compact(index, compact, options['clusters'])
+            merged = get_lexical_index().merge(force=compact)
+            if merged:
+                self.stdout.write(self.style.SUCCESS(f'Merged {merged} BM25 segment(s)'))
+            compact = False
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def _maybe_compact(self, index, force, clusters):
+        if not index.exists():
+            return
+        live = AIDocumentChunk.objects.filter(vector_id__isnull=False)
+        dead = len(index) - live.count()
+        ratio = getattr(settings, 'VECTOR_INDEX_COMPACT_RATIO', 0.2)
+        # Dead rows waste scans; unclustered rows are scanned by every IVF query.
+        stale = max(dead, index.unclustered())
+        if not force and (not len(index) or stale / len(index) < ratio):
+            return
+        live_ids = np.fromiter(live.values_list('chunk_id', flat=True).iterator(chunk_size=10000), dtype=np.int64)
+        started = time.monotonic()
+        kept, dropped = index.compact(live_ids, clusters=clusters)
+        self.stdout.write(self.style.SUCCESS(
+            f'Compacted the index to {kept} row(s), dropped {dropped}, '
+            f'{index.meta["clusters"]} IVF list(s), in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.ingestion import drain_queue, enqueue_backfill
+from api.models import DocumentIngestionJob
+
+
+def _init_worker():
+    # Under spawn the child starts cold; under fork it must not reuse the parent's DB sockets.
+    django.setup()
+    connections.close_all()
+
+
+def _drain_in_worker():
+    try:
+        return drain_queue()
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Extract text from queued evidence documents and store it as AI document chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes claiming jobs in parallel')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the queue instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between polls in --loop mode')
+        parser.add_argument('--resume', action='store_true',
+                            help='Requeue jobs left PROCESSING by a worker that stopped mid-run')
+        parser.add_argument('--backfill', action='store_true',
+                            help='First queue every live document that has no chunks yet')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            requeued = DocumentIngestionJob.objects.filter(status='PROCESSING').update(status='PENDING')
+            if requeued:
+                self.stdout.write(self.style.NOTICE(f'Requeued {requeued} interrupted job(s)'))
+        if options['backfill']:
+            self.stdout.write(self.style.NOTICE(f'Queued {enqueue_backfill()} backfill job(s)'))
+
+        workers = max(options['workers'], 1)
+        pool = None
+        if workers > 1:
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        try:
+            while True:
+                started = time.monotonic()
+                if pool is None:
+                    results = [drain_queue()]
+                else:
+                    results = [future.result() for future in [pool.submit(_drain_in_worker) for _ in range(workers)]]
+                completed = sum(done for done, _ in results)
+                failed = sum(failed for _, failed in results)
+                if completed or failed:
+                    style = self.style.ERROR if failed else self.style.SUCCESS
+                    self.stdout.write(style(
+                        f'Ingested {completed} document(s), {failed} failed, '
+                        f'in {time.monotonic() - started:.2f}s'
+                    ))
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            if pool is not None:
+                pool.shutdown()
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.derivatives import claim_next_job, enqueue_backfill, process_job
+from api.models import MediaDerivativeJob
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails, WebP renditions and PDF previews for queued uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the queue instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to sleep between polls in --loop mode')
+        parser.add_argument('--resume', action='store_true',
+                            help='Requeue jobs left PROCESSING by a worker that stopped mid-run')
+        parser.add_argument('--backfill', action='store_true',
+                            help='First queue every existing photo and previewable document without derivatives')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            requeued = MediaDerivativeJob.objects.filter(status='PROCESSING').update(status='PENDING')
+            if requeued:
+                self.stdout.write(self.style.NOTICE(f'Requeued {requeued} interrupted job(s)'))
+        if options['backfill']:
+            self.stdout.write(self.style.NOTICE(f'Queued {enqueue_backfill()} backfill job(s)'))
+
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            started = time.monotonic()
+            outputs = process_job(job)
+            if outputs is None:
+                job.refresh_from_db()
+                self.stderr.write(self.style.ERROR(
+                    f'Job {job.job_id} ({job.source_path}) {job.status.lower()}: {job.error_message}'
+                ))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f'Job {job.job_id}: {len(outputs)} derivative(s) of {job.source_path} '
+                f'in {time.monotonic() - started:.2f}s'
+            ))
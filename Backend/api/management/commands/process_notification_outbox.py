@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.fanout import (
+    DEFAULT_CHUNK_SIZE, claim_next_outbox, process_outbox, requeue_stale_outbox, retry_failed_outbox,
+)
+from api.notifications import deliver_digests
+
+
+class Command(BaseCommand):
+    help = 'Expand queued notification broadcasts into per-user notifications and deliver finished daily digests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Recipients written per bulk_create batch')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to sleep between polls in --loop mode')
+        parser.add_argument('--resume', action='store_true',
+                            help='Requeue entries left PROCESSING by a worker that stopped mid-run '
+                                 '(no progress for NOTIFICATION_OUTBOX_LEASE seconds)')
+        parser.add_argument('--lease', type=int, default=None,
+                            help='Seconds without progress before --resume treats an entry as abandoned')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Requeue FAILED broadcasts; they continue from their saved cursor')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            requeued = requeue_stale_outbox(options['lease'])
+            if requeued:
+                self.stdout.write(self.style.NOTICE(f'Requeued {requeued} interrupted broadcast(s)'))
+        if options['retry_failed']:
+            retried = retry_failed_outbox()
+            if retried:
+                self.stdout.write(self.style.NOTICE(f'Requeued {retried} failed broadcast(s)'))
+
+        while True:
+            outbox = claim_next_outbox()
+            if outbox is None:
+                # Idle: hand out the digests of days that have ended.
+                delivered = deliver_digests()
+                if delivered:
+                    self.stdout.write(self.style.SUCCESS(f'Delivered {delivered} daily digest(s)'))
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            try:
+                metrics = process_outbox(outbox, chunk_size=options['chunk_size'])
+            except Exception as exc:
+                self.stderr.write(self.style.ERROR(f'Outbox {outbox.outbox_id} failed: {exc}'))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f"Outbox {metrics['outbox_id']}: {metrics['recipients']} notifications "
+                f"in {metrics['seconds']:.2f}s ({metrics['rows_per_second']:.0f} rows/s)"
+            ))
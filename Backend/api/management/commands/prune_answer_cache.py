@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api import answer_cache
+
+
+class Command(BaseCommand):
+    help = "Drop expired and least recently used entries from the assistant's answer cache and compact its index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Remove every entry and reset the hit counters')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            answer_cache.clear()
+            self.stdout.write(self.style.SUCCESS('Cleared the answer cache'))
+            return
+        removed = answer_cache.cull()
+        dropped = answer_cache.compact_index(force=True)
+        stats = answer_cache.cache_stats(top=0)
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} entries and {dropped} dead index rows; {stats['entries']} entries remain"
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.retention import DEFAULT_BATCH_SIZE, DEFAULT_SLEEP_SECONDS, POLICIES, purge
+
+
+class Command(BaseCommand):
+    help = 'Apply retention policies (SystemSetting retention.* keys) in small, resumable batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', action='append', choices=sorted(POLICIES),
+                            help='Policy to run (repeatable). Defaults to all policies.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Primary-key range (or key count) handled per transaction')
+        parser.add_argument('--sleep', type=float, default=DEFAULT_SLEEP_SECONDS,
+                            help='Seconds to pause between batches')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the rows each policy would remove')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        for name in options['policy'] or sorted(POLICIES):
+            result = purge(
+                POLICIES[name],
+                batch_size=options['batch_size'],
+                sleep=options['sleep'],
+                dry_run=options['dry_run'],
+                log=lambda message: self.stdout.write(message),
+            )
+            if result['action'] == 'DISABLED':
+                self.stdout.write(self.style.NOTICE(f'{name}: retention disabled'))
+            elif options['dry_run']:
+                self.stdout.write(f"{name}: {result['rows']} rows would be {result['action'].lower()}d")
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{name}: {result['action'].lower()}d {result['rows']} rows in {result['batches']} batches, "
+                    f"{result['seconds']:.1f}s ({result['rows_per_second']:.0f} rows/s)"
+                ))
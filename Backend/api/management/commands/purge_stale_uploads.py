@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.uploads import purge_stale_sessions, session_ttl
+
+
+class Command(BaseCommand):
+    help = 'Remove resumable upload sessions left idle past EVIDENCE_UPLOAD_SESSION_TTL, and orphaned part files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=None,
+                            help='Idle time before a session is removed (default: EVIDENCE_UPLOAD_SESSION_TTL)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+
+    def handle(self, *args, **options):
+        ttl = session_ttl() if options['hours'] is None else int(options['hours'] * 3600)
+        sessions, orphans = purge_stale_sessions(ttl, dry_run=options['dry_run'])
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {sessions} stale upload sessions and {orphans} orphaned part files'))
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.metering import rebuild_usage
+
+
+class Command(BaseCommand):
+    help = 'Recompute AIUsageDaily from the token counts stored on assistant messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Rebuild this many days back, today included (default 30)')
+
+    def handle(self, *args, **options):
+        since = timezone.now().date() - timedelta(days=max(options['days'], 1) - 1)
+        rows = rebuild_usage(since)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} daily usage row(s) since {since.isoformat()}'))
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.storage import copy_to_target, delete_file, pending_relocations, rewrite_references
+
+
+class Command(BaseCommand):
+    help = 'Move media files from the flat per-subdir layout into sharded ab/cd/ directories'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Files copied/linked in parallel')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Files per batch; references are rewritten once per batch')
+        parser.add_argument('--dry-run', action='store_true', help='List moves without making them')
+
+    def handle(self, *args, **options):
+        pending = pending_relocations()
+        moved = missing = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = list(islice(pending, options['batch_size']))
+                if not batch:
+                    break
+                if options['dry_run']:
+                    for name, target in batch:
+                        self.stdout.write(f'{name} -> {target}')
+                    moved += len(batch)
+                    continue
+
+                # Copy in parallel, repoint the database, then drop the old files.
+                results = list(pool.map(lambda item: copy_to_target(*item), batch))
+                done = [(name, stored) for (name, _), stored in zip(batch, results) if stored]
+                missing += len(batch) - len(done)
+                with transaction.atomic():
+                    for name, stored in done:
+                        rewrite_references(name, stored)
+                list(pool.map(lambda item: delete_file(item[0]), done))
+                moved += len(done)
+                self.stdout.write(f'Relocated {moved} files')
+
+        verb = 'Would relocate' if options['dry_run'] else 'Relocated'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} files ({missing} missing from storage)'))
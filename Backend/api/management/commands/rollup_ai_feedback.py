@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.feedback_rollup import batch_size, reset_rollup, run_rollup
+
+
+class Command(BaseCommand):
+    help = 'Add assistant feedback given since the last run to the per-version rollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Feedback rows per transaction (default AI_FEEDBACK_ROLLUP_BATCH)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop the rollup and its watermark first and recount all feedback')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep rolling up new feedback instead of exiting')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Seconds to sleep between runs in --loop mode')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_rollup()
+            self.stdout.write(self.style.NOTICE('Cleared the feedback rollup'))
+
+        size = options['batch_size'] or batch_size()
+        while True:
+            processed = run_rollup(size)
+            self.stdout.write(self.style.SUCCESS(f'Rolled up {processed} feedback row(s)'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
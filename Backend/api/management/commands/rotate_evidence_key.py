@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.evidence_crypto import get_keyring
+
+
+class Command(BaseCommand):
+    help = 'Add a new evidence encryption key to the keyring and make it active'
+
+    def handle(self, *args, **options):
+        key_id = get_keyring().rotate()
+        self.stdout.write(self.style.SUCCESS(f'Active evidence key is now {key_id}'))
+        self.stdout.write('Existing files keep using the key recorded in their header.')
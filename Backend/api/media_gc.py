@@ -0,0 +1,155 @@
+"""
+Garbage collection of unreferenced media files.
+
+Mark: stream every column that stores a media name (`values_list().iterator()`)
+into a set. Sweep: walk MEDIA_ROOT with os.scandir and move each file that is
+not in the set, and is older than the grace period, into
+`.quarantine/<run>/`, keeping its relative path. Nothing is deleted outright.
+Quarantined runs are removed later with `expire_quarantine`, and a wrongly
+collected file can be moved back by hand.
+
+To bound memory on trees with millions of files, names are split into
+`partitions` by CRC32. One pass marks and sweeps a single partition, so the
+referenced set only ever holds about 1/partitions of all names. That costs
+one more table scan and tree walk per extra partition. The last finished
+partition is saved in SystemSetting `media_gc.partition`, so an interrupted
+run resumes where it stopped.
+
+The grace period (SystemSetting `media_gc.grace_hours`, default 24) protects
+files whose row is not committed yet. Scratch areas with their own cleanup
+(staging, resumable upload parts) and dotfiles such as .gitkeep are never
+swept.
+"""
+import os
+import shutil
+import time
+import zlib
+from pathlib import Path
+
+from django.utils import timezone
+
+from .models import SystemSetting
+from .storage import media_name_map_fields, media_path_fields
+from .uploads import INCOMING_SUBDIR
+from .utils import get_system_setting, set_system_setting
+
+DEFAULT_GRACE_HOURS = 24
+QUARANTINE_DIR = '.quarantine'
+SKIPPED_DIRS = {QUARANTINE_DIR, '.staging', INCOMING_SUBDIR}
+CURSOR_KEY = 'media_gc.partition'
+
+
+def grace_hours():
+    value = get_system_setting('media_gc.grace_hours', DEFAULT_GRACE_HOURS)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # Admin-entered settings are STRING-typed; never shorten the grace period on a typo.
+        return DEFAULT_GRACE_HOURS
+
+
+def _partition(name, partitions):
+    return zlib.crc32(name.encode('utf-8')) % partitions if partitions > 1 else 0
+
+
+def referenced_names(partition=0, partitions=1):
+    """Every stored media name that falls into `partition`."""
+    referenced = set()
+    for model, field in media_path_fields():
+        names = model.objects.exclude(**{f'{field}__isnull': True}).values_list(field, flat=True)
+        for name in names.iterator(chunk_size=5000):
+            if name and _partition(name, partitions) == partition:
+                referenced.add(name)
+    for model, field in media_name_map_fields():
+        for mapping in model.objects.values_list(field, flat=True).iterator(chunk_size=5000):
+            for name in (mapping or {}).values():
+                if name and _partition(name, partitions) == partition:
+                    referenced.add(name)
+    return referenced
+
+
+def iter_media_files(root):
+    """Yield (relative name, DirEntry) for every file under root, skipping scratch areas and dotfiles."""
+    pending = ['']
+    while pending:
+        relative_dir = pending.pop()
+        with os.scandir(root / relative_dir if relative_dir else root) as entries:
+            for entry in entries:
+                name = f'{relative_dir}/{entry.name}' if relative_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if name not in SKIPPED_DIRS:
+                        pending.append(name)
+                elif entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                    # Dotfiles (.gitkeep and the like) are never media the app stored.
+                    yield name, entry
+
+
+def sweep_partition(root, partition, partitions, grace_seconds, run_dir, dry_run=False, log=None):
+    """Quarantine this partition's unreferenced files. Returns per-pass counters."""
+    referenced = referenced_names(partition, partitions)
+    stats = {'referenced': len(referenced), 'scanned': 0, 'recent': 0, 'orphaned': 0, 'bytes': 0}
+    cutoff = time.time() - grace_seconds
+
+    for name, entry in iter_media_files(root):
+        if _partition(name, partitions) != partition:
+            continue
+        stats['scanned'] += 1
+        if name in referenced:
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime > cutoff:
+            stats['recent'] += 1
+            continue
+        stats['orphaned'] += 1
+        stats['bytes'] += stat.st_size
+        if dry_run:
+            if log:
+                log(f'orphan: {name} ({stat.st_size} bytes)')
+            continue
+        target = root / QUARANTINE_DIR / run_dir / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(entry.path, target)
+    return stats
+
+
+def collect(root, partitions=1, grace_seconds=None, dry_run=False, log=None):
+    """Run (or resume) a full mark-and-sweep over all partitions. Returns totals."""
+    root = Path(root)
+    grace_seconds = grace_hours() * 3600 if grace_seconds is None else grace_seconds
+    saved = get_system_setting(CURSOR_KEY)
+    start = 0
+    if saved and not dry_run:
+        done, _, saved_partitions = str(saved).partition('/')
+        if saved_partitions == str(partitions):
+            start = int(done) + 1
+    run_dir = f'{timezone.now():%Y%m%d-%H%M%S}'
+
+    totals = {'partitions': partitions, 'referenced': 0, 'scanned': 0, 'recent': 0, 'orphaned': 0, 'bytes': 0}
+    for partition in range(start, partitions):
+        stats = sweep_partition(root, partition, partitions, grace_seconds, run_dir, dry_run=dry_run, log=log)
+        for key, value in stats.items():
+            totals[key] += value
+        if not dry_run:
+            set_system_setting(CURSOR_KEY, f'{partition}/{partitions}', 'STRING', 'Resume point for media GC')
+        if log:
+            log(f'partition {partition + 1}/{partitions}: {stats["orphaned"]} orphaned of {stats["scanned"]} files')
+
+    if not dry_run:
+        SystemSetting.objects.filter(setting_key=CURSOR_KEY).delete()
+    return totals
+
+
+def expire_quarantine(root, days, dry_run=False):
+    """Delete quarantine runs older than `days`. Returns the run directories removed."""
+    quarantine = Path(root) / QUARANTINE_DIR
+    if not quarantine.is_dir():
+        return []
+    cutoff = time.time() - days * 86400
+    removed = []
+    with os.scandir(quarantine) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                removed.append(entry.name)
+                if not dry_run:
+                    shutil.rmtree(entry.path)
+    return removed
@@ -0,0 +1,255 @@
+"""
+Metering and daily token quotas for the AI assistant.
+
+Every reply the gateway saves is recorded with `record_usage`. That does two
+things:
+
+- It adds the tokens to a per-user, per-day counter in the Django cache
+  (`ai_usage:<user_id>:<day>`), which quota checks read.
+- It adds them to a per-process pending total. The totals are written to
+  AIUsageDaily as `F() + n` updates once AI_USAGE_FLUSH_BATCH replies have
+  built up or AI_USAGE_FLUSH_INTERVAL seconds have passed, and at
+  interpreter exit, the same way share link hits are flushed.
+
+Quotas are SystemSettings, in tokens per user per UTC day:
+`ai.quota.daily_tokens` for everyone and `ai.quota.daily_tokens.<ROLE>`
+(e.g. `ai.quota.daily_tokens.CITIZEN`) per role. Missing or 0 means no
+limit, and staff are never limited. The settings are cached under
+`ai_quota:config` for AI_QUOTA_CONFIG_TTL seconds and dropped when a quota
+setting is saved.
+
+`check_quota` reads the config and the user's counter in one `get_many` and
+compares them. It only queries the database when either key is cold: the
+config is reloaded, or the counter is seeded from AIUsageDaily plus this
+process's unflushed total.
+
+How far a quota can be overshot depends on the cache backend:
+
+- Shared (Redis, Memcached, the database cache): every process increments
+  the same counter, which lives for two days. Only a fresh seed misses
+  usage, namely other processes' unflushed totals, so the overshoot is at
+  most one AI_USAGE_FLUSH_INTERVAL of traffic.
+- Per-process (LocMemCache, the default): each process only sees its own
+  increments between seeds. The counter then expires after
+  AI_USAGE_COUNTER_TTL seconds and is re-seeded from AIUsageDaily, which
+  picks up what the other processes have flushed since. The overshoot is at
+  most the other processes' traffic over AI_USAGE_COUNTER_TTL plus
+  AI_USAGE_FLUSH_INTERVAL. Use a shared cache where quotas must be tight.
+
+Either way, the reply that crosses a quota is served in full, since usage
+is only known after the provider answers.
+
+`rebuild_usage` recomputes AIUsageDaily from the AIMessage token columns,
+for backfills and audits. Totals that other processes have not flushed yet
+are added again when they flush, so rebuild past days, or today's only
+while the assistant is idle.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import AIMessage, AIUsageDaily, SystemSetting
+from .utils import cache_is_shared
+
+logger = logging.getLogger(__name__)
+
+QUOTA_SETTING = 'ai.quota.daily_tokens'
+CONFIG_KEY = 'ai_quota:config'
+COUNTER_TTL = 2 * 24 * 3600
+
+
+def _usage_key(user_id, day):
+    return f'ai_usage:{user_id}:{day.isoformat()}'
+
+
+def _today():
+    return timezone.now().date()
+
+
+def _counter_ttl():
+    """Shared counters last the day; per-process ones are re-seeded often to see other processes' flushes."""
+    if cache_is_shared():
+        return COUNTER_TTL
+    return getattr(settings, 'AI_USAGE_COUNTER_TTL', 30)
+
+
+class UsageMeter:
+    """Thread-safe per-process token totals, written to AIUsageDaily in batches."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(lambda: [0, 0, 0])
+        self._events = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, user_id, day, prompt_tokens, completion_tokens):
+        with self._lock:
+            totals = self._pending[(user_id, day)]
+            totals[0] += prompt_tokens
+            totals[1] += completion_tokens
+            totals[2] += 1
+            self._events += 1
+            due = (
+                self._events >= getattr(settings, 'AI_USAGE_FLUSH_BATCH', 100)
+                or time.monotonic() - self._last_flush >= getattr(settings, 'AI_USAGE_FLUSH_INTERVAL', 30)
+            )
+        if due:
+            self.flush()
+
+    def pending_tokens(self, user_id, day):
+        with self._lock:
+            totals = self._pending.get((user_id, day))
+            return totals[0] + totals[1] if totals else 0
+
+    def flush(self):
+        """Write pending totals, one UPDATE (or INSERT) per user and day. Returns rows written."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: [0, 0, 0])
+            self._events = 0
+            self._last_flush = time.monotonic()
+        written = 0
+        for (user_id, day), (prompt_tokens, completion_tokens, requests) in pending.items():
+            try:
+                _write_usage(user_id, day, prompt_tokens, completion_tokens, requests)
+            except Exception:
+                # Keep the totals for the next flush rather than failing the reply.
+                logger.exception('Failed to flush AI usage')
+                with self._lock:
+                    totals = self._pending[(user_id, day)]
+                    totals[0] += prompt_tokens
+                    totals[1] += completion_tokens
+                    totals[2] += requests
+                    self._events += 1
+                continue
+            written += 1
+        return written
+
+
+def _write_usage(user_id, day, prompt_tokens, completion_tokens, requests):
+    increments = {
+        'prompt_tokens': F('prompt_tokens') + prompt_tokens,
+        'completion_tokens': F('completion_tokens') + completion_tokens,
+        'requests': F('requests') + requests,
+        'updated_at': timezone.now(),
+    }
+    if AIUsageDaily.objects.filter(user_id=user_id, day=day).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            AIUsageDaily.objects.create(
+                user_id=user_id, day=day, prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens, requests=requests,
+            )
+    except IntegrityError:
+        # Another process created the row first.
+        AIUsageDaily.objects.filter(user_id=user_id, day=day).update(**increments)
+
+
+usage_meter = UsageMeter()
+atexit.register(usage_meter.flush)
+
+
+def _seed_counter(user_id, day):
+    """Warm the cache counter from the database plus this process's unflushed tokens."""
+    row = AIUsageDaily.objects.filter(user_id=user_id, day=day).values_list('prompt_tokens', 'completion_tokens').first()
+    used = (sum(row) if row else 0) + usage_meter.pending_tokens(user_id, day)
+    if not cache.add(_usage_key(user_id, day), used, timeout=_counter_ttl()):
+        return cache.get(_usage_key(user_id, day), used)
+    return used
+
+
+def record_usage(user_id, prompt_tokens, completion_tokens):
+    """Meter one reply; call after it is saved."""
+    day = _today()
+    prompt_tokens = prompt_tokens or 0
+    completion_tokens = completion_tokens or 0
+    usage_meter.add(user_id, day, prompt_tokens, completion_tokens)
+    try:
+        cache.incr(_usage_key(user_id, day), prompt_tokens + completion_tokens)
+    except ValueError:
+        # Cold counter: the seed already includes the pending tokens just added.
+        _seed_counter(user_id, day)
+
+
+def _load_quota_config():
+    config = {}
+    rows = SystemSetting.objects.filter(setting_key__startswith=QUOTA_SETTING).values_list('setting_key', 'setting_value')
+    for key, value in rows:
+        try:
+            limit = int(value)
+        except (TypeError, ValueError):
+            continue
+        config['default' if key == QUOTA_SETTING else key[len(QUOTA_SETTING) + 1:].upper()] = limit
+    cache.set(CONFIG_KEY, config, getattr(settings, 'AI_QUOTA_CONFIG_TTL', 300))
+    return config
+
+
+def invalidate_quota_config():
+    cache.delete(CONFIG_KEY)
+
+
+def _limit(user, config):
+    if user.is_staff:
+        return None
+    return config.get(user.role, config.get('default')) or None
+
+
+def check_quota(user):
+    """(allowed, used today, daily limit or None). One cache round trip when warm."""
+    day = _today()
+    key = _usage_key(user.pk, day)
+    cached = cache.get_many([CONFIG_KEY, key])
+    config = cached.get(CONFIG_KEY)
+    if config is None:
+        config = _load_quota_config()
+    limit = _limit(user, config)
+    used = cached.get(key)
+    if used is None:
+        used = _seed_counter(user.pk, day) if limit else None
+    return (limit is None or used < limit), used, limit
+
+
+def usage_summary(user):
+    allowed, used, limit = check_quota(user)
+    if used is None:
+        used = _seed_counter(user.pk, _today())
+    return {
+        'day': _today().isoformat(),
+        'used_tokens': used,
+        'daily_limit': limit,
+        'remaining_tokens': max(limit - used, 0) if limit else None,
+        'allowed': allowed,
+    }
+
+
+def rebuild_usage(since):
+    """Recompute AIUsageDaily rows from `since` (a date) from the AIMessage token columns."""
+    usage_meter.flush()
+    rows = (
+        AIMessage.objects.filter(sender_role='ASSISTANT', created_at__date__gte=since)
+        .annotate(day=TruncDate('created_at'))
+        .values('conversation__user_id', 'day')
+        .annotate(prompt=Sum('prompt_tokens'), completion=Sum('completion_tokens'), replies=Count('message_id'))
+    )
+    rebuilt = [
+        AIUsageDaily(
+            user_id=row['conversation__user_id'], day=row['day'],
+            prompt_tokens=row['prompt'] or 0, completion_tokens=row['completion'] or 0,
+            requests=row['replies'],
+        )
+        for row in rows.iterator()
+    ]
+    with transaction.atomic():
+        AIUsageDaily.objects.filter(day__gte=since).delete()
+        AIUsageDaily.objects.bulk_create(rebuilt, batch_size=1000)
+    cache.delete_many([_usage_key(usage.user_id, usage.day) for usage in rebuilt])
+    return len(rebuilt)
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 16:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_remove_payment_invoice_remove_payout_lawyer_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('outbox_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('audience', models.CharField(choices=[('USERS', 'Explicit Users'), ('ROLE', 'Role'), ('CASE', 'Case Parties'), ('ALL', 'All Users')], max_length=20)),
+                ('audience_value', models.CharField(blank=True, max_length=100, null=True)),
+                ('recipient_ids', models.JSONField(blank=True, null=True)),
+                ('type', models.CharField(choices=[('CASE_UPDATE', 'Case Update'), ('BOOKING', 'Booking'), ('SYSTEM', 'System'), ('REMINDER', 'Reminder'), ('MESSAGE', 'Message')], max_length=20)),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('metadata_json', models.JSONField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('cursor', models.CharField(blank=True, max_length=64, null=True)),
+                ('recipients_processed', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'notification_outbox',
+                'indexes': [models.Index(fields=['status', 'outbox_id'], name='notificatio_status_a65940_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 16:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_notification_coalescing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseActivityArchiveIndex',
+            fields=[
+                ('index_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('month', models.DateField()),
+                ('segment_path', models.CharField(max_length=255)),
+                ('byte_offset', models.BigIntegerField()),
+                ('byte_length', models.BigIntegerField()),
+                ('row_count', models.IntegerField()),
+                ('min_log_id', models.BigIntegerField()),
+                ('max_log_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('case', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.case')),
+            ],
+            options={
+                'db_table': 'case_activity_archive_index',
+                'indexes': [models.Index(fields=['case', 'max_log_id'], name='case_activi_case_id_a9ce7a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_stored_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedblob',
+            name='encryption_key_id',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-19 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_evidence_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='citizenprofile',
+            name='photo_derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='evidencedocument',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='lawyerprofile',
+            name='photo_derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.CreateModel(
+            name='MediaDerivativeJob',
+            fields=[
+                ('job_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('source', models.CharField(choices=[('PROFILE_PHOTO', 'Profile Photo'), ('EVIDENCE', 'Evidence Preview')], max_length=20)),
+                ('source_path', models.CharField(max_length=512)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'media_derivative_jobs',
+                'indexes': [models.Index(fields=['status', 'job_id'], name='media_deriv_status_5c215e_idx')],
+            },
+        ),
+    ]
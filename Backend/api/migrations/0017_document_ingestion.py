@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-19 16:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_media_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentIngestionJob',
+            fields=[
+                ('job_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'document_ingestion_jobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='aidocumentchunk',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='aidocumentchunk',
+            name='token_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='aidocumentchunk',
+            index=models.Index(fields=['document', 'chunk_index'], name='ai_document_documen_1c72df_idx'),
+        ),
+        migrations.AddField(
+            model_name='documentingestionjob',
+            name='document',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.evidencedocument'),
+        ),
+        migrations.AddIndex(
+            model_name='documentingestionjob',
+            index=models.Index(fields=['status', 'job_id'], name='document_in_status_656ade_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_document_ingestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIAnswerCacheEntry',
+            fields=[
+                ('entry_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('cache_key', models.CharField(max_length=64, unique=True)),
+                ('question', models.TextField()),
+                ('language', models.CharField(max_length=8)),
+                ('template_version', models.IntegerField()),
+                ('answer', models.TextField()),
+                ('model_version', models.CharField(blank=True, max_length=50, null=True)),
+                ('prompt_tokens', models.IntegerField(default=0)),
+                ('completion_tokens', models.IntegerField(default=0)),
+                ('hit_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'ai_answer_cache',
+            },
+        ),
+    ]
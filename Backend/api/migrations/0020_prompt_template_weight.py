@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-19 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_conversation_context'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiprompttemplate',
+            name='weight',
+            field=models.PositiveIntegerField(default=100),
+        ),
+        migrations.AddIndex(
+            model_name='aiprompttemplate',
+            index=models.Index(fields=['feature_key', 'is_active'], name='ai_prompt_t_feature_036185_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-19 16:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_prompt_template_weight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIUsageDaily',
+            fields=[
+                ('usage_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('prompt_tokens', models.BigIntegerField(default=0)),
+                ('completion_tokens', models.BigIntegerField(default=0)),
+                ('requests', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ai_usage_daily',
+                'indexes': [models.Index(fields=['day'], name='ai_usage_da_day_c1fd30_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='aiusagedaily',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='ai_usage_daily_user_day'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-19 16:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_ai_usage_daily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIFeedbackRollup',
+            fields=[
+                ('rollup_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('model_version', models.CharField(blank=True, default='', max_length=50)),
+                ('template_version', models.IntegerField(blank=True, null=True)),
+                ('feedback_count', models.IntegerField(default=0)),
+                ('thumbs_up', models.IntegerField(default=0)),
+                ('unsafe_count', models.IntegerField(default=0)),
+                ('inaccurate_count', models.IntegerField(default=0)),
+                ('scored_count', models.IntegerField(default=0)),
+                ('brier_sum', models.FloatField(default=0.0)),
+                ('calibration', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ai_feedback_rollups',
+            },
+        ),
+        migrations.AddField(
+            model_name='aimessage',
+            name='prompt_template_version',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='aifeedback',
+            index=models.Index(fields=['created_at', 'feedback_id'], name='ai_feedback_created_15dc99_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aifeedbackrollup',
+            index=models.Index(fields=['day', 'model_version', 'template_version'], name='ai_feedback_day_d13342_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max
+
+
+def release_duplicate_coalesce_keys(apps, schema_editor):
+    # Keep the key on the newest row of each (user, key); older rows could no longer take events anyway.
+    Notification = apps.get_model('api', 'Notification')
+    newest = (
+        Notification.objects.exclude(coalesce_key=None)
+        .values('user_id', 'coalesce_key').annotate(rows=Count('notification_id'), keep=Max('notification_id'))
+        .filter(rows__gt=1)
+    )
+    for group in newest.iterator():
+        Notification.objects.filter(user_id=group['user_id'], coalesce_key=group['coalesce_key']).exclude(
+            notification_id=group['keep'],
+        ).update(coalesce_key=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_outbox_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDigest',
+            fields=[
+                ('digest_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('event_count', models.IntegerField(default=0)),
+                ('summary', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'notification_digests',
+            },
+        ),
+        migrations.RunPython(release_duplicate_coalesce_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('user', 'coalesce_key'), name='notification_coalesce_key_unique'),
+        ),
+        migrations.AddField(
+            model_name='notificationdigest',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='notificationdigest',
+            index=models.Index(fields=['day', 'digest_id'], name='notificatio_day_b56baf_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='notificationdigest',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='notification_digest_user_day_unique'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:17
+
+from django.db import migrations, models
+from django.db.models import Count
+
+COUNTERS = ['feedback_count', 'thumbs_up', 'unsafe_count', 'inaccurate_count', 'scored_count', 'brier_sum']
+
+
+def merge_duplicate_groups(apps, schema_editor):
+    # Unknown template versions become -1, then rows sharing a group key are folded into the oldest.
+    AIFeedbackRollup = apps.get_model('api', 'AIFeedbackRollup')
+    AIFeedbackRollup.objects.filter(template_version=None).update(template_version=-1)
+    duplicates = (
+        AIFeedbackRollup.objects.values('day', 'model_version', 'template_version')
+        .annotate(rows=Count('rollup_id')).filter(rows__gt=1)
+    )
+    for group in duplicates.iterator():
+        rows = list(AIFeedbackRollup.objects.filter(
+            day=group['day'], model_version=group['model_version'], template_version=group['template_version'],
+        ).order_by('rollup_id'))
+        keep = rows[0]
+        for row in rows[1:]:
+            for field in COUNTERS:
+                setattr(keep, field, getattr(keep, field) + getattr(row, field))
+            for key, values in row.calibration.items():
+                current = keep.calibration.get(key, [0, 0, 0.0])
+                keep.calibration[key] = [a + b for a, b in zip(current, values)]
+        keep.save()
+        AIFeedbackRollup.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+
+def restore_null_template_versions(apps, schema_editor):
+    AIFeedbackRollup = apps.get_model('api', 'AIFeedbackRollup')
+    AIFeedbackRollup.objects.filter(template_version=-1).update(template_version=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_notification_digests'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_groups, restore_null_template_versions),
+        migrations.RemoveIndex(
+            model_name='aifeedbackrollup',
+            name='ai_feedback_day_d13342_idx',
+        ),
+        migrations.AlterField(
+            model_name='aifeedbackrollup',
+            name='template_version',
+            field=models.IntegerField(default=-1),
+        ),
+        migrations.AddConstraint(
+            model_name='aifeedbackrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'model_version', 'template_version'), name='ai_feedback_rollup_group'),
+        ),
+    ]
@@ -38,6 +38,10 @@ class User(AbstractBaseUser, PermissionsMixin):
         ('BN', 'Bangla'),
         ('EN', 'English'),
     )
+    NOTIFICATION_MODE_CHOICES = (
+        ('IMMEDIATE', 'Immediate'),
+        ('DAILY_DIGEST', 'Daily Digest'),
+    )
 
     user_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     email = models.EmailField(unique=True, max_length=255)
@@ -46,6 +50,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=False)
     is_verified = models.BooleanField(default=False)
     language_preference = models.CharField(max_length=2, choices=LANGUAGE_CHOICES, default='BN')
+    notification_mode = models.CharField(max_length=20, choices=NOTIFICATION_MODE_CHOICES, default='IMMEDIATE')
     two_factor_enabled = models.BooleanField(default=False)
     two_factor_secret = models.CharField(max_length=255, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -85,6 +90,7 @@ class CitizenProfile(models.Model):
     geo_division = models.CharField(max_length=50, null=True, blank=True)
     geo_district = models.CharField(max_length=50, null=True, blank=True)
     profile_photo_url = models.CharField(max_length=512, null=True, blank=True)
+    photo_derivatives = models.JSONField(default=dict, blank=True)
     identity_document_url = models.CharField(max_length=512, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -113,6 +119,7 @@ class LawyerProfile(models.Model):
     geo_longitude = models.DecimalField(max_digits=11, decimal_places=8, null=True, blank=True)
     verification_status = models.CharField(max_length=20, choices=VERIFICATION_STATUS_CHOICES, default='PENDING')
     profile_photo_url = models.CharField(max_length=512, null=True, blank=True)
+    photo_derivatives = models.JSONField(default=dict, blank=True)
     verification_document_url = models.CharField(max_length=512, null=True, blank=True)
     identity_document_url = models.CharField(max_length=512, null=True, blank=True)
     consultation_fee_online = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -218,6 +225,23 @@ class CaseActivityLog(models.Model):
     class Meta:
         db_table = 'case_activity_log'
 
+class CaseActivityArchiveIndex(models.Model):
+    """Where archived CaseActivityLog rows for one case and month live on disk."""
+    index_id = models.BigAutoField(primary_key=True)
+    case = models.ForeignKey(Case, on_delete=models.CASCADE)
+    month = models.DateField()
+    segment_path = models.CharField(max_length=255)
+    byte_offset = models.BigIntegerField()
+    byte_length = models.BigIntegerField()
+    row_count = models.IntegerField()
+    min_log_id = models.BigIntegerField()
+    max_log_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'case_activity_archive_index'
+        indexes = [models.Index(fields=['case', 'max_log_id'])]
+
 class CasePrivateNote(models.Model):
     VISIBILITY_CHOICES = (
         ('PRIVATE', 'Private'),
@@ -235,6 +259,18 @@ class CasePrivateNote(models.Model):
     class Meta:
         db_table = 'case_private_notes'
 
+class StoredBlob(models.Model):
+    """A content-addressed file under MEDIA_ROOT shared by every document with the same bytes."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    storage_path = models.CharField(max_length=512)
+    size_bytes = models.BigIntegerField()
+    encryption_key_id = models.CharField(max_length=100, blank=True, default='')
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'stored_blobs'
+
 class EvidenceDocument(models.Model):
     document_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     case = models.ForeignKey(Case, on_delete=models.CASCADE)
@@ -245,12 +281,36 @@ class EvidenceDocument(models.Model):
     mime_type = models.CharField(max_length=100)
     encryption_hash = models.CharField(max_length=64, blank=True, default='')
     encryption_key_id = models.CharField(max_length=100, blank=True, default='')
+    derivatives = models.JSONField(default=dict, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'evidence_documents'
 
+class EvidenceUploadSession(models.Model):
+    """A resumable evidence upload; bytes are appended to a part file until finalized."""
+    STATUS_CHOICES = (
+        ('UPLOADING', 'Uploading'),
+        ('COMPLETED', 'Completed'),
+    )
+
+    upload_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    case = models.ForeignKey(Case, on_delete=models.CASCADE)
+    uploader = models.ForeignKey(User, on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=255)
+    mime_type = models.CharField(max_length=100)
+    total_size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='UPLOADING')
+    document = models.ForeignKey(EvidenceDocument, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'evidence_upload_sessions'
+        indexes = [models.Index(fields=['status', 'updated_at'])]
+
 class DocumentShareToken(models.Model):
     token_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     document = models.ForeignKey(EvidenceDocument, on_delete=models.CASCADE)
@@ -269,6 +329,9 @@ class AIConversation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=255, null=True, blank=True)
     context_window_usage = models.IntegerField(default=0)
+    # Rolling SYSTEM summary of the messages up to summarized_through (see api/context_window.py)
+    summary_message = models.ForeignKey('AIMessage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    summarized_through = models.BigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -291,10 +354,13 @@ class AIMessage(models.Model):
     completion_tokens = models.IntegerField(null=True, blank=True)
     confidence_score = models.FloatField(null=True, blank=True)
     citations = models.JSONField(null=True, blank=True)
+    # AIPromptTemplate.version the reply was generated with (0: the built-in prompt)
+    prompt_template_version = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'ai_messages'
+        indexes = [models.Index(fields=['conversation', 'message_id'])]
 
 class AIPromptTemplate(models.Model):
     template_id = models.AutoField(primary_key=True)
@@ -302,11 +368,14 @@ class AIPromptTemplate(models.Model):
     template_text = models.TextField()
     version = models.IntegerField(default=1)
     is_active = models.BooleanField(default=True)
+    # Share of traffic among the feature's active versions (see api/prompt_registry.py)
+    weight = models.PositiveIntegerField(default=100)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'ai_prompt_templates'
+        indexes = [models.Index(fields=['feature_key', 'is_active'])]
 
 class AIDocumentChunk(models.Model):
     chunk_id = models.BigAutoField(primary_key=True)
@@ -314,10 +383,13 @@ class AIDocumentChunk(models.Model):
     chunk_index = models.IntegerField()
     content_text = models.TextField()
     vector_id = models.CharField(max_length=255, null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    token_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'ai_document_chunks'
+        indexes = [models.Index(fields=['document', 'chunk_index'])]
 
 class AIFeedback(models.Model):
     USER_RATING_CHOICES = (
@@ -340,6 +412,8 @@ class AIFeedback(models.Model):
 
     class Meta:
         db_table = 'ai_feedback'
+        # Keyset order of the feedback rollup (api/feedback_rollup.py)
+        indexes = [models.Index(fields=['created_at', 'feedback_id'])]
 
 class LawyerAvailabilitySlot(models.Model):
     BOOKING_TYPE_CHOICES = (
@@ -402,10 +476,94 @@ class Notification(models.Model):
     body = models.TextField()
     is_read = models.BooleanField(default=False)
     metadata_json = models.JSONField(null=True, blank=True)
+    coalesce_key = models.CharField(max_length=150, null=True, blank=True)
+    coalesced_count = models.IntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'notifications'
+        indexes = [models.Index(fields=['user', 'coalesce_key', 'is_read'])]
+        # At most one row per user holds a coalesce key; rows that stop taking events give it up (NULL).
+        constraints = [models.UniqueConstraint(fields=['user', 'coalesce_key'], name='notification_coalesce_key_unique')]
+
+
+class NotificationDigest(models.Model):
+    """Coalescible events held back for a DAILY_DIGEST user until their day is over (see api/notifications.py)."""
+    digest_id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    day = models.DateField()
+    event_count = models.IntegerField(default=0)
+    summary = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'notification_digests'
+        constraints = [models.UniqueConstraint(fields=['user', 'day'], name='notification_digest_user_day_unique')]
+        indexes = [models.Index(fields=['day', 'digest_id'])]
+
+class NotificationOutbox(models.Model):
+    AUDIENCE_CHOICES = (
+        ('USERS', 'Explicit Users'),
+        ('ROLE', 'Role'),
+        ('CASE', 'Case Parties'),
+        ('ALL', 'All Users'),
+    )
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    )
+
+    outbox_id = models.BigAutoField(primary_key=True)
+    audience = models.CharField(max_length=20, choices=AUDIENCE_CHOICES)
+    audience_value = models.CharField(max_length=100, null=True, blank=True)
+    recipient_ids = models.JSONField(null=True, blank=True)
+    type = models.CharField(max_length=20, choices=Notification.TYPE_CHOICES)
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    metadata_json = models.JSONField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    cursor = models.CharField(max_length=64, null=True, blank=True)
+    recipients_processed = models.IntegerField(default=0)
+    error_message = models.TextField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    # Renewed by the worker after every chunk; a PROCESSING row whose lease ran out has no live worker
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'notification_outbox'
+        indexes = [models.Index(fields=['status', 'outbox_id'])]
+
+class MediaDerivativeJob(models.Model):
+    """Queued generation of thumbnails/previews for one stored file (see api/derivatives.py)."""
+    SOURCE_CHOICES = (
+        ('PROFILE_PHOTO', 'Profile Photo'),
+        ('EVIDENCE', 'Evidence Preview'),
+    )
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    )
+
+    job_id = models.BigAutoField(primary_key=True)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    source_path = models.CharField(max_length=512)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    error_message = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'media_derivative_jobs'
+        indexes = [models.Index(fields=['status', 'job_id'])]
 
 class ChatMessage(models.Model):
     message_id = models.BigAutoField(primary_key=True)
@@ -451,4 +609,82 @@ class SystemSetting(models.Model):
     class Meta:
         db_table = 'system_settings'
 
+class DocumentIngestionJob(models.Model):
+    """Queued text extraction and chunking of one evidence document (see api/ingestion.py)."""
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    )
+
+    job_id = models.BigAutoField(primary_key=True)
+    document = models.ForeignKey(EvidenceDocument, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    chunk_count = models.IntegerField(default=0)
+    error_message = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'document_ingestion_jobs'
+        indexes = [models.Index(fields=['status', 'job_id'])]
+
+class AIAnswerCacheEntry(models.Model):
+    """A stored assistant answer to a general question (see api/answer_cache.py)."""
+    entry_id = models.BigAutoField(primary_key=True)
+    cache_key = models.CharField(max_length=64, unique=True)
+    question = models.TextField()
+    language = models.CharField(max_length=8)
+    template_version = models.IntegerField()
+    answer = models.TextField()
+    model_version = models.CharField(max_length=50, null=True, blank=True)
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    class Meta:
+        db_table = 'ai_answer_cache'
+
+class AIUsageDaily(models.Model):
+    """Tokens a user spent on the AI assistant in one day (written by api/metering.py)."""
+    usage_id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    day = models.DateField()
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    requests = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ai_usage_daily'
+        constraints = [models.UniqueConstraint(fields=['user', 'day'], name='ai_usage_daily_user_day')]
+        indexes = [models.Index(fields=['day'])]
+
+class AIFeedbackRollup(models.Model):
+    """Daily AIFeedback totals per model and prompt template version (see api/feedback_rollup.py)."""
+    UNKNOWN_TEMPLATE_VERSION = -1
+
+    rollup_id = models.BigAutoField(primary_key=True)
+    day = models.DateField()
+    model_version = models.CharField(max_length=50, blank=True, default='')
+    # UNKNOWN_TEMPLATE_VERSION rather than NULL, so the group key below stays unique on MySQL
+    template_version = models.IntegerField(default=UNKNOWN_TEMPLATE_VERSION)
+    feedback_count = models.IntegerField(default=0)
+    thumbs_up = models.IntegerField(default=0)
+    unsafe_count = models.IntegerField(default=0)
+    inaccurate_count = models.IntegerField(default=0)
+    scored_count = models.IntegerField(default=0)
+    brier_sum = models.FloatField(default=0.0)
+    # Confidence decile -> [feedback count, thumbs up, sum of confidence]
+    calibration = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ai_feedback_rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'model_version', 'template_version'], name='ai_feedback_rollup_group'),
+        ]
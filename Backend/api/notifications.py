@@ -0,0 +1,229 @@
+"""
+Notification coalescing and daily digests.
+
+`notify` is the single entry point for creating notifications, and
+`notify_many` its bulk form for broadcasts. Bursty types
+(NOTIFICATION_COALESCE_TYPES) are merged per (user, type, case) into the
+still-unread row written inside the last NOTIFICATION_COALESCE_WINDOW
+seconds: the row keeps the latest title/body and counts how many events it
+stands for.
+
+The row that takes a (user, type, case)'s events holds its coalesce_key,
+which is unique per user. A row that has been read or has left the window
+gives the key up (NULL) when the next event opens a new row. Two workers
+racing to open the same row therefore cannot both insert it: the loser gets
+an IntegrityError and retries, merging into the winner's row.
+
+Users in DAILY_DIGEST mode get nothing visible during the day. Their
+coalescible events are counted in one NotificationDigest per (user, day),
+and `deliver_digests` (run by the outbox worker) turns each finished day
+into a single notification.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationDigest
+from .unread import NOTIFICATIONS, invalidate_unread_counts
+
+DIGEST_TITLE = 'Your daily digest'
+DIGEST_BATCH_SIZE = 500
+MERGED_FIELDS = ['title', 'body', 'coalesced_count', 'metadata_json', 'updated_at']
+
+
+def coalesce_types():
+    return getattr(settings, 'NOTIFICATION_COALESCE_TYPES', ('CASE_UPDATE', 'MESSAGE'))
+
+
+def _coalesce_window():
+    return getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 900)
+
+
+def case_id_from_metadata(metadata):
+    """Pull the case reference out of metadata_json, whichever key the caller used."""
+    if not isinstance(metadata, dict):
+        return None
+    for key in ('case_id', 'caseId', 'case'):
+        if metadata.get(key):
+            return str(metadata[key])
+    return None
+
+
+def coalesce_key_for(type, metadata):
+    return f"{type}:{case_id_from_metadata(metadata) or '-'}"
+
+
+def _is_open(row, since):
+    return not row.is_read and row.updated_at >= since
+
+
+def _merge(row, title, body, metadata):
+    row.title = title
+    row.body = body
+    row.coalesced_count += 1
+    row.metadata_json = metadata
+    row.updated_at = timezone.now()
+
+
+def _upsert(user_id, key, since, title, body, type, metadata):
+    """Fold the event into the open row for key, or insert a new one."""
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                row = Notification.objects.select_for_update().filter(user_id=user_id, coalesce_key=key).first()
+                if row is not None and _is_open(row, since):
+                    _merge(row, title, body, metadata)
+                    row.save(update_fields=MERGED_FIELDS)
+                    return row
+                if row is not None:
+                    Notification.objects.filter(pk=row.pk).update(coalesce_key=None)
+                return Notification.objects.create(
+                    user_id=user_id, type=type, title=title, body=body,
+                    metadata_json=metadata, coalesce_key=key,
+                )
+        except IntegrityError:
+            # Another worker opened the row between our read and insert; merge into theirs.
+            if attempt:
+                raise
+
+
+def _coalesce_many(user_ids, key, since, title, body, type, metadata):
+    """_upsert for many users: one locking read, one bulk_update, one bulk_create."""
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                rows = Notification.objects.select_for_update().filter(user_id__in=user_ids, coalesce_key=key)
+                merged, released = [], []
+                for row in rows:
+                    (merged if _is_open(row, since) else released).append(row)
+                for row in merged:
+                    _merge(row, title, body, metadata)
+                Notification.objects.bulk_update(merged, MERGED_FIELDS)
+                Notification.objects.filter(pk__in=[row.pk for row in released]).update(coalesce_key=None)
+                has_row = {row.user_id for row in merged}
+                Notification.objects.bulk_create([
+                    Notification(user_id=user_id, type=type, title=title, body=body,
+                                 metadata_json=metadata, coalesce_key=key)
+                    for user_id in user_ids if user_id not in has_row
+                ])
+                return
+        except IntegrityError:
+            # A concurrent notify() opened a row for one of the users; the retry merges into it.
+            if attempt:
+                raise
+
+
+def _add_to_digests(user_ids, type, title, metadata):
+    """Count one event in today's digest of every user; returns the digest rows."""
+    day = timezone.localdate()
+    case_id = case_id_from_metadata(metadata)
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                existing = {
+                    digest.user_id: digest
+                    for digest in NotificationDigest.objects.select_for_update().filter(user_id__in=user_ids, day=day)
+                }
+                created = [
+                    NotificationDigest(user_id=user_id, day=day, summary={'counts_by_type': {}, 'case_ids': []})
+                    for user_id in user_ids if user_id not in existing
+                ]
+                digests = list(existing.values()) + created
+                for digest in digests:
+                    counts = digest.summary.setdefault('counts_by_type', {})
+                    counts[type] = counts.get(type, 0) + 1
+                    case_ids = digest.summary.setdefault('case_ids', [])
+                    if case_id and case_id not in case_ids:
+                        case_ids.append(case_id)
+                    digest.summary['latest'] = {'type': type, 'title': title}
+                    digest.event_count += 1
+                    digest.updated_at = timezone.now()
+                NotificationDigest.objects.bulk_update(list(existing.values()), ['summary', 'event_count', 'updated_at'])
+                NotificationDigest.objects.bulk_create(created)
+                return digests
+        except IntegrityError:
+            # Another worker started one of these digests first; the retry updates it.
+            if attempt:
+                raise
+
+
+def notify(user, type, title, body, metadata=None, notification_mode=None):
+    """
+    Create a notification for user, merging it into an open coalesced row when allowed.
+    Returns the row that now represents the event: a Notification, or the
+    NotificationDigest that holds it back for a DAILY_DIGEST user.
+    """
+    user_id = getattr(user, 'pk', user)
+    if type not in coalesce_types():
+        return Notification.objects.create(
+            user_id=user_id, type=type, title=title, body=body, metadata_json=metadata,
+        )
+
+    if notification_mode is None:
+        notification_mode = getattr(user, 'notification_mode', None)
+    if notification_mode == 'DAILY_DIGEST':
+        return _add_to_digests([user_id], type, title, metadata)[0]
+
+    since = timezone.now() - timedelta(seconds=_coalesce_window())
+    return _upsert(user_id, coalesce_key_for(type, metadata), since, title, body, type, metadata)
+
+
+def notify_many(recipients, type, title, body, metadata=None):
+    """
+    `notify` for many users at once; recipients are (user_id, notification_mode)
+    pairs. A handful of bulk statements per call, whatever the number of users.
+    bulk_create skips post_save, so callers must invalidate the unread counters.
+    """
+    user_ids = [user_id for user_id, _ in recipients]
+    if type not in coalesce_types():
+        Notification.objects.bulk_create([
+            Notification(user_id=user_id, type=type, title=title, body=body, metadata_json=metadata)
+            for user_id in user_ids
+        ])
+        return
+    digest_ids = [user_id for user_id, mode in recipients if mode == 'DAILY_DIGEST']
+    immediate_ids = [user_id for user_id, mode in recipients if mode != 'DAILY_DIGEST']
+    if digest_ids:
+        _add_to_digests(digest_ids, type, title, metadata)
+    if immediate_ids:
+        since = timezone.now() - timedelta(seconds=_coalesce_window())
+        _coalesce_many(immediate_ids, coalesce_key_for(type, metadata), since, title, body, type, metadata)
+
+
+def _digest_body(digest):
+    labels = dict(Notification.TYPE_CHOICES)
+    counts = digest.summary.get('counts_by_type') or {}
+    parts = ', '.join(f'{labels.get(type, type)}: {count}' for type, count in sorted(counts.items()))
+    body = f'{digest.event_count} update(s) on {digest.day.isoformat()} ({parts}).'
+    latest = digest.summary.get('latest')
+    if latest:
+        body += f" Latest: {latest['title']}"
+    return body
+
+
+def deliver_digests(today=None):
+    """Turn the digests of days before `today` into one notification each. Returns how many were delivered."""
+    today = today or timezone.localdate()
+    delivered = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                NotificationDigest.objects.select_for_update(skip_locked=True)
+                .filter(day__lt=today).order_by('day', 'digest_id')[:DIGEST_BATCH_SIZE]
+            )
+            if not batch:
+                break
+            Notification.objects.bulk_create([
+                Notification(
+                    user_id=digest.user_id, type='SYSTEM', title=DIGEST_TITLE, body=_digest_body(digest),
+                    metadata_json=dict(digest.summary, day=digest.day.isoformat()),
+                    coalesced_count=digest.event_count,
+                )
+                for digest in batch
+            ])
+            NotificationDigest.objects.filter(pk__in=[digest.pk for digest in batch]).delete()
+        invalidate_unread_counts([digest.user_id for digest in batch], NOTIFICATIONS)
+        delivered += len(batch)
+    return delivered
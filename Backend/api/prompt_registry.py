@@ -0,0 +1,230 @@
+"""
+Process-local registry of the active AIPromptTemplate versions.
+
+Each process keeps every active template compiled in memory. A template is
+split once into literal text and `$name` placeholders (string.Template
+syntax; `$$` is a literal dollar), so rendering only joins strings.
+Placeholders with no value are left as written.
+
+Cross-worker invalidation goes through a generation counter in the Django
+cache. Anything that changes templates bumps it after its transaction
+commits. Each request compares the counter with the generation the process
+loaded, and reloads (one query) only when they differ. The request path
+therefore costs one cache read and never touches the database. The registry
+also reloads once it is PROMPT_REGISTRY_TTL seconds old, which bounds
+staleness when the cache is per-process (LocMemCache) or has lost the key.
+
+A feature can have several active versions. Each one's `weight` is its
+share of traffic. A subject (the user) is hashed onto the cumulative
+weights, so the same user keeps seeing the same variant for as long as the
+split is unchanged. `promote`, `split` and `rollback` rewrite the active set
+of a feature in a single transaction. The active set they replace is kept
+in the SystemSetting `prompt_registry.<feature_key>.previous`, which is what
+`rollback` restores; a second rollback undoes the first.
+"""
+import hashlib
+import random
+import string
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal
+
+from .models import AIPromptTemplate
+from .utils import get_system_setting, set_system_setting
+
+GENERATION_KEY = 'prompt_registry:generation'
+
+# Sent after commit whenever a feature's templates change; `version` is the edited version, if one was.
+templates_changed = Signal()
+
+Variant = namedtuple('Variant', ['version', 'weight', 'template', 'template_id'])
+
+
+class CompiledTemplate:
+    """Template text pre-split into literals and placeholder names."""
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = []  # literal strings, and (name,) tuples for placeholders
+        position = 0
+        for match in string.Template.pattern.finditer(text):
+            if match.start() > position:
+                self.parts.append(text[position:match.start()])
+            name = match.group('named') or match.group('braced')
+            if name:
+                self.parts.append((name,))
+            elif match.group('escaped') is not None:
+                self.parts.append('$')
+            else:
+                self.parts.append(match.group(0))
+            position = match.end()
+        self.parts.append(text[position:])
+        self.names = {part[0] for part in self.parts if isinstance(part, tuple)}
+
+    def render(self, values=None):
+        if not self.names:
+            return self.text
+        values = values or {}
+        return ''.join(
+            part if isinstance(part, str) else str(values.get(part[0], f'${part[0]}'))
+            for part in self.parts
+        )
+
+
+def _ttl():
+    return getattr(settings, 'PROMPT_REGISTRY_TTL', 300)
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
+
+
+def bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        if not cache.add(GENERATION_KEY, 2, timeout=None):
+            cache.incr(GENERATION_KEY)
+
+
+class PromptRegistry:
+    def __init__(self):
+        self._features = {}
+        self._defaults = {}
+        self._generation = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self, generation):
+        features = {}
+        rows = (
+            AIPromptTemplate.objects.filter(is_active=True)
+            .order_by('feature_key', 'version', 'template_id')
+            .values_list('feature_key', 'version', 'weight', 'template_text', 'template_id')
+        )
+        for feature_key, version, weight, text, template_id in rows:
+            variants = features.setdefault(feature_key, {})
+            # Duplicate rows for one version: the newest wins.
+            variants[version] = Variant(version, weight, CompiledTemplate(text), template_id)
+        self._features = {
+            feature_key: self._table(list(variants.values()))
+            for feature_key, variants in features.items()
+        }
+        self._generation = generation
+        self._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _table(variants):
+        weights = [variant.weight for variant in variants]
+        if not sum(weights):
+            # All weights zero: serve the newest version alone.
+            weights = [0] * (len(variants) - 1) + [1]
+        return variants, list(accumulate(weights))
+
+    def variants(self, feature_key):
+        """The active variants of a feature, oldest version first."""
+        return self._entry(feature_key)[0]
+
+    def _entry(self, feature_key):
+        generation = _generation()
+        if generation != self._generation or time.monotonic() - self._loaded_at > _ttl():
+            with self._lock:
+                if generation != self._generation or time.monotonic() - self._loaded_at > _ttl():
+                    self._load(generation)
+        return self._features.get(feature_key, ((), []))
+
+    def select(self, feature_key, subject=None, default=None):
+        """
+        The variant that serves `subject` (any stable id; None picks at random).
+        With no active version, `default` text as version 0, or None.
+        """
+        variants, cumulative = self._entry(feature_key)
+        if not variants:
+            if default is None:
+                return None
+            compiled = self._defaults.get(feature_key)
+            if compiled is None or compiled.text != default:
+                compiled = self._defaults[feature_key] = CompiledTemplate(default)
+            return Variant(0, 0, compiled, None)
+        if len(variants) == 1:
+            return variants[0]
+        if subject is None:
+            point = random.randrange(cumulative[-1])
+        else:
+            point = int.from_bytes(hashlib.sha1(f'{feature_key}:{subject}'.encode()).digest()[:8], 'big') % cumulative[-1]
+        return variants[bisect_right(cumulative, point)]
+
+
+registry = PromptRegistry()
+
+
+def active_versions(feature_key):
+    """Versions currently active in the database (version 0, the built-in default, when none are)."""
+    versions = set(
+        AIPromptTemplate.objects.filter(feature_key=feature_key, is_active=True).values_list('version', flat=True)
+    )
+    return versions or {0}
+
+
+def notify_changed(feature_key, version=None):
+    """After the current transaction commits, invalidate every registry and tell listeners."""
+    def send():
+        bump_generation()
+        templates_changed.send(sender=AIPromptTemplate, feature_key=feature_key, version=version)
+    transaction.on_commit(send)
+
+
+def _previous_key(feature_key):
+    return f'prompt_registry.{feature_key}.previous'
+
+
+def _activate(feature_key, weights):
+    """Make exactly `weights` ({version: weight}) the active set of a feature. Returns the old set."""
+    with transaction.atomic():
+        rows = list(
+            AIPromptTemplate.objects.select_for_update().filter(feature_key=feature_key)
+            .order_by('version', 'template_id').values_list('template_id', 'version', 'weight', 'is_active')
+        )
+        newest = {version: template_id for template_id, version, _, _ in rows}
+        missing = [version for version in weights if version not in newest]
+        if missing:
+            raise ValueError(f'{feature_key} has no version {missing[0]}')
+        previous = {version: weight for _, version, weight, is_active in rows if is_active}
+        AIPromptTemplate.objects.filter(feature_key=feature_key, is_active=True).update(is_active=False)
+        for version, weight in weights.items():
+            AIPromptTemplate.objects.filter(pk=newest[version]).update(is_active=True, weight=weight)
+        set_system_setting(_previous_key(feature_key), previous, data_type='JSON')
+        notify_changed(feature_key)
+    return previous
+
+
+def promote(feature_key, version):
+    """Serve `version` to all traffic."""
+    return _activate(feature_key, {version: 100})
+
+
+def split(feature_key, weights):
+    """Serve several versions, each to its weight's share of users."""
+    weights = {int(version): int(weight) for version, weight in weights.items()}
+    if not weights or any(weight < 0 for weight in weights.values()):
+        raise ValueError('weights must map versions to non-negative integers')
+    return _activate(feature_key, weights)
+
+
+def rollback(feature_key):
+    """Restore the active set replaced by the last promote, split or rollback."""
+    previous = get_system_setting(_previous_key(feature_key))
+    if not previous:
+        raise ValueError(f'{feature_key} has no earlier activation to roll back to')
+    return _activate(feature_key, {int(version): weight for version, weight in previous.items()})
@@ -0,0 +1,223 @@
+"""
+Retention policies and batched purges.
+
+Each policy reads its limits from SystemSetting keys (`retention.<name>.days`
+and, where archiving is supported, `retention.<name>.action`). A days value
+that is not an integer disables the policy. A purge walks the expired rows in
+bounded primary-key ranges. Each range is deleted (or archived into the
+activity log's month segments, then deleted) in its own short transaction.
+The run sleeps after each range that removed rows, which keeps InnoDB lock
+hold times and replica lag small, and skips straight past gaps with no
+expired rows. The last finished key is saved to `retention.<name>.cursor`
+after every batch, so an interrupted run picks up where it stopped. The
+cursor is cleared once a run completes.
+"""
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from . import activity_archive
+from .models import CaseActivityLog, DocumentShareToken, Notification, SystemSetting
+from .unread import NOTIFICATIONS, adjust_unread_count
+from .utils import get_system_setting, set_system_setting
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_SLEEP_SECONDS = 0.5
+
+
+class RetentionPolicy:
+    """Describes which rows of a model have outlived their retention period."""
+
+    name = None
+    model = None
+    default_days = 0
+    default_action = 'DELETE'
+    supports_archive = False
+
+    def days(self):
+        value = get_system_setting(f'retention.{self.name}.days', self.default_days)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            # Settings entered in the admin are STRING-typed; a value that is not a number disables the policy.
+            return 0
+
+    def action(self):
+        action = str(get_system_setting(f'retention.{self.name}.action', self.default_action)).upper()
+        if action == 'ARCHIVE' and not self.supports_archive:
+            return 'DELETE'
+        return action
+
+    def expired(self, cutoff):
+        raise NotImplementedError
+
+    def delete(self, batch):
+        """Delete one batch; returns rows deleted."""
+        return batch.delete()[0]
+
+    def archive(self, batch):
+        """Archive and delete one batch; returns rows archived."""
+        raise NotImplementedError
+
+    def queryset(self):
+        days = self.days()
+        if not days or days <= 0:
+            return None
+        return self.expired(timezone.now() - timedelta(days=days))
+
+    @property
+    def cursor_key(self):
+        return f'retention.{self.name}.cursor'
+
+
+class _NotificationRetention(RetentionPolicy):
+    model = Notification
+
+    def delete(self, batch):
+        # A plain delete() loads every row to send post_delete; delete by key and settle the counters once.
+        unread = list(batch.filter(is_read=False).values_list('user_id').annotate(rows=Count('notification_id')))
+        # QuerySet._raw_delete is private API, checked against Django 4.2 (pinned in requirements.txt).
+        # Notification has no reverse relations to cascade to; re-check both on a Django upgrade.
+        deleted = batch._raw_delete(batch.db)
+
+        def settle():
+            for user_id, rows in unread:
+                adjust_unread_count(user_id, NOTIFICATIONS, -rows)
+        transaction.on_commit(settle)
+        return deleted
+
+
+class ReadNotificationPolicy(_NotificationRetention):
+    name = 'notifications_read'
+    default_days = 90
+
+    def expired(self, cutoff):
+        return Notification.objects.filter(is_read=True, updated_at__lt=cutoff)
+
+
+class NotificationPolicy(_NotificationRetention):
+    name = 'notifications'
+    default_days = 365
+
+    def expired(self, cutoff):
+        return Notification.objects.filter(updated_at__lt=cutoff)
+
+
+class CaseActivityLogPolicy(RetentionPolicy):
+    name = 'case_activity_log'
+    model = CaseActivityLog
+    default_days = 0  # keep forever until configured
+    default_action = 'ARCHIVE'
+    supports_archive = True
+
+    def expired(self, cutoff):
+        return CaseActivityLog.objects.filter(timestamp__lt=cutoff)
+
+    def archive(self, batch):
+        # The same indexed month segments as archive_activity_log, so case history still reads them.
+        return activity_archive.archive_rows(batch)
+
+
+class ShareTokenPolicy(RetentionPolicy):
+    """Expired or revoked tokens are kept for a grace period (days) and then removed."""
+
+    name = 'share_tokens'
+    model = DocumentShareToken
+    default_days = 30
+
+    def expired(self, cutoff):
+        return DocumentShareToken.objects.filter(
+            Q(expires_at__lt=cutoff) | Q(is_revoked=True, created_at__lt=cutoff)
+        )
+
+
+POLICIES = {
+    policy.name: policy
+    for policy in (ReadNotificationPolicy(), NotificationPolicy(), CaseActivityLogPolicy(), ShareTokenPolicy())
+}
+
+
+def _is_integer_pk(model):
+    return model._meta.pk.get_internal_type() in {'AutoField', 'BigAutoField', 'SmallAutoField'}
+
+
+def _next_batch(policy, queryset, cursor, upper, batch_size):
+    """Return the queryset for the next key range and the key that closes it."""
+    pk_name = policy.model._meta.pk.name
+    if _is_integer_pk(policy.model):
+        high = min(cursor + batch_size, upper)
+        return queryset.filter(**{f'{pk_name}__gt': cursor, f'{pk_name}__lte': high}), high
+    # Non-sequential keys (UUID): walk them in key order instead of by range.
+    page = queryset.order_by(pk_name)
+    if cursor:
+        page = page.filter(**{f'{pk_name}__gt': cursor})
+    keys = list(page.values_list(pk_name, flat=True)[:batch_size])
+    if not keys:
+        return None, None
+    return queryset.filter(**{f'{pk_name}__in': keys}), str(keys[-1])
+
+
+def purge(policy, batch_size=DEFAULT_BATCH_SIZE, sleep=DEFAULT_SLEEP_SECONDS, dry_run=False, log=None):
+    """
+    Apply one policy. Returns counts and throughput:
+    {'policy', 'action', 'rows', 'batches', 'seconds', 'rows_per_second'}.
+    """
+    queryset = policy.queryset()
+    action = policy.action()
+    result = {'policy': policy.name, 'action': action, 'rows': 0, 'batches': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+    if queryset is None:
+        result['action'] = 'DISABLED'
+        return result
+    if dry_run:
+        result['rows'] = queryset.count()
+        return result
+
+    pk_name = policy.model._meta.pk.name
+    integer_pk = _is_integer_pk(policy.model)
+    saved_cursor = get_system_setting(policy.cursor_key)
+
+    if integer_pk:
+        bounds = queryset.aggregate(low=Min(pk_name), high=Max(pk_name))
+        if bounds['low'] is None:
+            SystemSetting.objects.filter(setting_key=policy.cursor_key).delete()
+            return result
+        cursor = max(int(saved_cursor or 0), bounds['low'] - 1)
+        upper = bounds['high']
+    else:
+        cursor = saved_cursor or None
+        upper = None
+
+    started = time.monotonic()
+    while not integer_pk or cursor < upper:
+        batch, next_cursor = _next_batch(policy, queryset, cursor, upper, batch_size)
+        if batch is None:
+            break
+
+        with transaction.atomic():
+            deleted = policy.archive(batch) if action == 'ARCHIVE' else policy.delete(batch)
+            set_system_setting(policy.cursor_key, next_cursor, 'STRING', f'Resume point for {policy.name} retention')
+
+        cursor = int(next_cursor) if integer_pk else next_cursor
+        result['rows'] += deleted
+        result['batches'] += 1
+        if deleted:
+            if log:
+                elapsed = time.monotonic() - started
+                log(f'{policy.name}: {result["rows"]} rows, {result["rows"] / elapsed:.0f} rows/s')
+            if sleep:
+                time.sleep(sleep)
+        elif integer_pk:
+            # Nothing expired in this range: jump to the next expired key instead of walking the gap.
+            low = queryset.filter(**{f'{pk_name}__gt': cursor}).aggregate(low=Min(pk_name))['low']
+            if low is None:
+                break
+            cursor = low - 1
+
+    SystemSetting.objects.filter(setting_key=policy.cursor_key).delete()
+    result['seconds'] = time.monotonic() - started
+    if result['seconds'] > 0:
+        result['rows_per_second'] = result['rows'] / result['seconds']
+    return result
@@ -0,0 +1,96 @@
+"""
+Hybrid retrieval for the legal assistant: BM25 and vector search fused with
+reciprocal-rank fusion (RRF).
+
+Each retriever returns its RETRIEVAL_CANDIDATES best chunks among those the
+user may see. A chunk's fused score is the sum of 1 / (RRF_K + rank) over
+the lists it appears in. Exact-term matches (section numbers, party names)
+and paraphrases can then both reach the top without calibrating two score
+scales against each other. The visible set is resolved once and handed to
+both indexes, so neither ever scores another user's evidence.
+
+Results are citation dicts, the shape stored in AIMessage.citations:
+
+    {"chunk_id", "document_id", "case_id", "document_name", "chunk_index",
+     "snippet", "score", "bm25_rank", "vector_rank"}
+"""
+import re
+
+import numpy as np
+from django.conf import settings
+
+from .embedding_queue import get_embedding_service
+from .lexical_index import analyze, get_lexical_index
+from .vector_index import get_index, visible_chunks
+
+RRF_K = 60
+SNIPPET_CHARS = 280
+
+
+def _candidates():
+    return getattr(settings, 'RETRIEVAL_CANDIDATES', 50)
+
+
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """Fuse ranked lists of (chunk_id, score) into [(chunk_id, fused score, ranks)], best first."""
+    fused = {}
+    for position, ranking in enumerate(rankings):
+        for rank, (chunk_id, _) in enumerate(ranking, start=1):
+            score, ranks = fused.get(chunk_id, (0.0, [None] * len(rankings)))
+            ranks[position] = rank
+            fused[chunk_id] = (score + 1.0 / (k + rank), ranks)
+    return sorted(
+        ((chunk_id, score, ranks) for chunk_id, (score, ranks) in fused.items()),
+        key=lambda item: -item[1],
+    )
+
+
+def snippet(text, query):
+    """A window of the chunk around the first query term it contains."""
+    terms = [re.escape(term) for term in analyze(query)]
+    match = re.search('|'.join(terms), text, flags=re.IGNORECASE) if terms else None
+    start = max((match.start() if match else 0) - SNIPPET_CHARS // 4, 0)
+    excerpt = text[start:start + SNIPPET_CHARS].strip()
+    return ('…' if start else '') + excerpt + ('…' if start + SNIPPET_CHARS < len(text) else '')
+
+
+def hybrid_search(user, query, k=8, case=None):
+    """The k best chunks for query among those the user can see (optionally one case), as citations."""
+    queryset = visible_chunks(user).filter(vector_id__isnull=False)
+    if case is not None:
+        queryset = queryset.filter(document__case=case)
+    allowed = None
+    if not user.is_staff or case is not None:
+        allowed = np.fromiter(queryset.values_list('chunk_id', flat=True).iterator(chunk_size=10000), dtype=np.int64)
+        if not len(allowed):
+            return []
+
+    candidates = _candidates()
+    # The query is embedded on the batching thread while BM25 runs here.
+    embedding = get_embedding_service().submit([query])
+    lexical = get_lexical_index().search(query, k=candidates, allowed_ids=allowed)
+    vector = get_index().search(embedding.result()[0], k=candidates, allowed_ids=allowed)
+    fused = reciprocal_rank_fusion(lexical, vector)
+    # Unfiltered (staff) results may name chunks deleted since indexing; fetch a little extra.
+    fused = fused[:k * 2 if allowed is None else k]
+
+    chunks = queryset.select_related('document').in_bulk([chunk_id for chunk_id, _, _ in fused])
+    citations = []
+    for chunk_id, score, (bm25_rank, vector_rank) in fused:
+        chunk = chunks.get(chunk_id)
+        if chunk is None:
+            continue
+        citations.append({
+            'chunk_id': chunk_id,
+            'document_id': str(chunk.document_id),
+            'case_id': str(chunk.document.case_id),
+            'document_name': chunk.document.file_name,
+            'chunk_index': chunk.chunk_index,
+            'snippet': snippet(chunk.content_text, query),
+            'score': round(score, 6),
+            'bm25_rank': bm25_rank,
+            'vector_rank': vector_rank,
+        })
+        if len(citations) == k:
+            break
+    return citations
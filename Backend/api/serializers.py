@@ -1,27 +1,32 @@
+import uuid
+
 from django.utils import timezone
 from rest_framework import serializers
 from .models import (
     User, CitizenProfile, LawyerProfile, AdminProfile, LegalSpecialization,
     LawyerSpecializationMap, Case, CaseActivityLog, CasePrivateNote,
-    EvidenceDocument, DocumentShareToken, AIConversation, AIMessage,
+    EvidenceDocument, EvidenceUploadSession, DocumentShareToken, AIConversation, AIMessage,
     AIPromptTemplate, AIDocumentChunk, AIFeedback, LawyerAvailabilitySlot,
-    ConsultationBooking, Notification, ChatMessage, LawyerReview, SystemSetting
+    ConsultationBooking, Notification, NotificationOutbox, ChatMessage, LawyerReview,
+    SystemSetting
 )
-from .utils import build_public_url
+from .uploads import max_chunk_size, max_upload_size
+from .utils import build_avatar_url, build_download_url, build_photo_urls, build_public_url
 
 class UserSerializer(serializers.ModelSerializer):
     name = serializers.SerializerMethodField()
     id = serializers.CharField(source='user_id', read_only=True)
     phone = serializers.CharField(source='phone_number', read_only=True)
     avatar = serializers.SerializerMethodField()
+    avatar_urls = serializers.SerializerMethodField()
     verification_status = serializers.SerializerMethodField()
     profile = serializers.SerializerMethodField()
     
     class Meta:
         model = User
         fields = [
-            'id', 'email', 'phone', 'name', 'role', 'language_preference', 'is_active',
-            'is_verified', 'created_at', 'avatar', 'verification_status', 'profile'
+            'id', 'email', 'phone', 'name', 'role', 'language_preference', 'notification_mode',
+            'is_active', 'is_verified', 'created_at', 'avatar', 'avatar_urls', 'verification_status', 'profile'
         ]
         extra_kwargs = {'password': {'write_only': True}}
     
@@ -48,7 +53,15 @@ class UserSerializer(serializers.ModelSerializer):
         photo_path = None
         if hasattr(profile, 'profile_photo_url'):
             photo_path = profile.profile_photo_url
-        return build_public_url(photo_path, request) if photo_path else None
+        return build_avatar_url(photo_path, getattr(profile, 'photo_derivatives', None), request)
+
+    def get_avatar_urls(self, obj):
+        profile = self._get_profile(obj)
+        return build_photo_urls(
+            getattr(profile, 'profile_photo_url', None),
+            getattr(profile, 'photo_derivatives', None),
+            self.context.get('request'),
+        )
 
     def get_verification_status(self, obj):
         if hasattr(obj, 'lawyer_profile'):
@@ -92,9 +105,15 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
 class CitizenProfileSerializer(serializers.ModelSerializer):
+    avatar_urls = serializers.SerializerMethodField()
+
     class Meta:
         model = CitizenProfile
         fields = '__all__'
+        read_only_fields = ('photo_derivatives',)
+
+    def get_avatar_urls(self, obj):
+        return build_photo_urls(obj.profile_photo_url, obj.photo_derivatives, self.context.get('request'))
 
 class LawyerProfileSerializer(serializers.ModelSerializer):
     user_id = serializers.CharField(source='user.user_id', read_only=True)
@@ -102,6 +121,7 @@ class LawyerProfileSerializer(serializers.ModelSerializer):
     phone = serializers.CharField(source='user.phone_number', read_only=True)
     name = serializers.CharField(source='full_name_en', read_only=True)
     avatar = serializers.SerializerMethodField()
+    avatar_urls = serializers.SerializerMethodField()
     specializations = serializers.SerializerMethodField()
     experience_years = serializers.SerializerMethodField()
     location = serializers.CharField(source='chamber_address', read_only=True)
@@ -110,7 +130,7 @@ class LawyerProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = LawyerProfile
         fields = [
-            'profile_id', 'user_id', 'user', 'name', 'email', 'phone', 'avatar',
+            'profile_id', 'user_id', 'user', 'name', 'email', 'phone', 'avatar', 'avatar_urls',
             'verification_status', 'bar_council_number', 'bio_en', 'bio_bn',
             'chamber_address', 'location', 'consultation_fee_online',
             'consultation_fee_offline', 'rating_average', 'total_reviews',
@@ -119,13 +139,16 @@ class LawyerProfileSerializer(serializers.ModelSerializer):
             'availability'
         ]
         read_only_fields = (
-            'profile_id', 'user_id', 'name', 'email', 'phone', 'avatar', 'location',
+            'profile_id', 'user_id', 'name', 'email', 'phone', 'avatar', 'avatar_urls', 'location',
             'specializations', 'experience_years', 'bar_council_number', 'availability'
         )
 
     def get_avatar(self, obj):
         request = self.context.get('request')
-        return build_public_url(obj.profile_photo_url, request)
+        return build_avatar_url(obj.profile_photo_url, obj.photo_derivatives, request)
+
+    def get_avatar_urls(self, obj):
+        return build_photo_urls(obj.profile_photo_url, obj.photo_derivatives, self.context.get('request'))
 
     def get_specializations(self, obj):
         if hasattr(obj, 'lawyerspecializationmap_set'):
@@ -226,22 +249,50 @@ class CasePrivateNoteSerializer(serializers.ModelSerializer):
 
 class EvidenceDocumentSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
+    preview_urls = serializers.SerializerMethodField()
 
     class Meta:
         model = EvidenceDocument
         fields = [
             'document_id', 'case', 'uploader', 'file_name', 'storage_path',
             'file_size_bytes', 'mime_type', 'encryption_hash', 'encryption_key_id',
-            'uploaded_at', 'deleted_at', 'file_url'
+            'uploaded_at', 'deleted_at', 'file_url', 'preview_urls'
         ]
         read_only_fields = (
             'document_id', 'uploader', 'file_name', 'storage_path',
-            'file_size_bytes', 'mime_type', 'uploaded_at'
+            'file_size_bytes', 'mime_type', 'encryption_hash', 'uploaded_at'
         )
 
     def get_file_url(self, obj):
+        # Evidence is never exposed under MEDIA_URL; the download endpoint checks access.
+        return build_download_url(obj, self.context.get('request'))
+
+    def get_preview_urls(self, obj):
         request = self.context.get('request')
-        return build_public_url(obj.storage_path, request)
+        return {variant: build_download_url(obj, request, variant) for variant in obj.derivatives or {}}
+
+class EvidenceUploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received_bytes', read_only=True)
+    max_chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = EvidenceUploadSession
+        fields = [
+            'upload_id', 'case', 'file_name', 'mime_type', 'total_size', 'offset',
+            'max_chunk_size', 'status', 'document', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ('upload_id', 'status', 'document', 'created_at', 'updated_at')
+        extra_kwargs = {'mime_type': {'required': False}}
+
+    def get_max_chunk_size(self, obj):
+        return max_chunk_size()
+
+    def validate_total_size(self, value):
+        if value < 0:
+            raise serializers.ValidationError('total_size cannot be negative')
+        if value > max_upload_size():
+            raise serializers.ValidationError(f'total_size exceeds the {max_upload_size()} byte limit')
+        return value
 
 class DocumentShareTokenSerializer(serializers.ModelSerializer):
     class Meta:
@@ -252,11 +303,16 @@ class AIConversationSerializer(serializers.ModelSerializer):
     class Meta:
         model = AIConversation
         fields = '__all__'
+        read_only_fields = ('user', 'summary_message', 'summarized_through', 'context_window_usage')
 
 class AIMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = AIMessage
         fields = '__all__'
+        read_only_fields = (
+            'conversation', 'sender_role', 'content', 'model_version', 'prompt_tokens', 'completion_tokens',
+            'confidence_score', 'citations', 'prompt_template_version',
+        )
 
 class AIPromptTemplateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -294,15 +350,12 @@ class ConsultationBookingSerializer(serializers.ModelSerializer):
 
     def get_citizen_avatar(self, obj):
         request = self.context.get('request')
-        if obj.citizen.citizen_profile.profile_photo_url:
-            return build_public_url(obj.citizen.citizen_profile.profile_photo_url, request)
-        return None
+        profile = obj.citizen.citizen_profile
+        return build_avatar_url(profile.profile_photo_url, profile.photo_derivatives, request)
 
     def get_lawyer_avatar(self, obj):
         request = self.context.get('request')
-        if obj.lawyer.profile_photo_url:
-            return build_public_url(obj.lawyer.profile_photo_url, request)
-        return None
+        return build_avatar_url(obj.lawyer.profile_photo_url, obj.lawyer.photo_derivatives, request)
 
     def get_lawyer_specialization(self, obj):
         # Return first specialization or empty string
@@ -315,6 +368,51 @@ class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = '__all__'
+        read_only_fields = ('coalesce_key', 'coalesced_count', 'updated_at')
+
+class NotificationOutboxSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = NotificationOutbox
+        fields = '__all__'
+        read_only_fields = (
+            'outbox_id', 'status', 'cursor', 'recipients_processed', 'error_message',
+            'created_by', 'created_at', 'started_at', 'completed_at'
+        )
+
+    def get_rows_per_second(self, obj):
+        if not obj.started_at:
+            return None
+        end = obj.completed_at or timezone.now()
+        elapsed = (end - obj.started_at).total_seconds()
+        return round(obj.recipients_processed / elapsed, 1) if elapsed > 0 else None
+
+    def validate_recipient_ids(self, value):
+        # Bad ids must fail here, not in the fan-out worker.
+        if value is None:
+            return value
+        if not isinstance(value, list):
+            raise serializers.ValidationError('Must be a list of user ids.')
+        try:
+            return [str(uuid.UUID(str(user_id))) for user_id in value]
+        except ValueError:
+            raise serializers.ValidationError('Every recipient id must be a UUID.')
+
+    def validate(self, attrs):
+        audience = attrs.get('audience')
+        if audience == 'USERS' and not attrs.get('recipient_ids'):
+            raise serializers.ValidationError({'recipient_ids': 'Required for USERS audience.'})
+        if audience == 'ROLE' and attrs.get('audience_value') not in dict(User.ROLE_CHOICES):
+            raise serializers.ValidationError({'audience_value': 'A valid role is required for ROLE audience.'})
+        if audience == 'CASE':
+            try:
+                case_id = uuid.UUID(str(attrs.get('audience_value')))
+            except ValueError:
+                case_id = None
+            if case_id is None or not Case.objects.filter(case_id=case_id).exists():
+                raise serializers.ValidationError({'audience_value': 'An existing case id is required for CASE audience.'})
+        return attrs
 
 class ChatMessageSerializer(serializers.ModelSerializer):
     class Meta:
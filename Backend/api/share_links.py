@@ -0,0 +1,165 @@
+"""
+Public redemption of DocumentShareToken links.
+
+Each redemption is answered from the Django cache: the key is the SHA-256
+of the token (the raw token never becomes a cache key) and the value is
+what serving the document needs - storage name, type, file name, content
+hash and the token's expiry - or a marker for unknown, revoked and expired
+tokens, so guessed tokens do not reach the database either. Entries live
+for SHARE_TOKEN_CACHE_TTL seconds and never past the token's own expiry.
+Saving or deleting a token (revoking it) or its document (soft-deleting it)
+drops the entry on commit, so revocation takes effect on the very next
+request.
+
+Dropping an entry only reaches other workers through a shared cache
+(Redis, Memcached, the database cache). With a per-process backend
+(LocMemCache, the default) a grant served from the cache is re-checked
+against the token row, one primary-key query, so a revoked link never
+outlives its revocation in another process. Only the unknown-token marker
+is then served without the database.
+
+`access_count` is not updated per download. Hits accumulate in a
+per-process counter and are flushed as `F('access_count') + n` updates, one
+UPDATE per distinct n, once SHARE_ACCESS_FLUSH_BATCH hits have built up or
+SHARE_ACCESS_FLUSH_INTERVAL seconds have passed, and at interpreter exit. A
+hard crash loses at most one unflushed batch of counts.
+"""
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DocumentShareToken
+from .utils import cache_is_shared
+
+logger = logging.getLogger(__name__)
+
+_INVALID = 'invalid'
+
+
+def _cache_key(access_token):
+    return f"share:{hashlib.sha256(access_token.encode('utf-8')).hexdigest()}"
+
+
+def _ttl():
+    return getattr(settings, 'SHARE_TOKEN_CACHE_TTL', 60)
+
+
+def _still_live(grant):
+    return DocumentShareToken.objects.filter(
+        pk=grant['token_id'], is_revoked=False, document__deleted_at__isnull=True,
+    ).exists()
+
+
+def _load_grant(access_token):
+    token = (
+        DocumentShareToken.objects.select_related('document')
+        .filter(access_token=access_token).first()
+    )
+    if token is None or token.is_revoked or token.expires_at <= timezone.now():
+        return None
+    document = token.document
+    if document.deleted_at is not None or not document.storage_path:
+        return None
+    return {
+        'token_id': str(token.token_id),
+        'expires_at': token.expires_at.timestamp(),
+        'storage_path': document.storage_path,
+        'mime_type': document.mime_type,
+        'file_name': document.file_name,
+        'content_hash': document.encryption_hash,
+    }
+
+
+def resolve_share_token(access_token):
+    """The cached grant for a live token, or None when it is unknown, revoked or expired."""
+    if not access_token:
+        return None
+    key = _cache_key(access_token)
+    grant = cache.get(key)
+    if grant is None:
+        grant = _load_grant(access_token)
+        ttl = _ttl()
+        if grant is not None:
+            ttl = min(ttl, grant['expires_at'] - time.time())
+        cache.set(key, grant or _INVALID, max(int(ttl), 1))
+    elif grant != _INVALID and not cache_is_shared() and not _still_live(grant):
+        # Revoked in another process, whose invalidation never reached this cache.
+        cache.set(key, _INVALID, _ttl())
+        return None
+    if grant == _INVALID or grant is None or grant['expires_at'] <= time.time():
+        return None
+    return grant
+
+
+def invalidate_share_token(access_token):
+    if access_token:
+        cache.delete(_cache_key(access_token))
+
+
+def invalidate_document_tokens(document_id):
+    """Drop the cached grants of every share link to a document."""
+    tokens = DocumentShareToken.objects.filter(document_id=document_id).values_list('access_token', flat=True)
+    cache.delete_many([_cache_key(access_token) for access_token in tokens])
+
+
+class AccessCounter:
+    """Thread-safe in-memory hit counter that writes to the database in batches."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._hits = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, token_id):
+        with self._lock:
+            self._pending[token_id] += 1
+            self._hits += 1
+            due = (
+                self._hits >= getattr(settings, 'SHARE_ACCESS_FLUSH_BATCH', 100)
+                or time.monotonic() - self._last_flush >= getattr(settings, 'SHARE_ACCESS_FLUSH_INTERVAL', 30)
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write pending hits with one F() update per distinct count. Returns hits written."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._hits = 0
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        by_count = defaultdict(list)
+        for token_id, hits in pending.items():
+            by_count[hits].append(token_id)
+        written = 0
+        for hits, token_ids in by_count.items():
+            try:
+                DocumentShareToken.objects.filter(pk__in=token_ids).update(access_count=F('access_count') + hits)
+            except Exception:
+                # Keep the counts for the next flush rather than failing the download.
+                logger.exception('Failed to flush share link access counts')
+                with self._lock:
+                    self._pending.update({token_id: hits for token_id in token_ids})
+                    self._hits += hits * len(token_ids)
+                continue
+            written += hits * len(token_ids)
+        return written
+
+
+access_counter = AccessCounter()
+atexit.register(access_counter.flush)
+
+
+def record_access(grant):
+    access_counter.add(grant['token_id'])
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import answer_cache
+from .assistant import FEATURE_KEY
+from .metering import QUOTA_SETTING, invalidate_quota_config
+from .models import (
+    AIPromptTemplate, ChatMessage, DocumentShareToken, EvidenceDocument, Notification, SystemSetting,
+)
+from .prompt_registry import active_versions, notify_changed, templates_changed
+from .share_links import invalidate_document_tokens, invalidate_share_token
+from .unread import MESSAGES, NOTIFICATIONS, adjust_unread_count
+
+
+@receiver(post_save, sender=Notification)
+def notification_created(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: adjust_unread_count(user_id, NOTIFICATIONS, 1))
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: adjust_unread_count(user_id, NOTIFICATIONS, -1))
+
+
+@receiver(post_save, sender=ChatMessage)
+def chat_message_created(sender, instance, created, **kwargs):
+    if created and not instance.is_read and instance.receiver_id:
+        receiver_id = instance.receiver_id
+        transaction.on_commit(lambda: adjust_unread_count(receiver_id, MESSAGES, 1))
+
+
+@receiver(post_delete, sender=ChatMessage)
+def chat_message_deleted(sender, instance, **kwargs):
+    if not instance.is_read and instance.receiver_id:
+        receiver_id = instance.receiver_id
+        transaction.on_commit(lambda: adjust_unread_count(receiver_id, MESSAGES, -1))
+
+
+@receiver(post_save, sender=DocumentShareToken)
+@receiver(post_delete, sender=DocumentShareToken)
+def share_token_changed(sender, instance, **kwargs):
+    access_token = instance.access_token
+    transaction.on_commit(lambda: invalidate_share_token(access_token))
+
+
+@receiver(post_save, sender=EvidenceDocument)
+def evidence_document_changed(sender, instance, created, **kwargs):
+    # A soft delete or a moved file must not keep being served from cached share grants.
+    if not created:
+        document_id = instance.document_id
+        transaction.on_commit(lambda: invalidate_document_tokens(document_id))
+
+
+@receiver(post_save, sender=AIPromptTemplate)
+@receiver(post_delete, sender=AIPromptTemplate)
+def prompt_template_changed(sender, instance, **kwargs):
+    notify_changed(instance.feature_key, instance.version)
+
+
+@receiver(templates_changed)
+def assistant_templates_changed(sender, feature_key, version=None, **kwargs):
+    if feature_key == FEATURE_KEY:
+        answer_cache.invalidate_versions(active_versions(FEATURE_KEY), version)
+
+
+@receiver(post_save, sender=SystemSetting)
+@receiver(post_delete, sender=SystemSetting)
+def system_setting_changed(sender, instance, **kwargs):
+    if instance.setting_key.startswith(QUOTA_SETTING):
+        transaction.on_commit(invalidate_quota_config)
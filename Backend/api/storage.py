@@ -0,0 +1,200 @@
+"""
+Media storage: sharded naming on top of Django's pluggable Storage API.
+
+Every media file is addressed by a relative name such as
+`evidence/blobs/ab/cd/<sha256>.pdf`, and the bytes live in
+`default_storage`. That is FileSystemStorage under MEDIA_ROOT unless
+STORAGES['default'] (MEDIA_STORAGE_BACKEND) points at another backend. Any
+Django Storage works, including an S3-compatible one such as django-storages
+against a local MinIO. Only code that can use a local file
+(`local_path`) depends on the filesystem, and it falls back gracefully when
+the backend has none.
+
+`shard_name` fans files out two levels deep on the first four hex digits of
+their hash (or random id). No directory grows past a few thousand entries,
+even with hundreds of millions of files. Names from the old flat layout are
+moved by the `relocate_media` command. It copies each file to its sharded
+name (hard-linking on local disk), repoints every model field that stores
+the name, and only then removes the old file. Downloads keep working
+throughout, and an interrupted run can simply be restarted.
+"""
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from pathlib import Path, PurePosixPath
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+_HEX_RE = re.compile(r'^[0-9a-f]{4,}$')
+RELOCATION_CHUNK_SIZE = 2000
+
+
+class StagedFile(File):
+    """
+    A finished file on local disk presented like Django's TemporaryUploadedFile.
+    FileSystemStorage renames it into place instead of copying the bytes.
+    """
+
+    def __init__(self, path, name=None, size=None):
+        super().__init__(open(path, 'rb'), name=name or Path(path).name)
+        self._path = str(path)
+        if size is not None:
+            self.size = size
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def get_storage():
+    return default_storage
+
+
+def shard_name(subdir, filename, digest=None):
+    """`<subdir>/ab/cd/<filename>`, where abcd are the first hex digits of digest (or of the file stem)."""
+    normalized_subdir = subdir.strip('/').replace('..', '') or 'uploads'
+    filename = PurePosixPath(filename).name
+    if digest is None:
+        stem = PurePosixPath(filename).stem.lower()
+        digest = stem if _HEX_RE.match(stem) else hashlib.sha256(filename.encode('utf-8')).hexdigest()
+    return f'{normalized_subdir}/{digest[:2]}/{digest[2:4]}/{filename}'
+
+
+def unsharded_subdir(name):
+    """The logical subdir of a stored name, with any existing shard levels removed."""
+    parts = PurePosixPath(name).parts[:-1]
+    while len(parts) >= 2 and all(re.fullmatch(r'[0-9a-f]{2}', part) for part in parts[-2:]):
+        parts = parts[:-2]
+    return '/'.join(parts)
+
+
+def staging_path(suffix=''):
+    """Scratch file on the same disk as local media, so handing it to storage is a rename."""
+    staging_dir = Path(getattr(settings, 'MEDIA_STAGING_DIR', Path(settings.MEDIA_ROOT) / '.staging'))
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    return staging_dir / f'{uuid.uuid4().hex}{suffix}.part'
+
+
+def save_file(name, content, storage=None):
+    """Store content under name and return the name actually used."""
+    storage = storage or get_storage()
+    return storage.save(name, content)
+
+
+def local_path(name, storage=None):
+    """Filesystem path for name, or None when the backend is not on local disk."""
+    storage = storage or get_storage()
+    try:
+        return Path(storage.path(name))
+    except NotImplementedError:
+        return None
+
+
+def delete_file(name, storage=None):
+    if name:
+        (storage or get_storage()).delete(name)
+
+
+def media_path_fields():
+    """(model, field) pairs whose values are media storage names."""
+    from .models import CitizenProfile, EvidenceDocument, LawyerProfile, StoredBlob
+
+    return [
+        (StoredBlob, 'storage_path'),
+        (EvidenceDocument, 'storage_path'),
+        (CitizenProfile, 'profile_photo_url'),
+        (CitizenProfile, 'identity_document_url'),
+        (LawyerProfile, 'profile_photo_url'),
+        (LawyerProfile, 'verification_document_url'),
+        (LawyerProfile, 'identity_document_url'),
+    ]
+
+
+def media_name_map_fields():
+    """(model, field) pairs holding {variant: storage name} dicts of derived files."""
+    from .models import CitizenProfile, EvidenceDocument, LawyerProfile
+
+    return [
+        (CitizenProfile, 'photo_derivatives'),
+        (LawyerProfile, 'photo_derivatives'),
+        (EvidenceDocument, 'derivatives'),
+    ]
+
+
+def sharded_target(name):
+    """Where a stored name belongs in the sharded layout, or None when it is already there."""
+    target = shard_name(unsharded_subdir(name), PurePosixPath(name).name)
+    return None if target == name else target
+
+
+def copy_to_target(name, target, storage=None):
+    """
+    Make the file available under target as well as name (a hard link on local
+    disk, a copy otherwise). Returns the name it ended up under, or None when missing.
+    """
+    storage = storage or get_storage()
+    if not storage.exists(name):
+        return target if storage.exists(target) else None
+    if storage.exists(target):
+        return target
+
+    source, destination = local_path(name, storage), local_path(target, storage)
+    if source is not None and destination is not None:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)
+        return target
+    with storage.open(name, 'rb') as handle:
+        return storage.save(target, handle)
+
+
+def rewrite_references(old, new):
+    """Point every media field that stores `old` at `new`. Returns rows updated."""
+    updated = 0
+    for model, field in media_path_fields():
+        updated += model.objects.filter(**{field: old}).update(**{field: new})
+    return updated
+
+
+def _names_after(model, field, after, limit):
+    """Up to limit distinct non-empty names in field sorting after `after`, in order."""
+    queryset = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+    if after is not None:
+        queryset = queryset.filter(**{f'{field}__gt': after})
+    return list(queryset.order_by(field).values_list(field, flat=True).distinct()[:limit])
+
+
+def pending_relocations(chunk_size=RELOCATION_CHUNK_SIZE):
+    """
+    Yield each distinct stored name that is not yet in the sharded layout, with its target.
+    Names are read in keyset chunks ordered by name, so memory stays bounded and the
+    caller may rewrite these columns between chunks. A name stored in several fields
+    is yielded for the first of them only.
+    """
+    fields = media_path_fields()
+    for index, (model, field) in enumerate(fields):
+        after = None
+        while True:
+            names = _names_after(model, field, after, chunk_size)
+            if not names:
+                break
+            after = names[-1]
+            pending = {}
+            for name in names:
+                target = sharded_target(name)
+                if target is not None:
+                    pending[name] = target
+            for earlier_model, earlier_field in fields[:index]:
+                if not pending:
+                    break
+                shared = earlier_model.objects.filter(**{f'{earlier_field}__in': list(pending)})
+                for name in shared.values_list(earlier_field, flat=True):
+                    pending.pop(name, None)
+            yield from pending.items()
+            if len(names) < chunk_size:
+                break
@@ -0,0 +1,74 @@
+"""
+Per-user unread counters for the header badges.
+
+Counts live in the Django cache so the badge endpoint never touches the
+database on a hit. Creates increment the counters, the mark-read paths
+decrement them, and every key expires after UNREAD_COUNTS_TTL seconds so the
+next read reconciles it against the DB. A missing key is never guessed at:
+increments and decrements on a cold key are dropped and the next read
+recomputes the real value.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ChatMessage, Notification
+
+NOTIFICATIONS = 'notifications'
+MESSAGES = 'messages'
+COUNTER_KINDS = (NOTIFICATIONS, MESSAGES)
+
+
+def _cache_key(user_id, kind):
+    return f'unread:{user_id}:{kind}'
+
+
+def _ttl():
+    return getattr(settings, 'UNREAD_COUNTS_TTL', 300)
+
+
+def _count_from_db(user_id, kind):
+    if kind == NOTIFICATIONS:
+        return Notification.objects.filter(user_id=user_id, is_read=False).count()
+    return ChatMessage.objects.filter(receiver_id=user_id, is_read=False).count()
+
+
+def reconcile_unread_counts(user_id):
+    """Recompute both counters from the database and store them in the cache."""
+    counts = {kind: _count_from_db(user_id, kind) for kind in COUNTER_KINDS}
+    cache.set_many({_cache_key(user_id, kind): value for kind, value in counts.items()}, _ttl())
+    return counts
+
+
+def unread_counts(user):
+    """Return the number of unread notifications and chat messages for a user."""
+    user_id = user.pk
+    keys = {kind: _cache_key(user_id, kind) for kind in COUNTER_KINDS}
+    cached = cache.get_many(keys.values())
+    if len(cached) == len(keys):
+        return {kind: max(cached[key], 0) for kind, key in keys.items()}
+    return reconcile_unread_counts(user_id)
+
+
+def adjust_unread_count(user_id, kind, delta):
+    """Apply delta to a warm counter. Cold counters are left for the next read to rebuild."""
+    if not user_id or not delta:
+        return
+    key = _cache_key(user_id, kind)
+    try:
+        value = cache.incr(key, delta)
+    except ValueError:
+        return
+    if value < 0:
+        cache.delete(key)
+
+
+def reset_unread_count(user_id, kind, value=0):
+    """Overwrite a counter, e.g. after everything of that kind has been marked read."""
+    cache.set(_cache_key(user_id, kind), value, _ttl())
+
+
+def invalidate_unread_counts(user_ids, kind):
+    """Drop counters for many users at once, e.g. after a bulk_create that skipped signals."""
+    keys = [_cache_key(user_id, kind) for user_id in user_ids]
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,242 @@
+"""
+Resumable evidence uploads.
+
+A client opens an EvidenceUploadSession with the file's name, type and total
+size (at most EVIDENCE_UPLOAD_MAX_SIZE), then sends the bytes in PATCH
+requests. Each PATCH carries `Upload-Offset`, which must equal the bytes
+already received, so a retried or duplicated chunk cannot corrupt the file.
+Each chunk is first read into a file of its own and then appended to a part
+file under MEDIA_ROOT/evidence/incoming/ while the session row is locked, and
+a dropped connection costs at most one chunk: the client asks for the current
+offset and carries on.
+
+Finalizing hashes the part file and passes it to store_blob as an
+already-on-disk upload, without holding the session lock. With plaintext
+local storage it is renamed into the blob store without copying the bytes;
+encrypted storage has to stream it once through the cipher. Sessions left
+idle past EVIDENCE_UPLOAD_SESSION_TTL are removed by `purge_stale_uploads`.
+"""
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .blobs import hash_upload, release_blob, store_blob
+from .derivatives import enqueue_evidence_preview
+from .ingestion import enqueue_ingestion
+from .models import EvidenceDocument, EvidenceUploadSession
+from .storage import StagedFile
+
+INCOMING_SUBDIR = 'evidence/incoming'
+DEFAULT_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+DEFAULT_MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024
+DEFAULT_SESSION_TTL = 24 * 60 * 60
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f'Expected Upload-Offset {offset}')
+        self.offset = offset
+
+
+def incoming_dir():
+    return Path(settings.MEDIA_ROOT) / INCOMING_SUBDIR
+
+
+def part_path(session):
+    return incoming_dir() / f'{session.upload_id}.part'
+
+
+def max_chunk_size():
+    return getattr(settings, 'EVIDENCE_UPLOAD_MAX_CHUNK', DEFAULT_MAX_CHUNK_SIZE)
+
+
+def max_upload_size():
+    return getattr(settings, 'EVIDENCE_UPLOAD_MAX_SIZE', DEFAULT_MAX_UPLOAD_SIZE)
+
+
+def session_ttl():
+    return getattr(settings, 'EVIDENCE_UPLOAD_SESSION_TTL', DEFAULT_SESSION_TTL)
+
+
+def _receive_chunk(session, stream, length):
+    """Copy `length` bytes of the request body into a chunk file of its own; returns its path."""
+    directory = incoming_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    handle = tempfile.NamedTemporaryFile(dir=directory, prefix=f'{session.upload_id}.', suffix='.chunk', delete=False)
+    try:
+        with handle:
+            remaining = length
+            while remaining > 0:
+                data = stream.read(min(STREAM_BLOCK_SIZE, remaining))
+                if not data:
+                    break
+                handle.write(data)
+                remaining -= len(data)
+        if remaining:
+            raise ValueError('Request body is shorter than Content-Length')
+    except BaseException:
+        os.unlink(handle.name)
+        raise
+    return Path(handle.name)
+
+
+def _check_chunk(session, offset, length):
+    if session.status != 'UPLOADING':
+        raise ValueError('Upload is already finalized')
+    if offset != session.received_bytes:
+        raise UploadOffsetMismatch(session.received_bytes)
+    if length > max_chunk_size():
+        raise ValueError(f'Chunk exceeds the {max_chunk_size()} byte limit')
+    if offset + length > session.total_size:
+        raise ValueError('Chunk runs past the declared file size')
+
+
+def append_chunk(session, offset, stream, length):
+    """
+    Write `length` bytes from `stream` at `offset`. Raises UploadOffsetMismatch
+    when offset is not the current end of the upload. Returns the updated session.
+
+    The body comes off the (possibly slow) client socket into a chunk file
+    before any lock is taken. The session row is only locked to re-check the
+    offset and append the chunk from local disk, so a retry of the same
+    upload never waits on another request's network read.
+    """
+    _check_chunk(session, offset, length)
+    chunk = _receive_chunk(session, stream, length)
+    try:
+        with transaction.atomic():
+            session = EvidenceUploadSession.objects.select_for_update().get(pk=session.pk)
+            # Another request may have appended this chunk while ours was arriving.
+            _check_chunk(session, offset, length)
+            path = part_path(session)
+            with open(path, 'r+b' if path.exists() else 'wb') as handle, open(chunk, 'rb') as source:
+                # Drop anything a failed earlier attempt wrote past the acknowledged offset.
+                handle.truncate(offset)
+                handle.seek(offset)
+                shutil.copyfileobj(source, handle, STREAM_BLOCK_SIZE)
+                handle.flush()
+                os.fsync(handle.fileno())
+            session.received_bytes = offset + length
+            session.save(update_fields=['received_bytes', 'updated_at'])
+    finally:
+        os.unlink(chunk)
+    return session
+
+
+def _store_part(session):
+    """Hash the part file and take a blob reference on it. Slow for large uploads, so it runs unlocked."""
+    path = part_path(session)
+    if session.total_size == 0:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    upload = StagedFile(path, name=session.file_name, size=session.total_size)
+    try:
+        return store_blob(upload, 'evidence', sha256=hash_upload(upload))
+    finally:
+        upload.close()
+
+
+def finalize(session):
+    """
+    Turn a fully received upload into an EvidenceDocument. Safe to call twice.
+
+    A complete upload takes no more appends, so the part file is hashed and
+    stored before any lock is taken; the session row is locked only to
+    create the document. Of two concurrent calls, the one that finds the
+    session already completed drops its blob reference and returns the
+    winner's document.
+    """
+    session = EvidenceUploadSession.objects.get(pk=session.pk)
+    if session.status == 'COMPLETED':
+        return session.document
+    if session.received_bytes != session.total_size:
+        raise ValueError(f'Upload is incomplete ({session.received_bytes}/{session.total_size} bytes)')
+
+    try:
+        blob = _store_part(session)
+    except FileNotFoundError as exc:
+        # A concurrent finalize already moved the part file into the blob store.
+        session.refresh_from_db()
+        if session.status == 'COMPLETED':
+            return session.document
+        raise ValueError('Upload is being finalized by another request; retry shortly') from exc
+
+    try:
+        with transaction.atomic():
+            session = EvidenceUploadSession.objects.select_for_update().get(pk=session.pk)
+            if session.status == 'COMPLETED':
+                release_blob(blob.sha256)
+                return session.document
+            document = EvidenceDocument.objects.create(
+                case_id=session.case_id,
+                uploader_id=session.uploader_id,
+                file_name=session.file_name,
+                storage_path=blob.storage_path,
+                file_size_bytes=session.total_size,
+                mime_type=session.mime_type,
+                encryption_hash=blob.sha256,
+                encryption_key_id=blob.encryption_key_id,
+            )
+            enqueue_evidence_preview(document)
+            enqueue_ingestion(document)
+            session.status = 'COMPLETED'
+            session.document = document
+            session.save(update_fields=['status', 'document', 'updated_at'])
+    except Exception:
+        release_blob(blob.sha256)
+        raise
+
+    # Left behind when the bytes were deduplicated or re-encrypted rather than moved.
+    discard_part(session)
+    return document
+
+
+def discard_part(session):
+    try:
+        part_path(session).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def purge_stale_sessions(ttl=None, dry_run=False):
+    """
+    Delete sessions idle for longer than `ttl` seconds together with their part
+    files, plus part files no session refers to and abandoned chunk files. Returns (sessions, orphan_files).
+    """
+    ttl = session_ttl() if ttl is None else ttl
+    cutoff = timezone.now() - timedelta(seconds=ttl)
+    stale = EvidenceUploadSession.objects.filter(updated_at__lt=cutoff)
+
+    sessions = 0
+    for session in stale.iterator():
+        sessions += 1
+        if not dry_run:
+            discard_part(session)
+            session.delete()
+
+    orphans = 0
+    directory = incoming_dir()
+    if directory.is_dir():
+        live = {str(pk) for pk in EvidenceUploadSession.objects.values_list('upload_id', flat=True)}
+        oldest_allowed = time.time() - ttl
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(('.part', '.chunk')):
+                    continue
+                # A .chunk file only outlives its request if the process died mid-request.
+                if entry.name.endswith('.part') and entry.name[:-len('.part')] in live:
+                    continue
+                if entry.stat().st_mtime >= oldest_allowed:
+                    continue
+                orphans += 1
+                if not dry_run:
+                    os.unlink(entry.path)
+    return sessions, orphans
@@ -10,12 +10,13 @@ from .views import (
     UserViewSet, CitizenProfileViewSet, LawyerProfileViewSet,
     AdminProfileViewSet, LegalSpecializationViewSet,
     LawyerSpecializationMapViewSet, CaseViewSet, CaseActivityLogViewSet,
-    CasePrivateNoteViewSet, EvidenceDocumentViewSet,
+    CasePrivateNoteViewSet, EvidenceDocumentViewSet, EvidenceUploadViewSet,
     DocumentShareTokenViewSet, AIConversationViewSet, AIMessageViewSet,
     AIPromptTemplateViewSet, AIDocumentChunkViewSet, AIFeedbackViewSet,
     LawyerAvailabilitySlotViewSet, ConsultationBookingViewSet,
-    NotificationViewSet, ChatMessageViewSet, LawyerReviewViewSet,
-    SystemSettingViewSet
+    NotificationViewSet, NotificationOutboxViewSet, ChatMessageViewSet, LawyerReviewViewSet,
+    SystemSettingViewSet, get_unread_counts, redeem_share_token, retrieve_context, assistant_chat,
+    answer_cache_statistics, embedding_statistics, get_ai_usage, feedback_analytics
 )
 
 router = DefaultRouter()
@@ -29,6 +30,7 @@ router.register(r'cases', CaseViewSet)
 router.register(r'case-activity-logs', CaseActivityLogViewSet)
 router.register(r'case-private-notes', CasePrivateNoteViewSet)
 router.register(r'evidence-documents', EvidenceDocumentViewSet)
+router.register(r'evidence-uploads', EvidenceUploadViewSet)
 router.register(r'document-share-tokens', DocumentShareTokenViewSet)
 router.register(r'ai-conversations', AIConversationViewSet)
 router.register(r'ai-messages', AIMessageViewSet)
@@ -38,6 +40,7 @@ router.register(r'ai-feedback', AIFeedbackViewSet)
 router.register(r'lawyer-availability-slots', LawyerAvailabilitySlotViewSet)
 router.register(r'consultation-bookings', ConsultationBookingViewSet)
 router.register(r'notifications', NotificationViewSet)
+router.register(r'notification-outbox', NotificationOutboxViewSet)
 router.register(r'chat-messages', ChatMessageViewSet)
 router.register(r'lawyer-reviews', LawyerReviewViewSet)
 router.register(r'system-settings', SystemSettingViewSet)
@@ -56,6 +59,20 @@ urlpatterns = [
     path('auth/password/reset/', request_password_reset, name='request_password_reset'),
     path('auth/password/reset/confirm/', reset_password_confirm, name='reset_password_confirm'),
     
+    # Current user
+    path('me/unread-counts/', get_unread_counts, name='unread_counts'),
+    path('me/ai-usage/', get_ai_usage, name='ai_usage'),
+
+    # AI assistant
+    path('ai/retrieve/', retrieve_context, name='retrieve_context'),
+    path('ai/chat/', assistant_chat, name='assistant_chat'),
+    path('ai/answer-cache/stats/', answer_cache_statistics, name='answer_cache_statistics'),
+    path('ai/embedding/stats/', embedding_statistics, name='embedding_statistics'),
+    path('ai/feedback/analytics/', feedback_analytics, name='feedback_analytics'),
+
+    # Public share links
+    path('share/<str:token>/', redeem_share_token, name='redeem_share_token'),
+
     # Dashboard
     path('dashboard/lawyer/', LawyerDashboardView.as_view(), name='lawyer-dashboard'),
 
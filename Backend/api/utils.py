@@ -1,39 +1,111 @@
+import json
 import uuid
 from pathlib import Path
 from typing import Optional
 
 from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.http import HttpRequest
+from django.urls import reverse
+
+from .models import SystemSetting
+from .storage import get_storage, save_file, shard_name
 
 
 def save_uploaded_file(file_obj, subdir: str) -> str:
-    """Persist an uploaded file under MEDIA_ROOT/subdir and return the relative path."""
+    """Persist an uploaded file in media storage under a sharded subdir/ab/cd/ name and return that name."""
     if not file_obj:
         raise ValueError('File object is required')
 
-    normalized_subdir = subdir.strip('/').replace('..', '') or 'uploads'
-    destination_dir = Path(settings.MEDIA_ROOT) / normalized_subdir
-    destination_dir.mkdir(parents=True, exist_ok=True)
-
-    extension = Path(file_obj.name).suffix
-    filename = f"{uuid.uuid4().hex}{extension}"
-    destination_path = destination_dir / filename
-
-    with destination_path.open('wb+') as destination:
-        for chunk in file_obj.chunks():
-            destination.write(chunk)
-
-    return f"{normalized_subdir}/{filename}"
+    filename = f"{uuid.uuid4().hex}{Path(file_obj.name).suffix}"
+    return save_file(shard_name(subdir, filename), file_obj)
 
 
 def build_public_url(relative_path: Optional[str], request: Optional[HttpRequest] = None) -> Optional[str]:
-    """Turn a stored relative path into an absolute (or MEDIA_URL) link for clients."""
+    """Turn a stored relative path into an absolute (or storage-relative) link for clients."""
     if not relative_path:
         return None
 
-    relative = relative_path.lstrip('/')
-    public_path = f"{settings.MEDIA_URL.rstrip('/')}/{relative}" if settings.MEDIA_URL else relative
+    public_path = get_storage().url(relative_path.lstrip('/'))
 
     if request:
         return request.build_absolute_uri(public_path)
     return public_path
+
+
+def build_photo_urls(relative_path: Optional[str], derivatives: Optional[dict],
+                     request: Optional[HttpRequest] = None) -> Optional[dict]:
+    """Size-specific links for a profile photo: {'original': ..., 'thumbnail': ..., 'medium_webp': ...}."""
+    if not relative_path:
+        return None
+    urls = {'original': build_public_url(relative_path, request)}
+    for variant, name in (derivatives or {}).items():
+        urls[variant] = build_public_url(name, request)
+    return urls
+
+
+def build_avatar_url(relative_path: Optional[str], derivatives: Optional[dict],
+                     request: Optional[HttpRequest] = None, variant: str = 'thumbnail') -> Optional[str]:
+    """Link to a downscaled photo, falling back to the original until its derivatives exist."""
+    if not relative_path:
+        return None
+    return build_public_url((derivatives or {}).get(variant) or relative_path, request)
+
+
+def build_download_url(document, request: Optional[HttpRequest] = None, variant: Optional[str] = None) -> str:
+    """Signed, short-lived link to an evidence document's download endpoint (usable without a bearer token)."""
+    token = signing.dumps(str(document.pk), salt='evidence-download')
+    path = f"{reverse('evidencedocument-download', kwargs={'pk': document.pk})}?sig={token}"
+    if variant:
+        path = f"{path}&variant={variant}"
+    if request:
+        return request.build_absolute_uri(path)
+    return path
+
+
+def verify_download_signature(token: str, document_id) -> bool:
+    """True when token was issued by build_download_url for document_id and has not expired."""
+    max_age = getattr(settings, 'EVIDENCE_LINK_TTL', 3600)
+    try:
+        return signing.loads(token, salt='evidence-download', max_age=max_age) == str(document_id)
+    except signing.BadSignature:
+        return False
+
+
+def cache_is_shared() -> bool:
+    """Whether the default cache is seen by every worker process (not LocMemCache/DummyCache)."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_system_setting(key: str, default=None):
+    """Read a SystemSetting value converted according to its data_type, or default if unset."""
+    setting = SystemSetting.objects.filter(setting_key=key).first()
+    if setting is None:
+        return default
+    try:
+        if setting.data_type == 'INTEGER':
+            return int(setting.setting_value)
+        if setting.data_type == 'BOOLEAN':
+            return setting.setting_value.strip().lower() in {'true', '1', 'yes'}
+        if setting.data_type == 'JSON':
+            return json.loads(setting.setting_value)
+    except (TypeError, ValueError):
+        return default
+    return setting.setting_value
+
+
+def set_system_setting(key: str, value, data_type: str = 'STRING', description: Optional[str] = None):
+    """Create or overwrite a SystemSetting, serialising value for its data_type."""
+    if data_type == 'JSON':
+        stored = json.dumps(value)
+    elif data_type == 'BOOLEAN':
+        stored = 'true' if value else 'false'
+    else:
+        stored = str(value)
+    defaults = {'setting_value': stored, 'data_type': data_type}
+    if description:
+        defaults['description'] = description
+    SystemSetting.objects.update_or_create(setting_key=key, defaults=defaults)
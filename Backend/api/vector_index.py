@@ -0,0 +1,510 @@
+"""
+Embedded vector index over AIDocumentChunk.
+
+Vectors live in flat files under VECTOR_INDEX_DIR and are read through
+numpy memory maps, so a web process only pages in what a query touches:
+
+- `vectors-<gen>.bin`: an n x dim matrix, float32 or int8 (VECTOR_INDEX_DTYPE).
+  The int8 form quantizes each row symmetrically and keeps its scale in
+  `scales-<gen>.bin`, which cuts the file to a quarter.
+- `ids-<gen>.bin`: the chunk_id of each row (int64).
+- `centroids-<gen>.bin` / `lists-<gen>.bin`: the optional IVF layer, k-means
+  centroids and the row offsets of each list. Compaction stores rows grouped
+  by list, so a probe reads contiguous slices.
+- `meta.json`: dim, dtype, embedder, generation and the committed row count.
+
+Appends write rows to the end of the current files and then publish the new
+count through an atomic replace of meta.json. Readers never see a half
+written row and re-open their maps when the metadata changes. Chunks that
+were deleted or re-ingested leave dead rows behind. `compact` rewrites the
+live rows into a new generation (re-clustering when IVF is on) and switches
+meta.json over to it. Readers that still hold the old maps keep working
+until they notice.
+
+Search embeds the query and scores rows with a blocked NumPy dot product,
+keeping a running top-k. In IVF mode (VECTOR_INDEX_MODE, or 'auto' past
+VECTOR_INDEX_IVF_MIN_ROWS rows) only the VECTOR_INDEX_NPROBE nearest lists
+and the rows appended since the last clustering are scored. A search can be
+limited to a set of chunk ids, which is how `search_chunks` keeps users
+inside the cases they can see. Those rows are then looked up by id and
+scored exactly.
+
+Embedders are pluggable (AI_EMBEDDER names a class). The default
+HashingEmbedder is a deterministic feature-hashing model: it needs no
+download and gives the same vectors everywhere, so it suits offline and test
+setups. Swap in a real local model for semantic quality and run
+`index_document_chunks --rebuild`.
+"""
+import json
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import AIDocumentChunk
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+SCORE_BLOCK_ROWS = 65536
+_TOKEN_RE = re.compile(r'\w+')
+
+
+class HashingEmbedder:
+    """Signed feature hashing of lowercased words and word bigrams, L2-normalized."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def _features(self, text):
+        words = _TOKEN_RE.findall(text.lower())
+        yield from words
+        for first, second in zip(words, words[1:]):
+            yield f'{first} {second}'
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                hashed = zlib.crc32(feature.encode('utf-8'))
+                matrix[row, hashed % self.dim] += 1.0 if hashed & 0x80000000 else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+_embedder = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        embedder_class = import_string(getattr(settings, 'AI_EMBEDDER', 'api.vector_index.HashingEmbedder'))
+        _embedder = embedder_class()
+    return _embedder
+
+
+@contextmanager
+def write_lock(directory):
+    """Serialize writers of an index directory across processes; readers never take the lock."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / 'write.lock', 'a+') as lock:
+        _lock_file(lock)
+        try:
+            yield
+        finally:
+            _unlock_file(lock)
+
+
+def _lock_file(lock):
+    if fcntl is not None:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return
+    lock.seek(0)
+    while True:
+        try:
+            # LK_LOCK gives up with OSError after about ten seconds; keep waiting like flock does.
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _unlock_file(lock):
+    if fcntl is not None:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        return
+    lock.seek(0)
+    msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def publish_json(path, data):
+    """Replace a JSON file atomically, so readers see the old or the new version, never a mix."""
+    tmp = path.with_name(f'{path.name}.tmp')
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def _as_float(vectors, scales, rows):
+    """Rows (a slice or index array) of the matrix as float32, undoing int8 quantization."""
+    block = np.asarray(vectors[rows], dtype=np.float32)
+    if scales is not None:
+        block *= np.asarray(scales[rows])[:, None]
+    return block
+
+
+def _scores(vectors, scales, rows, query):
+    """Dot products of the selected rows with query; int8 rows are rescaled after the product."""
+    scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+    if scales is not None:
+        scores *= scales[rows]
+    return scores
+
+
+def _quantize(vectors):
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class VectorIndex:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._meta = None
+        self._meta_stamp = None
+        self._maps = {}
+
+    # -- metadata and files -------------------------------------------------
+
+    def _file(self, kind, generation=None):
+        generation = self.meta['generation'] if generation is None else generation
+        return self.path / f'{kind}-{generation}.bin'
+
+    @property
+    def meta(self):
+        meta_path = self.path / 'meta.json'
+        try:
+            stat = meta_path.stat()
+        except FileNotFoundError:
+            return None
+        # Every publish is an os.replace, so a new inode means new metadata.
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp != self._meta_stamp:
+            self._meta = json.loads(meta_path.read_text())
+            self._meta_stamp = stamp
+            self._maps = {}
+        return self._meta
+
+    def exists(self):
+        return self.meta is not None
+
+    def __len__(self):
+        return self.meta['count'] if self.exists() else 0
+
+    def _write_meta(self, meta):
+        publish_json(self.path / 'meta.json', meta)
+
+    def _writer(self):
+        return write_lock(self.path)
+
+    def _map(self, kind, dtype, columns=None, rows=None):
+        meta = self.meta
+        rows = meta['count'] if rows is None else rows
+        key = (kind, rows)
+        if key not in self._maps:
+            shape = (rows, columns) if columns else (rows,)
+            self._maps[key] = np.memmap(self._file(kind), dtype=dtype, mode='r', shape=shape) if rows else np.empty(shape, dtype)
+        return self._maps[key]
+
+    def vectors(self):
+        meta = self.meta
+        return self._map('vectors', meta['dtype'], meta['dim'])
+
+    def ids(self):
+        return self._map('ids', np.int64)
+
+    def scales(self):
+        return self._map('scales', np.float32) if self.meta['dtype'] == 'int8' else None
+
+    def centroids(self):
+        clusters = self.meta.get('clusters', 0)
+        return self._map('centroids', np.float32, self.meta['dim'], rows=clusters) if clusters else None
+
+    # -- writes -------------------------------------------------------------
+
+    def reset(self, dim, embedder_name, dtype=None):
+        dtype = dtype or getattr(settings, 'VECTOR_INDEX_DTYPE', 'float32')
+        if dtype not in ('float32', 'int8'):
+            raise ValueError('VECTOR_INDEX_DTYPE must be float32 or int8')
+        with self._writer():
+            old = self.meta
+            generation = old['generation'] + 1 if old else 1
+            for kind in ('vectors', 'ids', 'scales'):
+                self._file(kind, generation).write_bytes(b'')
+            self._write_meta({
+                'dim': dim, 'dtype': dtype, 'embedder': embedder_name,
+                'generation': generation, 'count': 0, 'clusters': 0, 'clustered': 0,
+            })
+            if old:
+                self._remove_generation(old['generation'])
+
+    def _append_files(self, meta, ids, vectors):
+        """Append rows to the current generation's files and fsync them (meta is untouched)."""
+        generation = meta['generation']
+        records = [('ids', np.ascontiguousarray(ids, dtype=np.int64))]
+        if meta['dtype'] == 'int8':
+            quantized, scales = _quantize(vectors)
+            records += [('vectors', quantized), ('scales', scales)]
+        else:
+            records.append(('vectors', np.ascontiguousarray(vectors, dtype=np.float32)))
+        for kind, array in records:
+            with open(self._file(kind, generation), 'ab') as handle:
+                # Drop anything past the committed count left by an interrupted append.
+                row_bytes = array.itemsize * (array.shape[1] if array.ndim == 2 else 1)
+                handle.truncate(meta['count'] * row_bytes)
+                handle.write(array.tobytes())
+                handle.flush()
+                os.fsync(handle.fileno())
+
+    def append(self, ids, vectors):
+        """Add rows for chunk ids. Re-adding an id leaves the old row dead until compaction."""
+        if not len(ids):
+            return 0
+        with self._writer():
+            meta = dict(self.meta)
+            if vectors.shape[1] != meta['dim']:
+                raise ValueError(f"Expected {meta['dim']}-dimensional vectors, got {vectors.shape[1]}")
+            self._append_files(meta, ids, vectors.astype(np.float32, copy=False))
+            meta['count'] += len(ids)
+            self._write_meta(meta)
+        return len(ids)
+
+    def unclustered(self):
+        """Rows appended since the last clustering; IVF searches always scan them."""
+        meta = self.meta
+        return meta['count'] - meta.get('clustered', 0) if meta.get('clusters') else 0
+
+    def compact(self, live_ids=None, clusters=None):
+        """
+        Rewrite the index with one row per live chunk id (the newest) into a new
+        generation. With `clusters` IVF lists (default: keep the current number,
+        0 turns IVF off) rows are stored grouped by list, so probing a list reads
+        one contiguous slice. Returns (rows kept, rows dropped).
+        """
+        with self._writer():
+            meta = self.meta
+            ids = np.asarray(self.ids())
+            # The last row written for an id is the current one.
+            _, last = np.unique(ids[::-1], return_index=True)
+            keep = np.sort(len(ids) - 1 - last)
+            if live_ids is not None:
+                keep = keep[np.isin(ids[keep], live_ids)]
+            clusters = meta.get('clusters', 0) if clusters is None else clusters
+
+            generation = meta['generation'] + 1
+            new_meta = dict(meta, generation=generation, count=0, clusters=0, clustered=0)
+            for kind in ('vectors', 'ids', 'scales'):
+                self._file(kind, generation).write_bytes(b'')
+            if clusters and len(keep) >= clusters:
+                centroids = self._kmeans(keep, clusters)
+                assign = np.concatenate([
+                    np.argmax(self._gather(keep[start:start + SCORE_BLOCK_ROWS]) @ centroids.T, axis=1)
+                    for start in range(0, len(keep), SCORE_BLOCK_ROWS)
+                ])
+                order = np.argsort(assign, kind='stable')
+                keep = keep[order]
+                offsets = np.searchsorted(assign[order], np.arange(clusters + 1)).astype(np.int64)
+                centroids.tofile(self._file('centroids', generation))
+                offsets.tofile(self._file('lists', generation))
+                new_meta.update(clusters=clusters, clustered=len(keep))
+            for start in range(0, len(keep), SCORE_BLOCK_ROWS):
+                rows = keep[start:start + SCORE_BLOCK_ROWS]
+                self._append_files(new_meta, ids[rows], self._gather(rows))
+                new_meta['count'] += len(rows)
+            self._write_meta(new_meta)
+            self._remove_generation(meta['generation'])
+        return len(keep), len(ids) - len(keep)
+
+    def _gather(self, rows):
+        return _as_float(self.vectors(), self.scales(), rows)
+
+    def _kmeans(self, rows, clusters, iterations=10, sample_size=50000):
+        """Spherical k-means on a sample of rows; returns normalized float32 centroids."""
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(rows, size=min(len(rows), sample_size), replace=False))
+        data = self._gather(sample)
+        centroids = data[rng.choice(len(data), size=clusters, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.divide(sums, norms, out=sums, where=norms > 0)
+        return centroids.astype(np.float32)
+
+    def _remove_generation(self, generation):
+        for kind in ('vectors', 'ids', 'scales', 'centroids', 'lists'):
+            try:
+                self._file(kind, generation).unlink()
+            except FileNotFoundError:
+                pass
+
+    # -- search -------------------------------------------------------------
+
+    def _segments(self, query, count, mode, nprobe):
+        """(start, stop) row ranges to score: everything, or the probed IVF lists plus the unclustered tail."""
+        meta = self.meta
+        clusters = meta.get('clusters', 0)
+        if mode == 'auto':
+            mode = 'ivf' if count >= getattr(settings, 'VECTOR_INDEX_IVF_MIN_ROWS', 200000) else 'exact'
+        if mode != 'ivf' or not clusters:
+            return [(0, count)]
+        offsets = self._map('lists', np.int64, rows=clusters + 1)
+        nprobe = min(nprobe or getattr(settings, 'VECTOR_INDEX_NPROBE', 8), clusters)
+        probe = np.sort(np.argpartition(-(self.centroids() @ query), nprobe - 1)[:nprobe])
+        segments = [(int(offsets[cluster]), int(offsets[cluster + 1])) for cluster in probe]
+        segments.append((meta['clustered'], count))
+        return [(start, stop) for start, stop in segments if stop > start]
+
+    def _rows_for(self, ids, chunk_ids):
+        """Row of the newest entry for each chunk id present in the index."""
+        key = ('order', len(ids))
+        if key not in self._maps:
+            order = np.argsort(ids, kind='stable')
+            self._maps[key] = (order, np.asarray(ids)[order])
+        order, sorted_ids = self._maps[key]
+        positions = np.searchsorted(sorted_ids, chunk_ids, side='right') - 1
+        found = positions >= 0
+        positions, chunk_ids = positions[found], chunk_ids[found]
+        return np.sort(order[positions[sorted_ids[positions] == chunk_ids]])
+
+    def search(self, query, k=10, allowed_ids=None, mode=None, nprobe=None):
+        """
+        Top-k (chunk_id, score) by dot product, best first. With allowed_ids
+        only those chunks' rows are scored, exactly; otherwise the whole index
+        or, in IVF mode, the probed lists.
+        """
+        if not self.exists() or not len(self):
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        # Take the maps once so a concurrent compaction cannot mix generations mid-query.
+        vectors, scales, ids = self.vectors(), self.scales(), self.ids()
+        if allowed_ids is not None:
+            rows = self._rows_for(ids, np.unique(np.asarray(allowed_ids, dtype=np.int64)))
+            selections = [rows[start:start + SCORE_BLOCK_ROWS] for start in range(0, len(rows), SCORE_BLOCK_ROWS)]
+        else:
+            mode = mode or getattr(settings, 'VECTOR_INDEX_MODE', 'auto')
+            selections = [
+                slice(block, min(block + SCORE_BLOCK_ROWS, stop))
+                for start, stop in self._segments(query, len(ids), mode, nprobe)
+                for block in range(start, stop, SCORE_BLOCK_ROWS)
+            ]
+
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for selection in selections:
+            scores = _scores(vectors, scales, selection, query)
+            rows = np.arange(selection.start, selection.stop) if isinstance(selection, slice) else selection
+            rows = np.concatenate([best_rows, rows])
+            scores = np.concatenate([best_scores, scores])
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[top], scores[top]
+            best_rows, best_scores = rows, scores
+
+        order = np.argsort(-best_scores, kind='stable')
+        results, seen = [], set()
+        for row, score in zip(best_rows[order], best_scores[order]):
+            chunk_id = int(ids[row])
+            # A re-indexed chunk can have a dead twin until the next compaction.
+            if chunk_id not in seen:
+                seen.add(chunk_id)
+                results.append((chunk_id, float(score)))
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = VectorIndex(getattr(settings, 'VECTOR_INDEX_DIR', Path(settings.BASE_DIR) / 'vector_index'))
+        return _index
+
+
+def vector_id(embedder, chunk_id):
+    return f'{embedder.name}:{chunk_id}'
+
+
+def index_pending_chunks(batch_size=256, log=None):
+    """
+    Embed and append every chunk without a vector yet, adding the same batch
+    to the BM25 index. The next batch is embedded while the previous one is
+    written. Returns the number indexed.
+    """
+    from .embedding_queue import get_embedding_service
+    from .lexical_index import get_lexical_index
+
+    lexical = get_lexical_index()
+    embedder = get_embedding_service()
+    index = get_index()
+    if not index.exists():
+        index.reset(embedder.dim, embedder.name)
+    elif index.meta['embedder'] != embedder.name:
+        raise ValueError(
+            f"Index was built with {index.meta['embedder']}, not {embedder.name}; "
+            'rebuild it with index_document_chunks --rebuild'
+        )
+
+    indexed = 0
+    pending = AIDocumentChunk.objects.filter(vector_id__isnull=True).order_by('chunk_id')
+    last_id = 0
+    previous = None
+    while True:
+        batch = list(pending.filter(chunk_id__gt=last_id).values_list('chunk_id', 'content_text')[:batch_size])
+        embedding = embedder.submit([text for _, text in batch]) if batch else None
+        if previous is not None:
+            done, vectors = previous
+            chunk_ids = np.array([chunk_id for chunk_id, _ in done], dtype=np.int64)
+            index.append(chunk_ids, vectors.result())
+            lexical.add(done)
+            AIDocumentChunk.objects.bulk_update(
+                [AIDocumentChunk(chunk_id=chunk_id, vector_id=vector_id(embedder, chunk_id)) for chunk_id in chunk_ids.tolist()],
+                ['vector_id'],
+            )
+            indexed += len(done)
+            if log:
+                log(f'indexed {indexed} chunk(s)')
+        if not batch:
+            return indexed
+        previous = (batch, embedding)
+        last_id = batch[-1][0]
+
+
+def visible_chunks(user):
+    """Chunks of evidence the user may read, mirroring EvidenceDocumentViewSet.get_queryset."""
+    queryset = AIDocumentChunk.objects.filter(document__deleted_at__isnull=True)
+    if user.is_staff:
+        return queryset
+    return queryset.filter(
+        Q(document__case__citizen=user) |
+        Q(document__case__assigned_lawyer__user=user) |
+        Q(document__uploader=user)
+    )
+
+
+def search_chunks(user, text, k=10, case=None):
+    """Top-k (chunk_id, score) for a query among the chunks the user can see (optionally one case)."""
+    from .embedding_queue import get_embedding_service
+
+    queryset = visible_chunks(user).filter(vector_id__isnull=False)
+    query = get_embedding_service().embed([text])[0]
+    index = get_index()
+    if user.is_staff and case is None:
+        # Everything is visible: search the whole index and only drop chunks that have gone away.
+        results = index.search(query, k=k * 2)
+        live = set(queryset.filter(chunk_id__in=[chunk_id for chunk_id, _ in results]).values_list('chunk_id', flat=True))
+        return [(chunk_id, score) for chunk_id, score in results if chunk_id in live][:k]
+    if case is not None:
+        queryset = queryset.filter(document__case=case)
+    allowed = np.fromiter(queryset.values_list('chunk_id', flat=True).iterator(chunk_size=10000), dtype=np.int64)
+    if not len(allowed):
+        return []
+    return index.search(query, k=k, allowed_ids=allowed)
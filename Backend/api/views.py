@@ -1,34 +1,74 @@
 import mimetypes
+import uuid
+from datetime import date
 from pathlib import Path
 
-from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from django.utils.http import content_disposition_header
+from rest_framework import serializers, viewsets, status
+from rest_framework.decorators import (
+    action, api_view, authentication_classes, permission_classes, renderer_classes,
+)
 from rest_framework.parsers import FormParser, MultiPartParser
-from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from .models import (
     User, CitizenProfile, LawyerProfile, AdminProfile, LegalSpecialization,
     LawyerSpecializationMap, Case, CaseActivityLog, CasePrivateNote,
-    EvidenceDocument, DocumentShareToken, AIConversation, AIMessage,
+    EvidenceDocument, EvidenceUploadSession, DocumentShareToken, AIConversation, AIMessage,
     AIPromptTemplate, AIDocumentChunk, AIFeedback, LawyerAvailabilitySlot,
-    ConsultationBooking, Notification, ChatMessage, LawyerReview, SystemSetting
+    ConsultationBooking, Notification, NotificationDigest, NotificationOutbox, ChatMessage, LawyerReview,
+    SystemSetting
+)
+from . import prompt_registry
+from .activity_archive import activity_history
+from .answer_cache import cache_stats
+from .assistant import EventStreamRenderer, stream_reply
+from .blobs import release_blob, store_blob
+from .derivatives import derivative_names, enqueue_evidence_preview, derivative_mime_type
+from .downloads import serve_stored_file
+from .embedding_queue import get_embedding_service
+from .evidence_export import stream_case_evidence
+from .fanout import notify_case_parties
+from .feedback_rollup import rollup_report
+from .metering import check_quota, usage_summary
+from .ingestion import enqueue_ingestion
+from .notifications import notify
+from .retrieval import hybrid_search
+from .share_links import record_access, resolve_share_token
+from .storage import delete_file, get_storage
+from .unread import (
+    MESSAGES, NOTIFICATIONS, adjust_unread_count, reset_unread_count, unread_counts
 )
-from .utils import save_uploaded_file
+from .uploads import UploadOffsetMismatch, append_chunk, discard_part, finalize as finalize_upload
+from .utils import verify_download_signature
 from .serializers import (
     UserSerializer, CitizenProfileSerializer, LawyerProfileSerializer,
     AdminProfileSerializer, LegalSpecializationSerializer,
     LawyerSpecializationMapSerializer, CaseSerializer, CaseActivityLogSerializer,
-    CasePrivateNoteSerializer, EvidenceDocumentSerializer,
+    CasePrivateNoteSerializer, EvidenceDocumentSerializer, EvidenceUploadSessionSerializer,
     DocumentShareTokenSerializer, AIConversationSerializer, AIMessageSerializer,
     AIPromptTemplateSerializer, AIDocumentChunkSerializer, AIFeedbackSerializer,
     LawyerAvailabilitySlotSerializer, ConsultationBookingSerializer,
-    NotificationSerializer, ChatMessageSerializer, LawyerReviewSerializer,
-    SystemSettingSerializer
+    NotificationSerializer, NotificationOutboxSerializer, ChatMessageSerializer,
+    LawyerReviewSerializer, SystemSettingSerializer
 )
 
+
+def _parse_id_list(value):
+    """Accept a JSON list or a comma-separated string of integer ids."""
+    if value in (None, ''):
+        return None
+    if isinstance(value, str):
+        value = [item for item in value.split(',') if item.strip()]
+    if not isinstance(value, (list, tuple)):
+        raise ValueError('Expected a list of ids')
+    return [int(item) for item in value]
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -217,6 +257,45 @@ class CaseViewSet(viewsets.ModelViewSet):
             return serializer.save(citizen=self.request.user)
         return serializer.save()
 
+    def perform_update(self, serializer):
+        previous_status = serializer.instance.status
+        case = serializer.save()
+        if case.status != previous_status:
+            notify_case_parties(
+                case,
+                title=f'Case status updated: {case.get_status_display()}',
+                body=f'"{case.title}" moved from {previous_status} to {case.status}.',
+                metadata={'previous_status': previous_status, 'status': case.status},
+                created_by=self.request.user,
+            )
+
+    @action(detail=True, methods=['get'])
+    def activity(self, request, pk=None):
+        """
+        Activity for a case, newest first. Pass `before` (a log_id) to page back;
+        older pages are served from the cold archive once the hot table runs out.
+        """
+        case = self.get_object()
+        try:
+            before = request.query_params.get('before')
+            before = int(before) if before else None
+            limit = min(int(request.query_params.get('limit', 50)), 200)
+        except ValueError:
+            return Response({'error': 'before and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = activity_history(case, before=before, limit=limit)
+        next_before = results[-1]['log_id'] if len(results) == limit else None
+        return Response({'results': results, 'next_before': next_before})
+
+    @action(detail=True, methods=['get'], url_path=r'evidence\.zip', url_name='evidence-zip')
+    def evidence_zip(self, request, pk=None):
+        """All live evidence for the case as a ZIP streamed on the fly, with manifest.json."""
+        case = self.get_object()
+        response = StreamingHttpResponse(stream_case_evidence(case), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(True, f'case-{case.case_id}-evidence.zip')
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
 class CaseActivityLogViewSet(viewsets.ModelViewSet):
     queryset = CaseActivityLog.objects.all()
     serializer_class = CaseActivityLogSerializer
@@ -253,48 +332,237 @@ class EvidenceDocumentViewSet(viewsets.ModelViewSet):
 
         case = get_object_or_404(Case, case_id=case_id)
 
-        storage_path = save_uploaded_file(file_obj, 'evidence')
+        blob = store_blob(file_obj, 'evidence')
         mime_type = file_obj.content_type or mimetypes.guess_type(file_obj.name)[0] or 'application/octet-stream'
 
         document = EvidenceDocument.objects.create(
             case=case,
             uploader=request.user,
             file_name=file_obj.name,
-            storage_path=storage_path,
+            storage_path=blob.storage_path,
             file_size_bytes=file_obj.size,
             mime_type=mime_type,
+            encryption_hash=blob.sha256,
+            encryption_key_id=blob.encryption_key_id,
         )
+        enqueue_evidence_preview(document)
+        enqueue_ingestion(document)
 
         serializer = self.get_serializer(document)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def download(self, request, pk=None):
+        """
+        Stream the document's plaintext, or one of its previews with `variant`.
+        Callers either authenticate normally or present the signed `sig` from
+        file_url, so plain links keep working.
+        """
+        signature = request.query_params.get('sig')
+        if request.user and request.user.is_authenticated:
+            document = self.get_object()
+        elif signature and verify_download_signature(signature, pk):
+            document = get_object_or_404(EvidenceDocument, pk=pk)
+        else:
+            return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        variant = request.query_params.get('variant')
+        if variant:
+            name = (document.derivatives or {}).get(variant)
+            if not name or not get_storage().exists(name):
+                raise Http404('Preview is not available')
+            return serve_stored_file(
+                request,
+                name,
+                content_type=derivative_mime_type(name),
+                filename=f"{Path(document.file_name).stem}-{variant}{Path(name).suffix}",
+            )
+
+        if not document.storage_path or not get_storage().exists(document.storage_path):
+            raise Http404('File is missing from storage')
+        return serve_stored_file(
+            request,
+            document.storage_path,
+            content_type=document.mime_type,
+            filename=document.file_name,
+            content_hash=document.encryption_hash,
+        )
+
     def perform_destroy(self, instance):
         storage_path = instance.storage_path
-        super().perform_destroy(instance)
-        if storage_path:
-            file_path = (Path(settings.MEDIA_ROOT) / storage_path).resolve()
-            try:
-                if file_path.exists() and file_path.is_file():
-                    file_path.unlink()
-            except FileNotFoundError:
-                pass
+        content_hash = instance.encryption_hash
+        with transaction.atomic():
+            super().perform_destroy(instance)
+            if content_hash:
+                # Shared blob: only the last reference removes the file.
+                release_blob(content_hash)
+                return
+        delete_file(storage_path)
+        for name in derivative_names(storage_path):
+            delete_file(name)
+
+class EvidenceUploadViewSet(viewsets.GenericViewSet):
+    """
+    Resumable evidence uploads: POST to open a session, PATCH raw bytes with an
+    `Upload-Offset` header, GET/HEAD to learn the current offset after a dropped
+    connection, then POST finalize/ to create the EvidenceDocument.
+    """
+    queryset = EvidenceUploadSession.objects.all()
+    serializer_class = EvidenceUploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return EvidenceUploadSession.objects.filter(uploader=self.request.user)
+
+    def _with_offset(self, session, response_status=status.HTTP_200_OK):
+        response = Response(self.get_serializer(session).data, status=response_status)
+        response['Upload-Offset'] = str(session.received_bytes)
+        response['Upload-Length'] = str(session.total_size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file_name = serializer.validated_data['file_name']
+        mime_type = (
+            serializer.validated_data.get('mime_type')
+            or mimetypes.guess_type(file_name)[0]
+            or 'application/octet-stream'
+        )
+        session = serializer.save(uploader=request.user, mime_type=mime_type)
+        return self._with_offset(session, status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._with_offset(self.get_object())
+
+    def partial_update(self, request, *args, **kwargs):
+        session = self.get_object()
+        if not request.headers.get('Content-Length'):
+            return Response({'error': 'Content-Length header is required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers['Content-Length'])
+        except ValueError:
+            return Response({'error': 'Upload-Offset and Content-Length must be integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session = append_chunk(session, offset, request.stream, length)
+        except UploadOffsetMismatch as exc:
+            response = Response({'error': str(exc), 'offset': exc.offset}, status=status.HTTP_409_CONFLICT)
+            response['Upload-Offset'] = str(exc.offset)
+            return response
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._with_offset(session)
+
+    def destroy(self, request, *args, **kwargs):
+        session = self.get_object()
+        if session.status == 'UPLOADING':
+            discard_part(session)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        try:
+            document = finalize_upload(session)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = EvidenceDocumentSerializer(document, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 class DocumentShareTokenViewSet(viewsets.ModelViewSet):
     queryset = DocumentShareToken.objects.all()
     serializer_class = DocumentShareTokenSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        # Only the user who generated a link (or staff) may see, change or revoke it.
+        if self.request.user.is_staff:
+            return DocumentShareToken.objects.order_by('-created_at')
+        return DocumentShareToken.objects.filter(generated_by=self.request.user).order_by('-created_at')
+
+    @action(detail=True, methods=['post'])
+    def revoke(self, request, pk=None):
+        token = self.get_object()
+        if not token.is_revoked:
+            token.is_revoked = True
+            token.save(update_fields=['is_revoked'])
+        return Response(self.get_serializer(token).data)
 
 class AIConversationViewSet(viewsets.ModelViewSet):
     queryset = AIConversation.objects.all()
     serializer_class = AIConversationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        # Assistant chats quote the user's private evidence: owners (and staff) only.
+        if self.request.user.is_staff:
+            return AIConversation.objects.order_by('-updated_at')
+        return AIConversation.objects.filter(user=self.request.user).order_by('-updated_at')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
 
-class AIMessageViewSet(viewsets.ModelViewSet):
+class AIMessageViewSet(viewsets.ReadOnlyModelViewSet):
+    """Messages are written by the assistant gateway only (api/assistant.py)."""
     queryset = AIMessage.objects.all()
     serializer_class = AIMessageSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return AIMessage.objects.order_by('message_id')
+        return AIMessage.objects.filter(conversation__user=self.request.user).order_by('message_id')
 
 class AIPromptTemplateViewSet(viewsets.ModelViewSet):
     queryset = AIPromptTemplate.objects.all()
     serializer_class = AIPromptTemplateSerializer
+    # The active legal_assistant template is the live system prompt for every user.
+    permission_classes = [IsAdminUser]
+
+    def _active_set(self, feature_key):
+        active = AIPromptTemplate.objects.filter(feature_key=feature_key, is_active=True).order_by('version')
+        return Response({
+            'feature_key': feature_key,
+            'active': AIPromptTemplateSerializer(active, many=True).data,
+        })
+
+    @action(detail=True, methods=['post'])
+    def promote(self, request, pk=None):
+        """Serve this template's version to all traffic for its feature."""
+        template = self.get_object()
+        prompt_registry.promote(template.feature_key, template.version)
+        return self._active_set(template.feature_key)
+
+    @action(detail=False, methods=['post'])
+    def split(self, request):
+        """A/B split: `weights` maps versions of `feature_key` to their share of users."""
+        feature_key = request.data.get('feature_key')
+        weights = request.data.get('weights')
+        if not feature_key or not isinstance(weights, dict):
+            return Response({'error': 'feature_key and weights are required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            prompt_registry.split(feature_key, weights)
+        except (TypeError, ValueError) as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._active_set(feature_key)
+
+    @action(detail=False, methods=['post'])
+    def rollback(self, request):
+        """Restore the versions that were active before the last promote, split or rollback."""
+        feature_key = request.data.get('feature_key')
+        if not feature_key:
+            return Response({'error': 'feature_key is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            prompt_registry.rollback(feature_key)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._active_set(feature_key)
 
 class AIDocumentChunkViewSet(viewsets.ModelViewSet):
     queryset = AIDocumentChunk.objects.all()
@@ -359,10 +627,85 @@ class NotificationViewSet(viewsets.ModelViewSet):
             return Notification.objects.filter(user__user_id=user_param)
         return Notification.objects.filter(user=self.request.user)
 
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        result = notify(
+            data['user'], data['type'], data['title'], data['body'],
+            metadata=data.get('metadata_json'),
+        )
+        if isinstance(result, NotificationDigest):
+            # DAILY_DIGEST recipient: nothing is visible until the digest is delivered.
+            return Response(
+                {'status': 'held for the daily digest', 'day': result.day.isoformat(), 'event_count': result.event_count},
+                status=status.HTTP_202_ACCEPTED,
+            )
+        return Response(self.get_serializer(result).data, status=status.HTTP_201_CREATED)
+
+    def perform_update(self, serializer):
+        was_read = serializer.instance.is_read
+        notification = serializer.save()
+        if notification.is_read != was_read:
+            adjust_unread_count(notification.user_id, NOTIFICATIONS, -1 if notification.is_read else 1)
+
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
-        self.get_queryset().update(is_read=True)
-        return Response({'status': 'marked all as read'})
+        user_param = request.query_params.get('userId')
+        target_user_id = request.user.pk
+        if user_param and request.user.is_staff:
+            try:
+                # The counter key must match str(user.pk), whatever form the UUID was sent in.
+                target_user_id = uuid.UUID(user_param)
+            except ValueError:
+                return Response({'error': 'Invalid userId'}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            self.get_queryset().update(is_read=True)
+        reset_unread_count(target_user_id, NOTIFICATIONS)
+        return Response({'status': 'marked all as read', 'unread': unread_counts(request.user)})
+
+    @action(detail=False, methods=['post'], url_path='mark-read')
+    def mark_read(self, request):
+        """
+        Mark several notifications as read with a single UPDATE.
+        Accepts either `ids` (explicit list) or `up_to` (every notification id <= up_to).
+        """
+        try:
+            ids = _parse_id_list(request.data.get('ids'))
+            up_to = request.data.get('up_to')
+            up_to = int(up_to) if up_to not in (None, '') else None
+        except (TypeError, ValueError):
+            return Response({'error': 'ids and up_to must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not ids and up_to is None:
+            return Response({'error': 'ids or up_to is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = Notification.objects.filter(user=request.user, is_read=False)
+        if ids:
+            queryset = queryset.filter(notification_id__in=ids)
+        if up_to is not None:
+            queryset = queryset.filter(notification_id__lte=up_to)
+
+        with transaction.atomic():
+            updated = queryset.update(is_read=True)
+        adjust_unread_count(request.user.pk, NOTIFICATIONS, -updated)
+        return Response({'updated': updated, 'unread': unread_counts(request.user)})
+
+class NotificationOutboxViewSet(viewsets.ModelViewSet):
+    """
+    Admin broadcasts. Creating an entry only writes the outbox row; the
+    process_notification_outbox worker expands it into notifications.
+    """
+    queryset = NotificationOutbox.objects.all().order_by('-outbox_id')
+    serializer_class = NotificationOutboxSerializer
+    permission_classes = [IsAdminUser]
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(created_by=request.user)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 class ChatMessageViewSet(viewsets.ModelViewSet):
     queryset = ChatMessage.objects.all()
@@ -383,6 +726,62 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(sender=self.request.user)
 
+    def perform_update(self, serializer):
+        was_unread = (serializer.instance.receiver_id, not serializer.instance.is_read)
+        extra = {}
+        # is_read is read-only in the serializer; only the receiver may acknowledge a message.
+        if 'is_read' in self.request.data and serializer.instance.receiver_id == self.request.user.pk:
+            try:
+                extra['is_read'] = serializers.BooleanField().to_internal_value(self.request.data['is_read'])
+            except serializers.ValidationError as exc:
+                raise serializers.ValidationError({'is_read': exc.detail})
+        message = serializer.save(**extra)
+        is_unread = (message.receiver_id, not message.is_read)
+        if is_unread != was_unread:
+            if was_unread[1]:
+                adjust_unread_count(was_unread[0], MESSAGES, -1)
+            if is_unread[1]:
+                adjust_unread_count(is_unread[0], MESSAGES, 1)
+
+    @action(detail=False, methods=['post'], url_path='mark-read')
+    def mark_read(self, request):
+        """
+        Mark received messages as read with a single UPDATE.
+        Accepts either `message_ids` (explicit list) or `up_to` together with the
+        thread it applies to (`case` and/or `peer`, the other participant's user id).
+        """
+        try:
+            message_ids = _parse_id_list(request.data.get('message_ids'))
+            up_to = request.data.get('up_to')
+            up_to = int(up_to) if up_to not in (None, '') else None
+            case_id = request.data.get('case') or request.data.get('case_id')
+            peer_id = request.data.get('peer') or request.data.get('peer_id')
+            case_id = uuid.UUID(str(case_id)) if case_id else None
+            peer_id = uuid.UUID(str(peer_id)) if peer_id else None
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid message_ids, up_to, case or peer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not message_ids and up_to is None:
+            return Response({'error': 'message_ids or up_to is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if up_to is not None and not (case_id or peer_id):
+            return Response({'error': 'case or peer is required with up_to'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only the receiver can acknowledge a message.
+        queryset = ChatMessage.objects.filter(receiver=request.user, is_read=False)
+        if message_ids:
+            queryset = queryset.filter(message_id__in=message_ids)
+        if up_to is not None:
+            queryset = queryset.filter(message_id__lte=up_to)
+        if case_id:
+            queryset = queryset.filter(case_id=case_id)
+        if peer_id:
+            queryset = queryset.filter(sender_id=peer_id)
+
+        with transaction.atomic():
+            updated = queryset.update(is_read=True)
+        adjust_unread_count(request.user.pk, MESSAGES, -updated)
+        return Response({'updated': updated, 'unread': unread_counts(request.user)})
+
 class LawyerReviewViewSet(viewsets.ModelViewSet):
     queryset = LawyerReview.objects.all()
     serializer_class = LawyerReviewSerializer
@@ -390,6 +789,147 @@ class LawyerReviewViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(citizen=self.request.user)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_unread_counts(request):
+    """
+    Unread notification and message counts for the header badges, served from the cache
+    """
+    return Response(unread_counts(request.user))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_ai_usage(request):
+    """
+    Tokens the user has spent on the AI assistant today and their daily quota
+    """
+    return Response(usage_summary(request.user))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def retrieve_context(request):
+    """
+    Evidence passages relevant to a question (BM25 + vector search fused with
+    RRF), as citations for the assistant. Optional `case` narrows to one case.
+    """
+    query = (request.data.get('query') or '').strip()
+    if not query:
+        return Response({'error': 'query is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        k = min(max(int(request.data.get('k', 8)), 1), 50)
+    except (TypeError, ValueError):
+        return Response({'error': 'k must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    case = None
+    case_id = request.data.get('case') or request.data.get('case_id')
+    if case_id:
+        try:
+            case_id = uuid.UUID(str(case_id))
+        except ValueError:
+            return Response({'error': 'Invalid case'}, status=status.HTTP_400_BAD_REQUEST)
+        case = get_object_or_404(Case, case_id=case_id)
+    return Response({'query': query, 'citations': hybrid_search(request.user, query, k=k, case=case)})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def assistant_chat(request):
+    """
+    Ask the legal assistant. The reply streams back as Server-Sent Events and
+    both messages are stored on the conversation (see api/assistant.py).
+    Omit `conversation_id` to start a new conversation.
+    """
+    message = (request.data.get('message') or '').strip()
+    if not message:
+        return Response({'error': 'message is required'}, status=status.HTTP_400_BAD_REQUEST)
+    conversation = None
+    conversation_id = request.data.get('conversation_id')
+    if conversation_id:
+        try:
+            conversation_id = uuid.UUID(str(conversation_id))
+        except ValueError:
+            return Response({'error': 'Invalid conversation_id'}, status=status.HTTP_400_BAD_REQUEST)
+        conversation = get_object_or_404(AIConversation, conversation_id=conversation_id, user=request.user)
+    case = None
+    case_id = request.data.get('case') or request.data.get('case_id')
+    if case_id:
+        try:
+            case_id = uuid.UUID(str(case_id))
+        except ValueError:
+            return Response({'error': 'Invalid case'}, status=status.HTTP_400_BAD_REQUEST)
+        case = get_object_or_404(Case, case_id=case_id)
+    allowed, used, limit = check_quota(request.user)
+    if not allowed:
+        return Response(
+            {'error': 'Daily AI usage limit reached. Please try again tomorrow.', 'used_tokens': used, 'daily_limit': limit},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+        )
+
+    response = StreamingHttpResponse(
+        stream_reply(request.user, message, conversation=conversation, case=case),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer, so tokens reach the browser as they are produced.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def answer_cache_statistics(request):
+    """Hit rate of the assistant's answer cache and its most-served questions"""
+    return Response(cache_stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def embedding_statistics(request):
+    """Batch-size and latency histograms of this process's embedding queue"""
+    return Response(get_embedding_service().stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def feedback_analytics(request):
+    """
+    Assistant feedback rates and confidence calibration per model and prompt
+    template version, from the rollup (`since`/`until` days, `model_version`,
+    `template_version` narrow it)
+    """
+    try:
+        since = date.fromisoformat(request.query_params['since']) if request.query_params.get('since') else None
+        until = date.fromisoformat(request.query_params['until']) if request.query_params.get('until') else None
+        template_version = request.query_params.get('template_version')
+        template_version = int(template_version) if template_version else None
+    except ValueError:
+        return Response({'error': 'since/until must be YYYY-MM-DD and template_version an integer'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response(rollup_report(since, until, request.query_params.get('model_version') or None, template_version))
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def redeem_share_token(request, token):
+    """
+    Public download through a share link. Validation is served from the cache
+    and access counts are written in batches (see api/share_links.py).
+    """
+    grant = resolve_share_token(token)
+    if grant is None:
+        return Response({'error': 'This link is invalid or has expired'}, status=status.HTTP_404_NOT_FOUND)
+    if not get_storage().exists(grant['storage_path']):
+        raise Http404('File is missing from storage')
+
+    response = serve_stored_file(
+        request,
+        grant['storage_path'],
+        content_type=grant['mime_type'],
+        filename=grant['file_name'],
+        content_hash=grant['content_hash'],
+    )
+    # One hit per download: skip HEAD, 304s and follow-up Range requests.
+    first_byte = request.META.get('HTTP_RANGE', 'bytes=0-').replace(' ', '').startswith('bytes=0-')
+    if request.method == 'GET' and response.status_code in (200, 206) and first_byte:
+        record_access(grant)
+    return response
+
 class SystemSettingViewSet(viewsets.ModelViewSet):
     queryset = SystemSetting.objects.all()
     serializer_class = SystemSettingSerializer
@@ -1,6 +1,7 @@
 from pathlib import Path
 import os
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -124,6 +125,133 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'public'
 
+# Media files go through default_storage (see api/storage.py). Point MEDIA_STORAGE_BACKEND at
+# any Django storage, e.g. 'storages.backends.s3.S3Storage' against a local S3-compatible server.
+STORAGES = {
+    'default': {'BACKEND': os.environ.get('MEDIA_STORAGE_BACKEND', 'django.core.files.storage.FileSystemStorage')},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Cache
+# LocMemCache is per-process; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# cache (Redis, Memcached) when running more than one worker so counters agree.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'cla-default'),
+    }
+}
+
+# Seconds before cached unread counters are reconciled against the database
+UNREAD_COUNTS_TTL = int(os.environ.get('UNREAD_COUNTS_TTL', '300'))
+
+# Share links: seconds a token validation stays cached, and how many hits
+# (or seconds) to accumulate before access_count is flushed to the database
+SHARE_TOKEN_CACHE_TTL = int(os.environ.get('SHARE_TOKEN_CACHE_TTL', '60'))
+SHARE_ACCESS_FLUSH_BATCH = int(os.environ.get('SHARE_ACCESS_FLUSH_BATCH', '100'))
+SHARE_ACCESS_FLUSH_INTERVAL = int(os.environ.get('SHARE_ACCESS_FLUSH_INTERVAL', '30'))
+
+# Evidence ingestion for the AI assistant (api/ingestion.py): chunk size and
+# overlap in tokens, and rows per bulk_create
+AI_CHUNK_TOKENS = int(os.environ.get('AI_CHUNK_TOKENS', '400'))
+AI_CHUNK_OVERLAP = int(os.environ.get('AI_CHUNK_OVERLAP', '50'))
+AI_CHUNK_BATCH_SIZE = int(os.environ.get('AI_CHUNK_BATCH_SIZE', '500'))
+
+# Local vector index over AI document chunks (api/vector_index.py). AI_EMBEDDER
+# is the dotted path of the embedder class; VECTOR_INDEX_MODE is exact, ivf or
+# auto (IVF once the index has VECTOR_INDEX_IVF_MIN_ROWS rows and clusters).
+AI_EMBEDDER = os.environ.get('AI_EMBEDDER', 'api.vector_index.HashingEmbedder')
+VECTOR_INDEX_DIR = Path(os.environ.get('VECTOR_INDEX_DIR', BASE_DIR / 'vector_index'))
+VECTOR_INDEX_DTYPE = os.environ.get('VECTOR_INDEX_DTYPE', 'float32')
+VECTOR_INDEX_MODE = os.environ.get('VECTOR_INDEX_MODE', 'auto')
+VECTOR_INDEX_IVF_MIN_ROWS = int(os.environ.get('VECTOR_INDEX_IVF_MIN_ROWS', '200000'))
+VECTOR_INDEX_NPROBE = int(os.environ.get('VECTOR_INDEX_NPROBE', '8'))
+VECTOR_INDEX_COMPACT_RATIO = float(os.environ.get('VECTOR_INDEX_COMPACT_RATIO', '0.2'))
+
+# Embedding micro-batches (api/embedding_queue.py): texts per embedder call,
+# and how long the first request of a batch may wait for company
+AI_EMBED_BATCH_SIZE = int(os.environ.get('AI_EMBED_BATCH_SIZE', '64'))
+AI_EMBED_BATCH_WAIT_MS = float(os.environ.get('AI_EMBED_BATCH_WAIT_MS', '2'))
+
+# BM25 index (api/lexical_index.py) and hybrid retrieval: small segments are
+# merged once there are more than LEXICAL_MAX_SEGMENTS; each retriever
+# contributes RETRIEVAL_CANDIDATES chunks to the rank fusion
+LEXICAL_INDEX_DIR = Path(os.environ.get('LEXICAL_INDEX_DIR', BASE_DIR / 'lexical_index'))
+LEXICAL_MAX_SEGMENTS = int(os.environ.get('LEXICAL_MAX_SEGMENTS', '8'))
+RETRIEVAL_CANDIDATES = int(os.environ.get('RETRIEVAL_CANDIDATES', '50'))
+
+# Legal assistant gateway (api/llm.py, api/assistant.py). AI_LLM_PROVIDER is
+# the dotted path of the provider class; the stub answers offline. The Gemini
+# provider reads GEMINI_API_KEY and AI_LLM_MODEL
+AI_LLM_PROVIDER = os.environ.get('AI_LLM_PROVIDER', 'api.llm.StubProvider')
+AI_LLM_MODEL = os.environ.get('AI_LLM_MODEL', 'gemini-2.5-flash')
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+AI_LLM_MAX_TOKENS = int(os.environ.get('AI_LLM_MAX_TOKENS', '1024'))
+AI_LLM_STUB_DELAY = float(os.environ.get('AI_LLM_STUB_DELAY', '0'))
+
+# Conversation context (api/context_window.py): token budget for the rolling
+# summary plus recent turns, the summary's own cap, and the summarizer class
+AI_CONTEXT_TOKENS = int(os.environ.get('AI_CONTEXT_TOKENS', '3000'))
+AI_SUMMARY_TOKENS = int(os.environ.get('AI_SUMMARY_TOKENS', '400'))
+AI_SUMMARIZER = os.environ.get('AI_SUMMARIZER', 'api.context_window.ExtractiveSummarizer')
+
+# Answer cache for the assistant's general questions (api/answer_cache.py):
+# entry lifetime in seconds, capacity before the least recently hit are
+# culled, and the cosine similarity a near-duplicate question must reach
+AI_ANSWER_CACHE_ENABLED = os.environ.get('AI_ANSWER_CACHE_ENABLED', 'True') == 'True'
+AI_ANSWER_CACHE_TTL = int(os.environ.get('AI_ANSWER_CACHE_TTL', str(7 * 24 * 3600)))
+AI_ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('AI_ANSWER_CACHE_MAX_ENTRIES', '5000'))
+AI_ANSWER_CACHE_SIMILARITY = float(os.environ.get('AI_ANSWER_CACHE_SIMILARITY', '0.9'))
+ANSWER_CACHE_INDEX_DIR = Path(os.environ.get('ANSWER_CACHE_INDEX_DIR', VECTOR_INDEX_DIR / 'answer_cache'))
+
+# AI usage metering (api/metering.py): replies (or seconds) to accumulate
+# before token totals are written to AIUsageDaily, how long the quota
+# SystemSettings stay cached, and, with a per-process cache (LocMemCache),
+# how often a usage counter is re-seeded from the database
+AI_USAGE_FLUSH_BATCH = int(os.environ.get('AI_USAGE_FLUSH_BATCH', '100'))
+AI_USAGE_FLUSH_INTERVAL = int(os.environ.get('AI_USAGE_FLUSH_INTERVAL', '30'))
+AI_USAGE_COUNTER_TTL = int(os.environ.get('AI_USAGE_COUNTER_TTL', '30'))
+AI_QUOTA_CONFIG_TTL = int(os.environ.get('AI_QUOTA_CONFIG_TTL', '300'))
+
+# AIFeedback rollup (api/feedback_rollup.py): feedback rows per transaction,
+# and how many seconds old feedback must be before a run picks it up
+AI_FEEDBACK_ROLLUP_BATCH = int(os.environ.get('AI_FEEDBACK_ROLLUP_BATCH', '2000'))
+AI_FEEDBACK_ROLLUP_LAG = int(os.environ.get('AI_FEEDBACK_ROLLUP_LAG', '60'))
+
+# Seconds a process may serve its compiled prompt templates before reloading
+# them even without an invalidation (api/prompt_registry.py)
+PROMPT_REGISTRY_TTL = int(os.environ.get('PROMPT_REGISTRY_TTL', '300'))
+
+# Notification coalescing: bursts of these types for the same user and case
+# are merged into one unread row if they arrive within the window (seconds).
+NOTIFICATION_COALESCE_TYPES = ('CASE_UPDATE', 'MESSAGE')
+NOTIFICATION_COALESCE_WINDOW = int(os.environ.get('NOTIFICATION_COALESCE_WINDOW', '900'))
+# Seconds a claimed notification outbox entry may go without progress before
+# `process_notification_outbox --resume` hands it to another worker
+NOTIFICATION_OUTBOX_LEASE = int(os.environ.get('NOTIFICATION_OUTBOX_LEASE', '600'))
+
+# Month-partitioned cold segments for CaseActivityLog
+ACTIVITY_LOG_ARCHIVE_DIR = Path(os.environ.get('ACTIVITY_LOG_ARCHIVE_DIR', BASE_DIR / 'archive' / 'case_activity_log'))
+
+# Evidence encryption at rest (chunked AES-256-GCM, see api/evidence_crypto.py)
+EVIDENCE_ENCRYPTION_ENABLED = os.environ.get('EVIDENCE_ENCRYPTION_ENABLED', 'True') == 'True'
+EVIDENCE_KEYRING_PATH = Path(os.environ.get('EVIDENCE_KEYRING_PATH', BASE_DIR / 'keyring.json'))
+EVIDENCE_CHUNK_SIZE = 64 * 1024
+# Lifetime (seconds) of the signed evidence download links handed out in file_url
+EVIDENCE_LINK_TTL = int(os.environ.get('EVIDENCE_LINK_TTL', '3600'))
+# Resumable evidence uploads: largest accepted PATCH body and file, and idle time before a session is purged
+EVIDENCE_UPLOAD_MAX_CHUNK = int(os.environ.get('EVIDENCE_UPLOAD_MAX_CHUNK', str(16 * 1024 * 1024)))
+EVIDENCE_UPLOAD_MAX_SIZE = int(os.environ.get('EVIDENCE_UPLOAD_MAX_SIZE', str(2 * 1024 * 1024 * 1024)))
+EVIDENCE_UPLOAD_SESSION_TTL = int(os.environ.get('EVIDENCE_UPLOAD_SESSION_TTL', str(24 * 60 * 60)))
+# Hand plaintext files to the front proxy: '' (stream from Django), 'x-accel-redirect' (nginx) or 'x-sendfile'.
+# Only files stored in plaintext are offloaded: previews and thumbnails, and
+# evidence stored while EVIDENCE_ENCRYPTION_ENABLED was off. Encrypted evidence
+# (the default) has to be decrypted in Python, which reads only the chunks a
+# Range request touches.
+EVIDENCE_SENDFILE_MODE = os.environ.get('EVIDENCE_SENDFILE_MODE', '')
+# nginx `internal` location aliased to MEDIA_ROOT, used with x-accel-redirect
+EVIDENCE_SENDFILE_PREFIX = os.environ.get('EVIDENCE_SENDFILE_PREFIX', '/protected-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -148,6 +276,9 @@ CORS_ALLOWED_ORIGINS = [
 ]
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_ALL_ORIGINS = False
+# Resumable evidence uploads send and read the byte offset in headers
+CORS_ALLOW_HEADERS = (*default_headers, 'upload-offset')
+CORS_EXPOSE_HEADERS = ['Upload-Offset', 'Upload-Length']
 
 # REST Framework Settings
 REST_FRAMEWORK = {
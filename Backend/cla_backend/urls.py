@@ -1,7 +1,13 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.http import Http404
+from django.urls import path, include, re_path
+
+
+def evidence_not_public(request, path):
+    # Evidence is served only by /api/evidence-documents/{id}/download/, which checks access.
+    raise Http404
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -9,4 +15,7 @@ urlpatterns = [
 ]
 
 if settings.DEBUG:
+    urlpatterns += [
+        re_path(rf"^{settings.MEDIA_URL.strip('/')}/(?P<path>evidence/.*)$", evidence_not_public),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,5 +1,5 @@
 import React, { useState, useRef, useEffect } from 'react';
-import { streamChatResponse } from '../services/geminiService';
+import { resetConversation, streamChatResponse } from '../services/assistantService';
 import type { ChatMessage } from '../types';
 import { SendIcon, CloseIcon, TrashIcon, RetryIcon, ArrowsPointingInIcon, ArrowsPointingOutIcon, SparklesIcon, MicIcon, BookOpenIcon, DocumentTextIcon } from './icons';
 import { ConfirmationModal } from './ui/ConfirmationModal';
@@ -129,7 +129,7 @@ export const AiChatbot: React.FC<AiChatbotProps> = ({ isOpen, setIsOpen, onHireL
                 });
             }
         } catch (error) {
-            console.error("Error streaming response from Gemini:", error);
+            console.error("Error streaming response from the assistant:", error);
             setMessages(prev => {
                 const lastMsg = prev[prev.length - 1];
                 if (lastMsg?.sender === 'ai') {
@@ -151,6 +151,7 @@ export const AiChatbot: React.FC<AiChatbotProps> = ({ isOpen, setIsOpen, onHireL
 
     const confirmClearChat = () => {
         localStorage.removeItem(CHAT_HISTORY_KEY);
+        resetConversation();
         setMessages([{ sender: 'ai', text: '👋 Hello! I’m your legal assistant.\nHow can I help you today?' }]);
         setClearConfirmOpen(false);
     };
@@ -0,0 +1,114 @@
+import axios from 'axios';
+import apiClient from '../config/apiClient';
+
+// The legal assistant runs on the backend (POST /ai/chat/), which streams the
+// reply as Server-Sent Events and stores the conversation. axios cannot read a
+// response body while it is still arriving in the browser, so this uses fetch.
+
+const CONVERSATION_KEY = 'cla-ai-conversation-id';
+
+export interface AiCitation {
+    chunk_id: number;
+    document_id: string;
+    case_id: string;
+    document_name: string;
+    chunk_index: number;
+    snippet: string;
+    score: number;
+}
+
+interface ServerEvent {
+    event: string;
+    data: any;
+}
+
+export const resetConversation = () => localStorage.removeItem(CONVERSATION_KEY);
+
+const postChat = (body: object) =>
+    fetch(`${apiClient.defaults.baseURL}/ai/chat/`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            Accept: 'text/event-stream',
+            Authorization: `Bearer ${localStorage.getItem('access_token') || ''}`,
+        },
+        body: JSON.stringify(body),
+    });
+
+const refreshAccessToken = async () => {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) return false;
+    try {
+        const response = await axios.post(`${apiClient.defaults.baseURL}/auth/token/refresh/`, { refresh: refreshToken });
+        localStorage.setItem('access_token', response.data.access);
+        return true;
+    } catch {
+        return false;
+    }
+};
+
+const parseEvent = (raw: string): ServerEvent => {
+    let event = 'message';
+    const data: string[] = [];
+    for (const line of raw.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data.push(line.slice(5).trimStart());
+    }
+    return { event, data: data.length ? JSON.parse(data.join('\n')) : null };
+};
+
+async function* readEvents(body: ReadableStream<Uint8Array>): AsyncGenerator<ServerEvent> {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    try {
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                if (raw.trim()) yield parseEvent(raw);
+            }
+        }
+    } finally {
+        reader.releaseLock();
+    }
+}
+
+/**
+ * Stream the assistant's reply to `prompt`, yielding text as it arrives.
+ * Follow-up questions continue the stored conversation until resetConversation().
+ */
+export async function* streamChatResponse(prompt: string, caseId?: string): AsyncGenerator<string> {
+    const body = {
+        message: prompt,
+        conversation_id: localStorage.getItem(CONVERSATION_KEY) || undefined,
+        case: caseId,
+    };
+    let response = await postChat(body);
+    if (response.status === 401 && await refreshAccessToken()) {
+        response = await postChat(body);
+    }
+    if (response.status === 404 && body.conversation_id) {
+        // The stored conversation was deleted; start a new one.
+        resetConversation();
+        response = await postChat({ ...body, conversation_id: undefined });
+    }
+    if (!response.ok || !response.body) {
+        const detail = await response.json().catch(() => null);
+        throw new Error(detail?.error || detail?.detail || `Assistant request failed (${response.status})`);
+    }
+
+    for await (const { event, data } of readEvents(response.body)) {
+        if (event === 'meta') {
+            localStorage.setItem(CONVERSATION_KEY, data.conversation_id);
+        } else if (event === 'token') {
+            yield data.text;
+        } else if (event === 'error') {
+            throw new Error(data.error);
+        }
+    }
+}
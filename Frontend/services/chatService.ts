@@ -52,7 +52,41 @@ const sendMessage = async (receiverId: string, text: string, caseId?: string, at
     }
 };
 
+export interface UnreadCounts {
+    notifications: number;
+    messages: number;
+}
+
+// Marks every received message in a thread up to `upToMessageId` as read in one request.
+const markThreadAsRead = async (upToMessageId: string, thread: { caseId?: string; peerId?: string }): Promise<UnreadCounts | null> => {
+    try {
+        const payload: any = { up_to: Number(upToMessageId) };
+        if (thread.caseId) payload.case = thread.caseId;
+        if (thread.peerId) payload.peer = thread.peerId;
+
+        const response = await apiClient.post('/chat-messages/mark-read/', payload);
+        return response.data.unread;
+    } catch (error) {
+        console.error('Mark thread as read error:', error);
+        return null;
+    }
+};
+
+const markMessagesAsRead = async (messageIds: string[]): Promise<UnreadCounts | null> => {
+    try {
+        const response = await apiClient.post('/chat-messages/mark-read/', {
+            message_ids: messageIds.map(Number),
+        });
+        return response.data.unread;
+    } catch (error) {
+        console.error('Mark messages as read error:', error);
+        return null;
+    }
+};
+
 export const chatService = {
     getMessages,
     sendMessage,
+    markThreadAsRead,
+    markMessagesAsRead,
 };
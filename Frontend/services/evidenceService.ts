@@ -24,7 +24,52 @@ const getDocuments = async (caseId?: string): Promise<EvidenceDocument[]> => {
   }
 };
 
+const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+
+// Large files go through /evidence-uploads/ so a dropped connection resumes from the last acknowledged byte.
+const uploadDocumentResumable = async (
+  file: File,
+  caseId: string,
+  onProgress?: (uploaded: number, total: number) => void,
+  maxRetries = 5,
+): Promise<EvidenceDocument> => {
+  const session = await apiClient.post('/evidence-uploads/', {
+    case: caseId,
+    file_name: file.name,
+    mime_type: file.type || undefined,
+    total_size: file.size,
+  });
+  const uploadUrl = `/evidence-uploads/${session.data.upload_id}/`;
+  const chunkSize: number = Math.min(session.data.max_chunk_size, 4 * 1024 * 1024);
+  let offset: number = session.data.offset;
+  let failures = 0;
+
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + chunkSize);
+    try {
+      const response = await apiClient.patch(uploadUrl, chunk, {
+        headers: { 'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': String(offset) },
+      });
+      offset = response.data.offset;
+      failures = 0;
+      onProgress?.(offset, file.size);
+    } catch (error: any) {
+      failures += 1;
+      if (failures > maxRetries) throw error;
+      // Ask the server how far it got (a 409 already says so) and continue from there.
+      const current = error?.response?.data?.offset ?? (await apiClient.get(uploadUrl)).data.offset;
+      offset = current;
+    }
+  }
+
+  const response = await apiClient.post(`${uploadUrl}finalize/`);
+  return normalizeEvidence(response.data);
+};
+
 const uploadDocument = async (file: File, caseId: string): Promise<EvidenceDocument> => {
+  if (file.size > RESUMABLE_THRESHOLD) {
+    return uploadDocumentResumable(file, caseId);
+  }
   const formData = new FormData();
   formData.append('file', file);
   formData.append('case', caseId);
@@ -40,5 +85,6 @@ const deleteDocument = async (documentId: string): Promise<void> => {
 export const evidenceService = {
   getDocuments,
   uploadDocument,
+  uploadDocumentResumable,
   deleteDocument,
 };
@@ -69,8 +69,33 @@ const markAllAsRead = async (): Promise<boolean> => {
   }
 };
 
+const markManyAsRead = async (notificationIds: string[]): Promise<boolean> => {
+  try {
+    await apiClient.post('/notifications/mark-read/', {
+      ids: notificationIds.map(Number),
+    });
+    return true;
+  } catch (error) {
+    console.error('Mark notifications as read error:', error);
+    return false;
+  }
+};
+
+// Cheap badge counts; avoids downloading full notification and message lists.
+const getUnreadCounts = async (): Promise<{ notifications: number; messages: number }> => {
+  try {
+    const response = await apiClient.get('/me/unread-counts/');
+    return response.data;
+  } catch (error) {
+    console.error('Get unread counts error:', error);
+    return { notifications: 0, messages: 0 };
+  }
+};
+
 export const notificationService = {
   getUserNotifications,
+  getUnreadCounts,
   markAsRead,
+  markManyAsRead,
   markAllAsRead,
 };